@@ -5,9 +5,10 @@ from . import scripts
 from . import widgets
 from .codex import Codex, Node
 from .scripts.build_assets.lib import build_assets_folder
+from .scripts.build_codex.lib import build_codex_bundle
 from .scripts.new_app.lib import create_new_app
 
 __all__ = [
     'scripts', 'widgets', 'Codex', 'Node', 'build_assets_folder',
-    'create_new_app',
+    'build_codex_bundle', 'create_new_app',
 ]
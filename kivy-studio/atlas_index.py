@@ -0,0 +1,172 @@
+import re
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from kivyhelper import constants
+
+MAGIC = b'KHAI'
+VERSION = 2
+
+HEADER = struct.Struct('<4sHHII')
+# A tag's frame count, followed by the position of each of its frames in
+# the frame table:
+TAG = struct.Struct('<I')
+# A frame's page, rectangle, and trim offset and full size:
+FRAME = struct.Struct('<HIIIIiiII')
+STR_LEN = struct.Struct('<H')
+# The trim offset of frames that weren't trimmed:
+NOT_TRIMMED = (0, 0, 0, 0)
+
+
+def group_frames(frame_names: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Groups the frame names from an atlas by their animation + tag, which
+    is everything before the frame's trailing number. Frames without a
+    number are left out.
+
+    Args:
+        frame_names: The names of the frames in an atlas, in order.
+
+    Returns: A dictionary containing each animation + tag and a list of
+        the frame names in it.
+
+    """
+    results = dict()
+    for f in frame_names:
+        m = re.match(r'(\D+)\d+', f)
+        if m:
+            frame = m.groups()[0]
+            if frame not in results.keys():
+                results[frame] = [f]
+            else:
+                results[frame].append(f)
+    return results
+
+
+def _pack_str(s: str) -> bytes:
+    b = s.encode('utf-8')
+    return STR_LEN.pack(len(b)) + b
+
+
+def write_atlas_index(
+        file_path: (str, Path),
+        atlas: dict,
+        offsets: dict = None) -> None:
+    """
+    Writes a compact binary index of an atlas, with its frames already
+    grouped into tags, so that Sprite can link the atlas without parsing
+    any json or running any regexes.
+
+    The index is laid out as a header (magic, version, page count, tag
+    count, frame count), then the page names, then every frame in the
+    atlas with its name, page, rectangle and trim offset, then each
+    tag's name, frame count and the positions of its frames in the frame
+    table. Strings are prefixed with their length. Frames that weren't
+    trimmed have a full width and height of 0.
+
+    Args:
+        file_path: The path to write the index to.
+        atlas: A kivy atlas dictionary of image names and their frames.
+        offsets: A dictionary of trimmed frames and their offsets, as
+            returned by sheets.read_trim_offsets.
+
+    Returns: None
+
+    """
+    offsets = offsets or dict()
+    pages = list(atlas.keys())
+    ids = dict()
+    out = []
+    for i, (page, frames) in enumerate(atlas.items()):
+        for name, rect in frames.items():
+            ids[name] = len(ids)
+            out.append(_pack_str(name) + FRAME.pack(
+                i, *rect, *offsets.get(name, NOT_TRIMMED)))
+    tags = group_frames(ids.keys())
+    for tag, frames in tags.items():
+        out.append(_pack_str(tag) + TAG.pack(len(frames)) + struct.pack(
+            f'<{len(frames)}I', *(ids[f] for f in frames)))
+    out = [
+        HEADER.pack(MAGIC, VERSION, len(pages), len(tags), len(ids)),
+        *(_pack_str(p) for p in pages),
+        *out,
+    ]
+    with open(file_path, 'wb') as w:
+        w.write(b''.join(out))
+
+
+def read_atlas_index(file_path: (str, Path)) -> dict:
+    """
+    Reads an index written by write_atlas_index.
+
+    Args:
+        file_path: The path to the index.
+
+    Returns: A dictionary with a 'pages' list of image names, a 'rects'
+        dictionary of every frame's name and its page index, x, y, width
+        and height, in the same order as the atlas, an 'offsets'
+        dictionary of each trimmed frame's name and its offset, as
+        sheets.read_trim_offsets returns, and a 'tags' dictionary of
+        each animation + tag and its frame names (the same as
+        group_frames would produce from the atlas).
+
+    """
+    with open(file_path, 'rb') as r:
+        data = r.read()
+    magic, version, n_pages, n_tags, n_frames = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{file_path} is not a version {VERSION} atlas '
+                         f'index.')
+    pos = HEADER.size
+
+    def _str() -> str:
+        nonlocal pos
+        n, = STR_LEN.unpack_from(data, pos)
+        pos += STR_LEN.size + n
+        return data[pos - n:pos].decode('utf-8')
+
+    pages = [_str() for _ in range(n_pages)]
+    names = []
+    rects = dict()
+    offsets = dict()
+    for _ in range(n_frames):
+        name = _str()
+        names.append(name)
+        page, x, y, w, h, *offset = FRAME.unpack_from(data, pos)
+        pos += FRAME.size
+        rects[name] = (page, x, y, w, h)
+        if tuple(offset) != NOT_TRIMMED:
+            offsets[name] = offset
+    tags = dict()
+    for _ in range(n_tags):
+        tag = _str()
+        n, = TAG.unpack_from(data, pos)
+        pos += TAG.size
+        tags[tag] = [names[i] for i in struct.unpack_from(
+            f'<{n}I', data, pos)]
+        pos += n * 4
+    return dict(pages=pages, rects=rects, offsets=offsets, tags=tags)
+
+
+def index_is_current(atlas_path: (str, Path)) -> bool:
+    """
+    Args:
+        atlas_path: The path to an atlas, without the .atlas extension.
+
+    Returns: True if the atlas has an index of the current version that
+        is at least as new as its .atlas file.
+
+    """
+    idx = Path(str(atlas_path) + constants.ATLAS_INDEX_EXT)
+    atlas = Path(str(atlas_path) + '.atlas')
+    if not idx.exists():
+        return False
+    # Indexes written by an older version are left as is by builds that
+    # skip unchanged groups:
+    with open(idx, 'rb') as r:
+        header = r.read(HEADER.size)
+    if len(header) < HEADER.size or HEADER.unpack(header)[:2] != (
+            MAGIC, VERSION):
+        return False
+    return not atlas.exists() or idx.stat().st_mtime >= atlas.stat().st_mtime
@@ -1,13 +1,51 @@
 import abc
+import bisect
+import functools
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from concurrent.futures import (
+    ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+)
+from itertools import chain, islice
 from pathlib import Path
+from typing import Iterable, Iterator
 
 import jsonlines
 
-from kivyhelper import constants
+from kivyhelper import codex_bundle, constants
+
+
+# Bumped whenever the layout of a snapshot file changes:
+SNAPSHOT_VERSION = 1
 
 
 # noinspection PyPropertyDefinition
 class Node(metaclass=abc.ABCMeta):
+    # Bump this in a subclass whenever its process method changes what it
+    # produces, so that snapshots of its old output are not loaded:
+    version = 0
+
+    # The record fields to index when build_indexes is called from
+    # process. Each value of a unique index must belong to one record
+    # only, a multi-value index maps each value to every record that has
+    # it, and a sorted index allows range queries with between:
+    unique_indexes = ()
+    indexes = ()
+    sorted_indexes = ()
+
+    # If True, process is passed an iterator that decodes the node's
+    # records one at a time, instead of a list of them, so that the raw
+    # records never all have to be in memory at once. If batch_size is
+    # set as well, the iterator yields lists of up to that many records:
+    stream = False
+    batch_size = None
+
     # noinspection PyMethodParameters
     @property
     @abc.abstractmethod
@@ -18,18 +56,461 @@ class Node(metaclass=abc.ABCMeta):
     def process(self, data: list):
         return data
 
+    def build_indexes(self, records: Iterable[dict]) -> None:
+        """
+        Builds the indexes declared by unique_indexes, indexes and
+        sorted_indexes over a node's records, for get, where and between
+        to use. Should be called by process, once the records are
+        final. Records without an indexed field are left out of its
+        index.
+
+        Args:
+            records: An iterable of dictionaries, usually the lines of
+                the node's jsonl file.
+
+        Raises: ValueError if two records share a value of a unique
+            index.
+
+        Returns: None
+
+        """
+        self._indexes = dict(
+            unique={f: dict() for f in self.unique_indexes},
+            multi={f: dict() for f in self.indexes},
+            sorted={f: [] for f in self.sorted_indexes},
+        )
+        if not (self.unique_indexes or self.indexes or self.sorted_indexes):
+            return
+        for record in records:
+            self._index_record(record)
+        self._sort_indexes()
+
+    def _index_record(self, record: dict) -> None:
+        for field, index in self._indexes['unique'].items():
+            if field not in record.keys():
+                continue
+            if record[field] in index.keys():
+                raise ValueError(
+                    f'{type(self).__name__}: more than one record has '
+                    f'{field} {record[field]!r}.')
+            index[record[field]] = record
+        for field, index in self._indexes['multi'].items():
+            if field in record.keys():
+                index.setdefault(record[field], []).append(record)
+        for field, index in self._indexes['sorted'].items():
+            if record.get(field) is not None:
+                index.append((record[field], record))
+
+    def _sort_indexes(self) -> None:
+        for field, index in self._indexes['sorted'].items():
+            # Sorted by value only, so records with equal values keep
+            # their order:
+            index.sort(key=lambda x: x[0])
+            self._indexes['sorted'][field] = (
+                [v for v, _ in index], [r for _, r in index])
+
+    def _index(self, kind: str, field: str):
+        if not hasattr(self, '_indexes'):
+            raise KeyError(
+                f'{type(self).__name__} has no indexes, its process method '
+                f'never called build_indexes.')
+        index = self._indexes[kind]
+        if field not in index.keys():
+            raise KeyError(
+                f'{type(self).__name__} has no {kind} index on {field}.')
+        return index[field]
+
+    def get(self, field: str, value, default=None):
+        """
+        Looks up a record by the value of an indexed field, in O(1).
+
+        Args:
+            field: A field in unique_indexes or indexes.
+            value: The value to look up.
+            default: Returned if no record has the value.
+
+        Raises: KeyError if the field isn't indexed.
+
+        Returns: The record with the value, or the first of them for a
+            multi-value index.
+
+        """
+        if field in self.unique_indexes:
+            return self._index('unique', field).get(value, default)
+        records = self._index('multi', field).get(value)
+        return records[0] if records else default
+
+    def where(self, field: str, value) -> list:
+        """
+        Looks up every record with a value of an indexed field, in O(1).
+
+        Args:
+            field: A field in indexes or unique_indexes.
+            value: The value to look up.
+
+        Raises: KeyError if the field isn't indexed.
+
+        Returns: A list of the records with the value, in their original
+            order.
+
+        """
+        if field in self.unique_indexes:
+            record = self._index('unique', field).get(value)
+            return [] if record is None else [record]
+        return list(self._index('multi', field).get(value, []))
+
+    def between(self, field: str, low=None, high=None) -> list:
+        """
+        Looks up every record whose value of a sorted field falls within
+        a range, in O(log n) plus the number of records returned.
+
+        Args:
+            field: A field in sorted_indexes.
+            low: The lowest value to include. If None, the range is open
+                at the bottom.
+            high: The highest value to include. If None, the range is
+                open at the top.
+
+        Raises: KeyError if the field has no sorted index.
+
+        Returns: A list of the records in the range, sorted by the
+            field.
+
+        """
+        values, records = self._index('sorted', field)
+        start = 0 if low is None else bisect.bisect_left(values, low)
+        end = (
+            len(values) if high is None
+            else bisect.bisect_right(values, high)
+        )
+        return records[start:end]
+
 
 class DefaultNode(Node):
     assoc_file = ''
 
+    # If True, records are stored in a RecordTable rather than a list of
+    # dictionaries. Set it in a subclass for large files, along with
+    # stream, so that the table is filled as the file is decoded:
+    columnar = False
+
     def __init__(self):
         self.data = None
 
-    def process(self, data: list):
-        self.data = data
+    def process(self, data: (list, Iterable)):
+        if self.stream and self.batch_size:
+            data = chain.from_iterable(data)
+        if self.columnar:
+            self.data = RecordTable(data)
+        else:
+            # Lists, and the lazily decoded records of a bundle, are kept
+            # as they are:
+            self.data = data if isinstance(data, Sequence) else list(data)
+        self.build_indexes(self.data)
         return self.data
 
 
+class _Missing:
+    def __reduce__(self):
+        # Unpickles as the module's own _MISSING, so snapshots keep it:
+        return '_MISSING'
+
+    def __repr__(self):
+        return '_MISSING'
+
+
+# Marks a field missing from a record in a RecordTable's object columns:
+_MISSING = _Missing()
+
+
+class Row(Mapping):
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table: 'RecordTable', index: int):
+        """
+        A read-only, dictionary-like view of one record in a
+        RecordTable. Created on access, and holds nothing but the table
+        and the record's position in it.
+
+        Args:
+            table: The RecordTable the record is in.
+            index: The record's position in the table.
+        """
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key):
+        column = self._table.columns[key]
+        value = column[self._index]
+        if value is _MISSING:
+            raise KeyError(key)
+        return self._table.kinds[key](value)
+
+    def __iter__(self):
+        for key, column in self._table.columns.items():
+            if column[self._index] is not _MISSING:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'Row({dict(self)!r})'
+
+
+class RecordTable(Sequence):
+    # The array typecodes of numeric columns, and the type each value is
+    # converted back to when read:
+    TYPECODES = {bool: 'b', int: 'q', float: 'd'}
+
+    def __init__(self, records: Iterable[dict] = ()):
+        """
+        A compact, read-only list of records stored by column rather
+        than as dictionaries. Each field becomes one column: a typed
+        array if every record has a bool, int or float value for it,
+        and otherwise a list with every string interned, so that
+        repeated keys and values are only stored once. Indexing or
+        iterating the table returns Row views, which read like the
+        dictionaries they were built from.
+
+        Args:
+            records: An iterable of dictionaries.
+        """
+        values = dict()
+        count = 0
+        for record in records:
+            for key, value in record.items():
+                if key not in values.keys():
+                    values[sys.intern(key)] = [_MISSING] * count
+                values[key].append(
+                    sys.intern(value) if isinstance(value, str) else value)
+            count += 1
+            for column in values.values():
+                if len(column) < count:
+                    column.append(_MISSING)
+        self.columns = dict()
+        self.kinds = dict()
+        for key, column in values.items():
+            kind = self._column_kind(column)
+            self.kinds[key] = kind
+            if kind in self.TYPECODES.keys():
+                column = array(self.TYPECODES[kind], column)
+            self.columns[key] = column
+        self._len = count
+
+    def _column_kind(self, column: list) -> type:
+        kinds = {type(v) for v in column}
+        if len(kinds) == 1:
+            kind = kinds.pop()
+            if kind in (bool, float):
+                return kind
+            if kind == int and all(-(1 << 63) <= v < (1 << 63)
+                                   for v in column):
+                return kind
+        return _identity
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Row(self, i) for i in range(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('RecordTable index out of range')
+        return Row(self, index)
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield Row(self, i)
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, RecordTable)):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            a == b for a, b in zip(self, other))
+
+    def to_list(self) -> list:
+        """
+        Returns: The records as a list of dictionaries.
+
+        """
+        return [dict(r) for r in self]
+
+
+def _identity(value):
+    return value
+
+
+class CodexLoadError(Exception):
+    def __init__(self, errors: dict):
+        """
+        Raised by Codex.from_dir once every file has been attempted, if
+        any of them failed to load or process.
+
+        Args:
+            errors: A dictionary of the path of each file that failed
+                and the exception it raised.
+        """
+        self.errors = errors
+        super(CodexLoadError, self).__init__(
+            f'{len(errors)} file(s) failed to load: ' + '; '.join(
+                f'{Path(p).name}: {type(e).__name__}: {e}'
+                for p, e in errors.items())
+        )
+
+
+class NodeCache:
+    def __init__(self, budget: int):
+        """
+        Tracks the loaded nodes of a lazy Codex, least recently used
+        first, and unloads the coldest of them whenever the total size
+        of the loaded nodes goes over budget.
+
+        A node's size is estimated by the size of the jsonl file it was
+        loaded from, which is cheap to find and proportional to the
+        memory its processed data takes up for most nodes.
+
+        Args:
+            budget: A number of bytes.
+        """
+        self.budget = budget
+        self.size = 0
+        self._proxies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, proxy: 'NodeProxy', size: int) -> None:
+        """
+        Marks a node as the most recently used, and evicts the least
+        recently used nodes until the loaded nodes fit the budget again.
+        The node that was touched is never evicted.
+
+        Args:
+            proxy: The NodeProxy of a node that was just loaded or
+                accessed.
+            size: The node's size.
+
+        Returns: None
+
+        """
+        with self._lock:
+            if id(proxy) in self._proxies.keys():
+                self._proxies.move_to_end(id(proxy))
+                return
+            self._proxies[id(proxy)] = proxy, size
+            self.size += size
+            while self.size > self.budget and len(self._proxies) > 1:
+                _, (cold, cold_size) = self._proxies.popitem(last=False)
+                cold.proxy_unload()
+                self.size -= cold_size
+
+
+class NodeProxy:
+    def __init__(
+            self,
+            file_path: (str, Path),
+            node_cls: type,
+            cache: NodeCache = None,
+            loader=None):
+        """
+        Stands in for a Codex node until one of its attributes is
+        accessed, at which point the node's jsonl file is loaded and
+        processed. Every attribute access after that is passed through
+        to the node. isinstance checks against the node's class succeed
+        without loading it. The proxy's own methods are prefixed with
+        proxy_ so that they don't hide the node's.
+
+        If the node is evicted by cache, it is loaded again on the next
+        access, so any changes made to it since it was loaded are lost.
+
+        Args:
+            file_path: The path to the node's jsonl file.
+            node_cls: The Node class to process the file with.
+            cache: A NodeCache to evict cold nodes with. If None, the
+                node is never unloaded.
+            loader: A function that takes the file path and node_cls and
+                returns the processed node. If None, Codex.load_node
+                will be used.
+        """
+        object.__setattr__(self, '_proxy_path', Path(file_path))
+        object.__setattr__(self, '_proxy_cls', node_cls)
+        object.__setattr__(self, '_proxy_cache', cache)
+        object.__setattr__(self, '_proxy_loader', loader or Codex.load_node)
+        object.__setattr__(self, '_proxy_node', None)
+        object.__setattr__(self, '_proxy_size', 0)
+        object.__setattr__(self, '_proxy_lock', threading.Lock())
+
+    @property
+    def __class__(self):
+        return self._proxy_cls
+
+    @property
+    def proxy_loaded(self) -> bool:
+        """
+        Returns: True if the node is currently loaded.
+
+        """
+        return self._proxy_node is not None
+
+    def proxy_load(self) -> Node:
+        """
+        Loads and processes the node's jsonl file if it isn't loaded.
+
+        Returns: The node.
+
+        """
+        with self._proxy_lock:
+            node = self._proxy_node
+            if node is None:
+                node = self._proxy_loader(self._proxy_path, self._proxy_cls)
+                object.__setattr__(self, '_proxy_node', node)
+                object.__setattr__(
+                    self, '_proxy_size', os.stat(self._proxy_path).st_size)
+        if self._proxy_cache:
+            self._proxy_cache.touch(self, self._proxy_size)
+        return node
+
+    def proxy_unload(self) -> None:
+        """
+        Drops the loaded node, so that it is loaded again on the next
+        access.
+
+        Returns: None
+
+        """
+        with self._proxy_lock:
+            object.__setattr__(self, '_proxy_node', None)
+
+    def __getattr__(self, item):
+        return getattr(self.proxy_load(), item)
+
+    def __setattr__(self, key, value):
+        setattr(self.proxy_load(), key, value)
+
+    def __bool__(self):
+        # Otherwise bool() falls back on __len__, which raises unless
+        # the node's class defines it:
+        return bool(self.proxy_load())
+
+    def __len__(self):
+        return len(self.proxy_load())
+
+    def __iter__(self):
+        return iter(self.proxy_load())
+
+    def __getitem__(self, item):
+        return self.proxy_load()[item]
+
+    def __contains__(self, item):
+        return item in self.proxy_load()
+
+    def __repr__(self):
+        state = 'loaded' if self.proxy_loaded else 'not loaded'
+        return (f'<NodeProxy of {self._proxy_cls.__name__} for '
+                f'{self._proxy_path.name}, {state}>')
+
+
 class Codex:
     def __init__(self):
         """
@@ -44,13 +525,75 @@ class Codex:
         pass
 
     @classmethod
-    def from_dir(cls, dir_path: (str, Path)):
+    def from_bundle(cls, bundle_path: (str, Path)):
+        """
+        Creates a Codex object from a bundle written by the build_codex
+        script. The bundle is memory-mapped, and each Node is passed a
+        read-only list of its records that decodes a record from the
+        bundle only when it is accessed, so nodes that don't touch all
+        of their records at process time cost almost nothing to load.
+
+        Args:
+            bundle_path: The path to a bundle file.
+
+        Returns: A Codex object or child object.
+
+        """
+        if constants.DEBUG:
+            print(f'[DEBUG][KIVYHELPER:Codex:from_bundle]')
+            print(f'[DEBUG] Creating Codex from {bundle_path}...')
+        new_handler = cls()
+        for name, records in codex_bundle.read_bundle(bundle_path).items():
+            node_cls = cls._get_node_by_assoc_file(name)
+            n = node_cls()
+            if constants.DEBUG:
+                print(f'[DEBUG] -- Processing {name} with '
+                      f'{node_cls.__name__} Node object...')
+            n.process(
+                _stream(node_cls, records) if node_cls.stream else records)
+            setattr(new_handler, name, n)
+        if constants.DEBUG:
+            print(f'[DEBUG][KIVYHELPER:Codex:from_bundle][END]')
+        return new_handler
+
+    @classmethod
+    def from_dir(
+            cls,
+            dir_path: (str, Path),
+            lazy: bool = False,
+            budget: int = None,
+            jobs: int = 1,
+            processes: bool = False,
+            snapshot_dir: (str, Path) = None):
         """
         Creates a Codex object from a directory containing jsonl
-        files.
+        files. Files are assigned to attributes in order of their names,
+        however many are loaded at once.
 
         Args:
             dir_path: The path to a directory.
+            lazy: If True, each attribute will be a NodeProxy, and its
+                file won't be loaded and processed until the node is
+                first used.
+            budget: A number of bytes, only used if lazy is True. Once
+                the jsonl files of the loaded nodes add up to more than
+                this, the least recently used nodes are unloaded until
+                they fit again. If None, nodes are never unloaded.
+            jobs: The maximum number of files to load and process at
+                once, if lazy is False. If None, constants.DEFAULT_JOBS
+                will be used.
+            processes: If True, files will be loaded in a pool of
+                processes rather than threads, so that decoding and
+                processing them isn't limited to one core. The Codex
+                and Node classes, and what their process methods
+                return, must then be picklable, which means they must be
+                importable from a module.
+            snapshot_dir: The path to a directory to cache snapshots of
+                each processed node in, see load_node. Will be created
+                if it doesn't exist. If None, nothing is cached.
+
+        Raises: CodexLoadError, once every file has been attempted, if
+            any of them could not be loaded or processed.
 
         Returns: A Codex object or child object.
 
@@ -60,22 +603,228 @@ class Codex:
             print(f'[DEBUG][KIVYHELPER:Codex:from_dir]')
             print(f'[DEBUG] Creating Codex from {dir_path}...')
         new_handler = cls()
-        for file in dir_path.iterdir():
-            p = Path(file)
-            if p.suffix == '.jsonl':
-                if constants.DEBUG:
-                    print(f'[DEBUG] -- Loading {p}...')
-                data = cls._load_jsonlines(p)
-                n = cls._get_node_by_assoc_file(p.stem)()
-                setattr(new_handler, p.stem, n)
-                if constants.DEBUG:
-                    print(f'[DEBUG] -- Processing data with '
-                          f'{n.__name__} Node object...')
-                n.process(data)
+        files = sorted(p for p in dir_path.iterdir() if p.suffix == '.jsonl')
+        node_classes = {
+            p: cls._get_node_by_assoc_file(p.stem) for p in files}
+        if snapshot_dir is not None:
+            Path(snapshot_dir).mkdir(parents=True, exist_ok=True)
+        loader = functools.partial(cls.load_node, snapshot_dir=snapshot_dir)
+        if lazy:
+            cache = NodeCache(budget) if budget is not None else None
+            nodes = {
+                p: NodeProxy(p, node_cls, cache, loader)
+                for p, node_cls in node_classes.items()
+            }
+        else:
+            nodes, errors = cls._load_nodes(
+                node_classes, loader, jobs, processes)
+            if len(errors) > 0:
+                raise CodexLoadError(errors)
+        for p in files:
+            setattr(new_handler, p.stem, nodes[p])
         if constants.DEBUG:
             print(f'[DEBUG][KIVYHELPER:Codex:from_dir][END]')
         return new_handler
 
+    @classmethod
+    def _load_nodes(
+            cls,
+            node_classes: dict,
+            loader,
+            jobs: int = 1,
+            processes: bool = False) -> (dict, dict):
+        """
+        Loads a set of jsonl files, up to jobs at a time.
+
+        Args:
+            node_classes: A dictionary of jsonl file paths and the Node
+                class to process each with.
+            loader: A function that takes a file path and a Node class
+                and returns the processed Node, such as load_node.
+            jobs: The maximum number of files to load at once. If None,
+                constants.DEFAULT_JOBS will be used.
+            processes: If True, a process pool is used instead of a
+                thread pool.
+
+        Returns: A dictionary of each file path and its Node object, and
+            a dictionary of each file path that failed and the exception
+            it raised.
+
+        """
+        jobs = max(1, jobs or constants.DEFAULT_JOBS)
+        nodes = dict()
+        errors = dict()
+        if jobs == 1:
+            for p, node_cls in node_classes.items():
+                try:
+                    nodes[p] = loader(p, node_cls)
+                except Exception as e:
+                    errors[p] = e
+            return nodes, errors
+        pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        with pool(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(loader, p, node_cls): p
+                for p, node_cls in node_classes.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    nodes[futures[future]] = future.result()
+                except Exception as e:
+                    errors[futures[future]] = e
+        return nodes, errors
+
+    @classmethod
+    def load_node(
+            cls,
+            file_path: (str, Path),
+            node_cls: type,
+            snapshot_dir: (str, Path) = None) -> Node:
+        """
+        Loads a jsonl file and processes it with a Node.
+
+        If snapshot_dir is passed, the processed Node is pickled to a
+        snapshot file in it, and later loads of the same file with the
+        same Node class and version unpickle the snapshot instead of
+        decoding and processing the file again. A snapshot is used as is
+        if the file's size and mtime haven't changed, and otherwise only
+        if the file's contents hash the same, as they would after a
+        fresh checkout.
+
+        Args:
+            file_path: The path to a jsonl file.
+            node_cls: The Node class to process the file with. Its
+                objects must be picklable to be snapshotted.
+            snapshot_dir: The path to a directory to keep snapshots in.
+
+        Returns: The Node object.
+
+        """
+        file_path = Path(file_path)
+        snapshot_p = None
+        if snapshot_dir is not None:
+            snapshot_p = Path(snapshot_dir).joinpath(
+                file_path.stem + constants.SNAPSHOT_EXT)
+            n = cls._read_snapshot(snapshot_p, file_path, node_cls)
+            if n is not None:
+                return n
+            # Keyed before decoding, so that a change made to the file
+            # while it is decoded invalidates the snapshot:
+            key = cls._snapshot_key(file_path, node_cls)
+        if constants.DEBUG:
+            print(f'[DEBUG] -- Loading {file_path}...')
+        if node_cls.stream:
+            data = _stream(node_cls, cls._iter_jsonlines(file_path))
+        else:
+            data = cls._load_jsonlines(file_path)
+        n = node_cls()
+        if constants.DEBUG:
+            print(f'[DEBUG] -- Processing data with '
+                  f'{node_cls.__name__} Node object...')
+        n.process(data)
+        if snapshot_p is not None:
+            cls._write_snapshot(snapshot_p, key, n)
+        return n
+
+    @staticmethod
+    def _snapshot_key(
+            file_path: Path,
+            node_cls: type,
+            digest: str = None) -> dict:
+        """
+        Args:
+            file_path: The path to a jsonl file.
+            node_cls: The Node class the file is processed with.
+            digest: The file's sha1 hex digest. If None, the file will
+                be read and hashed.
+
+        Returns: A dictionary identifying the file's contents and how it
+            is processed, which a snapshot must match to be used.
+
+        """
+        stat = os.stat(file_path)
+        if digest is None:
+            h = hashlib.sha1()
+            with open(file_path, 'rb') as r:
+                for chunk in iter(lambda: r.read(1 << 16), b''):
+                    h.update(chunk)
+            digest = h.hexdigest()
+        return dict(
+            format=SNAPSHOT_VERSION,
+            node=f'{node_cls.__module__}.{node_cls.__qualname__}',
+            version=node_cls.version,
+            size=stat.st_size,
+            mtime=stat.st_mtime_ns,
+            sha1=digest,
+        )
+
+    @classmethod
+    def _read_snapshot(
+            cls,
+            snapshot_p: Path,
+            file_path: Path,
+            node_cls: type) -> (Node, None):
+        """
+        Args:
+            snapshot_p: The path to a snapshot file.
+            file_path: The path to the jsonl file it was written from.
+            node_cls: The Node class the file is processed with.
+
+        Returns: The snapshotted Node object, or None if there is no
+            snapshot or it doesn't match the file and Node class. A
+            snapshot that only matches the file's contents is written
+            again with the file's current mtime, so that the file isn't
+            hashed on every load.
+
+        """
+        current = None
+        try:
+            with open(snapshot_p, 'rb') as r:
+                # The key is pickled separately from the node, so a stale
+                # node is never unpickled:
+                key = pickle.load(r)
+                if key != cls._snapshot_key(file_path, node_cls, key['sha1']):
+                    # The file was touched, by a checkout for example, so
+                    # only its contents can tell whether it changed:
+                    current = cls._snapshot_key(file_path, node_cls)
+                    key['mtime'] = current['mtime']
+                    if key != current:
+                        return None
+                n = pickle.load(r)
+        except (OSError, EOFError, KeyError, TypeError,
+                pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        if current is not None:
+            cls._write_snapshot(snapshot_p, current, n)
+        if constants.DEBUG:
+            print(f'[DEBUG] -- Loaded {file_path} from its snapshot.')
+        return n
+
+    @staticmethod
+    def _write_snapshot(snapshot_p: Path, key: dict, n: Node) -> None:
+        """
+        Pickles a processed Node to a snapshot file, along with the key
+        it is valid for. Nodes that can't be pickled are skipped.
+
+        Args:
+            snapshot_p: The path to write the snapshot to.
+            key: The key of the jsonl file the node was loaded from.
+            n: The processed Node object.
+
+        Returns: None
+
+        """
+        tmp_p = snapshot_p.with_name(
+            f'{snapshot_p.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            with open(tmp_p, 'wb') as w:
+                pickle.dump(key, w)
+                pickle.dump(n, w, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_p, snapshot_p)
+        except (OSError, pickle.PicklingError, AttributeError, TypeError):
+            if tmp_p.exists():
+                tmp_p.unlink()
+
     @staticmethod
     def _get_node_by_assoc_file(assoc_file: str):
         """
@@ -88,11 +837,15 @@ class Codex:
             match.
 
         """
-        for n in Node.__subclasses__():
+        # Subclasses of subclasses, such as columnar DefaultNodes, are
+        # matched too:
+        subclasses = Node.__subclasses__()
+        while len(subclasses) > 0:
+            n = subclasses.pop(0)
             if n.assoc_file == assoc_file:
                 return n
-        else:
-            return DefaultNode
+            subclasses += n.__subclasses__()
+        return DefaultNode
 
     @staticmethod
     def _load_jsonlines(file_path: (str, Path)) -> list:
@@ -110,3 +863,34 @@ class Codex:
             for line in r:
                 results.append(line)
         return results
+
+    @staticmethod
+    def _iter_jsonlines(file_path: (str, Path)) -> Iterator[dict]:
+        """
+        Decodes a jsonlines file one line at a time.
+
+        Args:
+            file_path: The path to a .jsonl or .jsonlines file.
+
+        Yields: A dictionary for each line in the file.
+
+        """
+        with jsonlines.open(file_path) as r:
+            for line in r:
+                yield line
+
+
+def _stream(node_cls: type, records: Iterable) -> Iterator:
+    """
+    Args:
+        node_cls: A Node class with stream set.
+        records: An iterable of the node's records.
+
+    Returns: An iterator over the records, or over lists of them if the
+        Node class has a batch_size.
+
+    """
+    it = iter(records)
+    if not node_cls.batch_size:
+        return it
+    return iter(lambda: list(islice(it, node_cls.batch_size)), [])
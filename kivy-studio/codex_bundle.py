@@ -0,0 +1,128 @@
+import json
+import mmap
+import os
+import struct
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Dict, Iterable
+
+MAGIC = b'KHCB'
+VERSION = 1
+
+# Magic, version, the number of nodes, and the position of the node
+# table:
+HEADER = struct.Struct('<4sHxxIQ')
+# For each node in the node table: the length of its name, its number
+# of records and the position of its record offsets, followed by the
+# name itself:
+NODE = struct.Struct('<HQQ')
+OFFSET = struct.Struct('<Q')
+
+
+def write_bundle(
+        nodes: Dict[str, Iterable[dict]],
+        bundle_path: (str, Path)) -> int:
+    """
+    Packs the records of a set of Codex nodes into a single bundle file.
+
+    The file is laid out as a header, then each node's records as
+    compact json, one after another, each node's followed by the
+    position of every one of its records (plus the end of the last
+    one), and finally the node table, so that a reader can find and
+    decode any single record without touching the others.
+
+    Args:
+        nodes: A dictionary of node names and an iterable of their
+            records, which will only be iterated over once.
+        bundle_path: The path to write the bundle to.
+
+    Returns: The number of records written.
+
+    """
+    bundle_path = Path(bundle_path)
+    tmp_p = Path(str(bundle_path) + '.tmp')
+    table = []
+    total = 0
+    with open(tmp_p, 'wb') as w:
+        w.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        for name, records in nodes.items():
+            offsets = [w.tell()]
+            for record in records:
+                w.write(json.dumps(
+                    record, separators=(',', ':'), ensure_ascii=False
+                ).encode('utf-8'))
+                offsets.append(w.tell())
+            table.append((name.encode('utf-8'), len(offsets) - 1, w.tell()))
+            for o in offsets:
+                w.write(OFFSET.pack(o))
+            total += len(offsets) - 1
+        table_pos = w.tell()
+        for name, count, offsets_pos in table:
+            w.write(NODE.pack(len(name), count, offsets_pos))
+            w.write(name)
+        w.seek(0)
+        w.write(HEADER.pack(MAGIC, VERSION, len(table), table_pos))
+    os.replace(tmp_p, bundle_path)
+    return total
+
+
+class BundleRecords(Sequence):
+    def __init__(self, mm: mmap.mmap, count: int, offsets_pos: int):
+        """
+        A read-only list of one node's records in a memory-mapped
+        bundle. Each record is decoded from the bundle whenever it is
+        accessed, and nothing is kept.
+
+        Args:
+            mm: The memory-mapped bundle.
+            count: The number of records the node has.
+            offsets_pos: The position of the node's record offsets.
+        """
+        self._mm = mm
+        self._count = count
+        self._offsets_pos = offsets_pos
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('BundleRecords index out of range')
+        start, end = struct.unpack_from(
+            '<QQ', self._mm, self._offsets_pos + index * OFFSET.size)
+        return json.loads(self._mm[start:end].decode('utf-8'))
+
+
+def read_bundle(bundle_path: (str, Path)) -> Dict[str, BundleRecords]:
+    """
+    Memory-maps a bundle written by write_bundle.
+
+    Args:
+        bundle_path: The path to a bundle file.
+
+    Raises: ValueError if the file isn't a bundle of this version.
+
+    Returns: A dictionary of each node's name and its records, in the
+        order they were written.
+
+    """
+    with open(bundle_path, 'rb') as r:
+        mm = mmap.mmap(r.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mm) < HEADER.size:
+        raise ValueError(f'{bundle_path} is not a Codex bundle.')
+    magic, version, count, pos = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(
+            f'{bundle_path} is not a version {VERSION} Codex bundle.')
+    result = dict()
+    for _ in range(count):
+        name_len, records, offsets_pos = NODE.unpack_from(mm, pos)
+        pos += NODE.size
+        name = mm[pos:pos + name_len].decode('utf-8')
+        pos += name_len
+        result[name] = BundleRecords(mm, records, offsets_pos)
+    return result
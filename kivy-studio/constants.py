@@ -1,3 +1,4 @@
+import os
 
 ASE_EXTS = ('.ase', '.aseprite')
 
@@ -8,3 +9,41 @@ IDLE = r'(^|_)idle_'
 DEBUG = False
 
 OPEN_GL_LIMIT = 16348
+
+DEFAULT_JOBS = os.cpu_count() or 1
+
+INNER_PADDING = 2
+
+BUILD_MANIFEST = 'build_manifest.json'
+
+SCAN_CACHE = 'scan_cache.json'
+
+SHARED_PAGES = 'shared_pages.json'
+
+SHARED_PAGE = '__shared'
+
+ASEPRITE = 'aseprite'
+
+BACKENDS = ('aseprite', 'python')
+
+ATLAS_INDEX_EXT = '.atlasidx'
+
+RAW_TEXTURE_EXT = '.rgba'
+
+STORE_ENTRY = 'entry.json'
+
+SNAPSHOT_EXT = '.snapshot'
+
+CODEX_BUNDLE = 'codex.bundle'
+
+# The default size, in bytes, an artifact store is evicted down to:
+STORE_BUDGET = 2 << 30
+
+# If True, Sprite writes a raw texture file for any atlas page that
+# doesn't have a current one the first time it loads the page:
+WRITE_RAW_TEXTURES = False
+
+# The resolution of the atlas variants Sprite should load, as a fraction
+# of full resolution. Lower it before creating any Sprites on devices
+# with little texture memory:
+ASSET_SCALE = 1.0
@@ -1,4 +1,7 @@
 import json
+import re
+from contextlib import nullcontext
+from pathlib import Path
 
 
 def enquote(x) -> str:
@@ -15,6 +18,52 @@ def enquote(x) -> str:
     return '"' + str(x) + '"'
 
 
+def variant_name(name: str, scale: float) -> str:
+    """
+    Names the downscaled variant of an asset file.
+
+    Args:
+        name: A file name or path, such as 'sprites_ball.png' or
+            'assets/sprites_ball'.
+        scale: The variant's resolution as a fraction of the original's.
+
+    Returns: The name with the scale added before its extension, such as
+        'sprites_ball@0.5x.png', or name unchanged if scale is 1.
+
+    """
+    if scale == 1:
+        return str(name)
+    p = Path(name)
+    if p.suffix in ('.png', '.atlas', '.trim', '.json'):
+        return str(p.with_name(f'{p.stem}@{scale:g}x{p.suffix}'))
+    return f'{name}@{scale:g}x'
+
+
+def find_variant(atlas_path: str, scale: float) -> (str, float):
+    """
+    Picks the variant of an atlas to load for a target scale: the
+    smallest variant that is at least as large as the target, or the
+    full resolution atlas if there is none.
+
+    Args:
+        atlas_path: The path to an atlas, without the .atlas extension.
+        scale: The target resolution, as a fraction of full resolution.
+
+    Returns: A tuple of the chosen variant's path, without the .atlas
+        extension, and its scale.
+
+    """
+    p = Path(atlas_path)
+    best = 1.0
+    if scale < 1 and p.parent.exists():
+        pat = re.compile(re.escape(p.name) + r'@([\d.]+)x\.atlas$')
+        for f in p.parent.glob(f'{p.name}@*x.atlas'):
+            m = pat.match(f.name)
+            if m and scale <= float(m.group(1)) < best:
+                best = float(m.group(1))
+    return variant_name(atlas_path, best), best
+
+
 def print_pycharm_bar():
     print('=' * 96)
 
@@ -31,8 +80,110 @@ def read_aseprite_json(file_path: str) -> dict:
     Returns: A dictionary containing the aseprite json file's data.
 
     """
-    json_str = ''
     with open(file_path, 'r') as r:
-        for line in r:
-            json_str += line.strip()
-    return json.loads(json_str)
+        return json.load(r)
+
+
+def iter_aseprite_json(file_path, chunk_size: int = 1 << 16):
+    """
+    Reads an aseprite json file incrementally, so that memory use stays
+    flat no matter how many frames the spritesheet has. Only the current
+    frame record and a chunk of the file are held at any one time.
+
+    Args:
+        file_path: The path to the json file to read, or a text file
+            object to read it from, such as the stdout of an aseprite
+            process. File objects are left open.
+        chunk_size: The number of characters to read from the file at a
+            time.
+
+    Yields: A tuple for each top-level section of the file. Each frame
+        in the frames section is yielded on its own as ('frames',
+        frame name, frame dict), every other section is yielded whole as
+        (section name, None, section value).
+
+    """
+    decoder = json.JSONDecoder()
+    ws = ' \t\n\r'
+    if hasattr(file_path, 'read'):
+        opened = nullcontext(file_path)
+        file_path = getattr(file_path, 'name', 'stream')
+    else:
+        opened = open(file_path, 'r')
+    with opened as r:
+        buf = ''
+        pos = 0
+        eof = False
+
+        def _fill() -> bool:
+            nonlocal buf, pos, eof
+            chunk = r.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buf = buf[pos:] + chunk
+            pos = 0
+            return True
+
+        def _next_char() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in ws:
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                if not _fill():
+                    raise ValueError(f'Unexpected end of file in {file_path}')
+
+        def _expect(chars: str) -> str:
+            nonlocal pos
+            c = _next_char()
+            if c not in chars:
+                raise ValueError(
+                    f'Expected one of {chars!r} at {c!r} in {file_path}')
+            pos += 1
+            return c
+
+        def _value():
+            nonlocal pos
+            _next_char()
+            while True:
+                try:
+                    v, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if not _fill():
+                        raise
+                    continue
+                # A number at the very end of the buffer may continue in
+                # the next chunk:
+                if end == len(buf) and not eof and _fill():
+                    continue
+                pos = end
+                return v
+
+        _expect('{')
+        if _next_char() == '}':
+            return
+        while True:
+            section = _value()
+            _expect(':')
+            if section == 'frames' and _next_char() in '{[':
+                close = '}' if _expect('{[') == '{' else ']'
+                if _next_char() == close:
+                    pos += 1
+                else:
+                    while True:
+                        if close == '}':
+                            name = _value()
+                            _expect(':')
+                            frame = _value()
+                        else:
+                            frame = _value()
+                            name = frame['filename']
+                        yield section, name, frame
+                        if _expect(',' + close) == close:
+                            break
+            else:
+                yield section, None, _value()
+            if _expect(',}') == '}':
+                return
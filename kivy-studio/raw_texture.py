@@ -0,0 +1,112 @@
+import mmap
+import os
+import struct
+from pathlib import Path
+
+from PIL import Image
+
+from kivyhelper import constants
+
+MAGIC = b'KHRT'
+VERSION = 1
+
+# Magic, version, width, height, and the size and mtime of the png the
+# pixels were decoded from:
+HEADER = struct.Struct('<4sHxxIIQQ')
+
+
+def raw_path(png_path: (str, Path)) -> Path:
+    """
+    Args:
+        png_path: The path to a png file.
+
+    Returns: The path to the png's raw texture file.
+
+    """
+    return Path(str(png_path) + constants.RAW_TEXTURE_EXT)
+
+
+def write_raw_texture(png_path: (str, Path)) -> Path:
+    """
+    Decodes a png and writes its pixels, uncompressed, to a raw texture
+    file next to it, so that they can be memory-mapped and uploaded to
+    the GPU without decoding the png again.
+
+    The file is laid out as a header (magic, version, width, height, and
+    the png's size and mtime, so that a changed png can be detected),
+    then the pixels as RGBA bytes, top row first.
+
+    Args:
+        png_path: The path to a png file.
+
+    Returns: The path to the raw texture file.
+
+    """
+    stat = os.stat(png_path)
+    with Image.open(png_path) as img:
+        img = img.convert('RGBA')
+        header = HEADER.pack(
+            MAGIC, VERSION, img.width, img.height,
+            stat.st_size, stat.st_mtime_ns
+        )
+        p = raw_path(png_path)
+        tmp_p = Path(str(p) + '.tmp')
+        with open(tmp_p, 'wb') as w:
+            w.write(header)
+            w.write(img.tobytes())
+    os.replace(tmp_p, p)
+    return p
+
+
+def _read_header(r, png_path: (str, Path)) -> (tuple, None):
+    header = r.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    magic, version, w, h, size, mtime = HEADER.unpack(header)
+    stat = os.stat(png_path)
+    if (magic != MAGIC or version != VERSION or size != stat.st_size
+            or mtime != stat.st_mtime_ns
+            or os.fstat(r.fileno()).st_size != HEADER.size + w * h * 4):
+        return None
+    return w, h
+
+
+def raw_texture_is_current(png_path: (str, Path)) -> bool:
+    """
+    Args:
+        png_path: The path to a png file.
+
+    Returns: True if the png has a raw texture file that was written
+        from the png as it is now.
+
+    """
+    try:
+        with open(raw_path(png_path), 'rb') as r:
+            return _read_header(r, png_path) is not None
+    except OSError:
+        return False
+
+
+def read_raw_texture(png_path: (str, Path)) -> (tuple, None):
+    """
+    Memory-maps the raw texture file written for a png.
+
+    Args:
+        png_path: The path to a png file.
+
+    Returns: A tuple of the texture's width, height, and a memoryview of
+        its RGBA bytes, top row first. None if the png has no raw texture
+        file, or if the png has changed since it was written.
+
+    """
+    try:
+        with open(raw_path(png_path), 'rb') as r:
+            size = _read_header(r, png_path)
+            if size is None:
+                return None
+            # Copy-on-write, so the buffer is writable for consumers
+            # that require it, without copying the file:
+            mm = mmap.mmap(r.fileno(), 0, access=mmap.ACCESS_COPY)
+    except OSError:
+        return None
+    return (*size, memoryview(mm)[HEADER.size:])
@@ -1,4 +1,6 @@
+from . import bench_assets
 from . import build_assets
+from . import build_codex
 from . import new_app
 
-__all__ = ['build_assets', 'new_app']
+__all__ = ['bench_assets', 'build_assets', 'build_codex', 'new_app']
@@ -0,0 +1,134 @@
+import argparse
+import json
+import sys
+import tempfile
+
+from kivyhelper.scripts.bench_assets.lib import (
+    compare_results, format_results, run_benchmarks
+)
+
+
+def assemble_args():
+    """
+    Collects the necessary args for the bench_assets script.
+
+    Returns: The collected args Namespace.
+
+    """
+    parser = argparse.ArgumentParser(
+        "Benchmark the build_assets pipeline against a synthetic input "
+        "tree, using a stand-in for the aseprite executable."
+    )
+
+    parser.add_argument(
+        '--work_dir',
+        '-d',
+        help='The directory to generate inputs and build assets in. If '
+             'None, a temporary directory will be used and removed '
+             'afterwards.'
+    )
+
+    parser.add_argument(
+        '--groups',
+        type=int,
+        default=2000,
+        help='The number of sprite groups to generate.'
+    )
+
+    parser.add_argument(
+        '--files',
+        type=int,
+        default=3,
+        help='The number of sprite files in each group.'
+    )
+
+    parser.add_argument(
+        '--tags',
+        type=int,
+        default=2,
+        help='The number of tags in each sprite.'
+    )
+
+    parser.add_argument(
+        '--frames',
+        type=int,
+        default=4,
+        help='The number of frames in each tag.'
+    )
+
+    parser.add_argument(
+        '--size',
+        type=int,
+        default=32,
+        help='The width and height of each frame.'
+    )
+
+    parser.add_argument(
+        '--jobs',
+        '-j',
+        type=int,
+        help='The maximum number of stand-in exports to run at once.'
+    )
+
+    parser.add_argument(
+        '--no_memory',
+        action='store_true',
+        help='Skip measuring peak memory, which runs each stage a second '
+             'time under tracemalloc.'
+    )
+
+    parser.add_argument(
+        '--output',
+        '-o',
+        help='A path to write the results to as json.'
+    )
+
+    parser.add_argument(
+        '--baseline',
+        help='A path to the json results of a previous run. Any stage '
+             'slower or hungrier than its baseline by more than '
+             '--tolerance is reported, and the script exits with 1.'
+    )
+
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.2,
+        help='How much worse than its baseline a stage may be, as a '
+             'fraction. Default is 0.2.'
+    )
+
+    return parser.parse_args()
+
+
+def run(args) -> int:
+    kwargs = dict(
+        groups=args.groups,
+        files=args.files,
+        tags=args.tags,
+        frames=args.frames,
+        size=args.size,
+        jobs=args.jobs,
+        memory=not args.no_memory,
+    )
+    if args.work_dir:
+        results = run_benchmarks(args.work_dir, **kwargs)
+    else:
+        with tempfile.TemporaryDirectory() as td:
+            results = run_benchmarks(td, **kwargs)
+    print(format_results(results))
+    if args.output:
+        with open(args.output, 'w') as w:
+            w.write(json.dumps(results, indent=1))
+    if args.baseline:
+        with open(args.baseline, 'r') as r:
+            regressions = compare_results(
+                results, json.load(r), args.tolerance)
+        for reg in regressions:
+            print(f'-- Regression: {reg}')
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+
+sys.exit(run(assemble_args()))
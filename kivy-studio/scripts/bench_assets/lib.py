@@ -0,0 +1,276 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from kivyhelper import constants, lib
+from kivyhelper.scripts.bench_assets import stand_in
+from kivyhelper.scripts.build_assets import lib as build
+
+STAND_IN_CLI = (
+    f'{lib.enquote(sys.executable)} {lib.enquote(stand_in.__file__)}')
+
+
+def write_synthetic_tree(
+        root: (str, Path),
+        groups: int,
+        files: int,
+        tags: int,
+        frames: int,
+        size: int = 32,
+        groups_per_dir: int = 100) -> int:
+    """
+    Populates a directory with synthetic sprite groups, laid out the way
+    an artist's aseprite folder would be. Each sprite file is a small
+    json description (dimensions and tags) that stand_in reads in place
+    of a real aseprite file.
+
+    Args:
+        root: The directory to populate. Will be created if it doesn't
+            exist.
+        groups: The number of sprite groups (folders of sprites).
+        files: The number of sprite files in each group.
+        tags: The number of tags in each sprite.
+        frames: The number of frames in each tag.
+        size: The width and height of each frame.
+        groups_per_dir: Groups are nested in folders of this many groups
+            each, so that the tree is more than one level deep.
+
+    Returns: The total number of frames in the tree.
+
+    """
+    root = Path(root)
+    for g in range(groups):
+        d = root.joinpath(f'set{g // groups_per_dir}', f'group{g}')
+        d.mkdir(parents=True, exist_ok=True)
+        for f in range(files):
+            sprite = dict(
+                w=size,
+                h=size,
+                tags={f'tag{t}': frames for t in range(tags)}
+            )
+            with open(d.joinpath(f'sprite{f}.aseprite'), 'w') as w:
+                w.write(json.dumps(sprite))
+    return groups * files * tags * frames
+
+
+def synthetic_aseprite_json(frames: int, size: int = 32) -> dict:
+    """
+    Builds an aseprite json dictionary describing a single spritesheet
+    with a large number of frames.
+
+    Args:
+        frames: The number of frames in the spritesheet.
+        size: The width and height of each frame.
+
+    Returns: An aseprite json dictionary.
+
+    """
+    tags = {f'tag{t}': 10 for t in range(frames // 10)}
+    if frames % 10:
+        tags[f'tag{frames // 10}'] = frames % 10
+    j_frames = dict()
+    cols = max(1, int(frames ** 0.5))
+    i = 0
+    for tag, count in tags.items():
+        for n in range(count):
+            j_frames[f'bench_{tag}_{n}'] = dict(
+                frame=dict(
+                    x=(i % cols) * size,
+                    y=(i // cols) * size,
+                    w=size,
+                    h=size
+                ),
+                rotated=False,
+                trimmed=False,
+                spriteSourceSize=dict(x=0, y=0, w=size, h=size),
+                sourceSize=dict(w=size, h=size),
+                duration=100
+            )
+            i += 1
+    return dict(
+        frames=j_frames,
+        meta=dict(
+            app='kivyhelper bench',
+            version='1.0',
+            image='bench.png',
+            format='RGBA8888',
+            size=dict(w=cols * size, h=-(-frames // cols) * size),
+            scale='1',
+        )
+    )
+
+
+def measure(stage: str, items: int, func, memory: bool = True) -> dict:
+    """
+    Times a function and, optionally, measures its peak python memory
+    use. Since tracemalloc slows everything it traces down, the function
+    is run once untraced for timing and then again traced for memory,
+    so it must be safe to call twice.
+
+    Args:
+        stage: The name of the stage being measured.
+        items: The number of items (files, frames) the stage processes,
+            used to calculate its throughput.
+        func: A function that takes no arguments.
+        memory: If False, peak memory will not be measured and func will
+            only be called once.
+
+    Returns: A dictionary containing the stage, items, seconds, items
+        per second, and peak bytes allocated (None if memory is False).
+
+    """
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return dict(
+        stage=stage,
+        items=items,
+        seconds=seconds,
+        per_second=items / seconds if seconds else None,
+        peak_bytes=peak,
+    )
+
+
+def run_benchmarks(
+        work_dir: (str, Path),
+        groups: int = 2000,
+        files: int = 3,
+        tags: int = 2,
+        frames: int = 4,
+        size: int = 32,
+        jobs: int = None,
+        memory: bool = True) -> list:
+    """
+    Generates a synthetic input tree and aseprite json in work_dir and
+    measures each stage of the asset build against them, using stand_in
+    in place of the aseprite executable. The assets folder is built in
+    work_dir as well.
+
+    Args:
+        work_dir: The directory to generate inputs and build assets in.
+        groups: The number of sprite groups to generate.
+        files: The number of sprite files in each group.
+        tags: The number of tags in each sprite.
+        frames: The number of frames in each tag.
+        size: The width and height of each frame.
+        jobs: The number of stand-in exports to run at once, see
+            build_assets.lib.export_groups.
+        memory: If False, peak memory will not be measured.
+
+    Returns: A list of dictionaries, the results of each stage, as
+        returned by measure.
+
+    """
+    work_dir = Path(work_dir)
+    input_dir = work_dir.joinpath('input')
+    print(f'-- Generating {groups} synthetic sprite groups in '
+          f'{input_dir}...')
+    total_frames = write_synthetic_tree(
+        input_dir, groups, files, tags, frames, size)
+    json_p = work_dir.joinpath('bench.json')
+    with open(json_p, 'w') as w:
+        w.write(json.dumps(synthetic_aseprite_json(total_frames, size)))
+    print(f'-- Generated {groups * files} sprite files with '
+          f'{total_frames} frames.')
+
+    def _build(force: bool):
+        def _f():
+            with open(os.devnull, 'w') as null, redirect_stdout(null):
+                build.build_assets_folder(
+                    input_dir, work_dir, jobs=jobs, force=force)
+        return _f
+
+    stages = [
+        ('collect_files', groups * files, lambda: build.collect_files(
+            input_dir, ext=constants.ASE_EXTS)),
+        ('read_aseprite_json', total_frames,
+         lambda: lib.read_aseprite_json(json_p)),
+        ('convert_ase_json_to_atlas', total_frames,
+         lambda: build.convert_ase_json_to_atlas(
+             lib.read_aseprite_json(json_p))),
+        ('build_assets_folder', total_frames, _build(True)),
+        ('build_assets_folder (no changes)', total_frames, _build(False)),
+    ]
+    cli = constants.ASEPRITE
+    constants.ASEPRITE = STAND_IN_CLI
+    results = []
+    try:
+        for stage, items, func in stages:
+            print(f'   > Measuring {stage}...')
+            results.append(measure(stage, items, func, memory))
+    finally:
+        constants.ASEPRITE = cli
+    return results
+
+
+def format_results(results: list) -> str:
+    """
+    Formats benchmark results as a plain text table.
+
+    Args:
+        results: A list of dictionaries, as returned by run_benchmarks.
+
+    Returns: A string, the table.
+
+    """
+    lines = [
+        f'{"stage":<36}{"items":>9}{"seconds":>10}{"items/s":>12}'
+        f'{"peak MiB":>10}'
+    ]
+    for r in results:
+        per_second = f'{r["per_second"]:.0f}' if r['per_second'] else '-'
+        peak = (
+            f'{r["peak_bytes"] / (1 << 20):.1f}'
+            if r['peak_bytes'] is not None else '-'
+        )
+        lines.append(
+            f'{r["stage"]:<36}{r["items"]:>9}{r["seconds"]:>10.3f}'
+            f'{per_second:>12}{peak:>10}'
+        )
+    return '\n'.join(lines)
+
+
+def compare_results(
+        results: list,
+        baseline: list,
+        tolerance: float = 0.2) -> list:
+    """
+    Compares benchmark results to a previous run's.
+
+    Args:
+        results: A list of dictionaries, as returned by run_benchmarks.
+        baseline: The results of a previous run, in the same format.
+        tolerance: How much slower (or hungrier) a stage may be than its
+            baseline before it counts as a regression, as a fraction of
+            the baseline.
+
+    Returns: A list of strings describing each regression.
+
+    """
+    base = {b['stage']: b for b in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(r['stage'])
+        if not b:
+            continue
+        for k, label in (('seconds', 'seconds'), ('peak_bytes', 'bytes')):
+            if r[k] is None or not b[k]:
+                continue
+            if r[k] > b[k] * (1 + tolerance):
+                regressions.append(
+                    f'{r["stage"]}: {r[k]:.3f} {label}, up from '
+                    f'{b[k]:.3f} ({r[k] / b[k] - 1:+.0%})'
+                )
+    return regressions
@@ -0,0 +1,176 @@
+"""
+A stand-in for the aseprite executable, for benchmarking the asset
+build without an aseprite install. It accepts the same command line
+that build_assets.lib.assemble_aseprite_cli produces, but instead of
+real aseprite files it reads the synthetic sprite descriptions written
+by bench_assets.lib.write_synthetic_tree, and writes a blank
+spritesheet and an aseprite-style json laid out the way aseprite's
+--sheet-pack would lay them out for frames of equal size.
+
+Only depends on the standard library and Pillow, so that it can be
+executed directly as a script.
+"""
+import json
+import math
+import os
+import sys
+
+from PIL import Image
+
+
+def parse_args(args: list) -> dict:
+    """
+    Parses the subset of the aseprite CLI that assemble_aseprite_cli
+    uses.
+
+    Args:
+        args: A list of command line arguments.
+
+    Returns: A dictionary containing the input files, the sheet and data
+        paths, the filename format, and the inner padding.
+
+    """
+    result = dict(
+        files=[],
+        sheet=None,
+        data=None,
+        filename_format='{title}_{tag}_{tagframe}',
+        inner_padding=0,
+    )
+    valued = {
+        '--sheet': 'sheet',
+        '--data': 'data',
+        '--filename-format': 'filename_format',
+        '--inner-padding': 'inner_padding',
+        '--ignore-layer': None,
+    }
+    i = 0
+    while i < len(args):
+        a = args[i]
+        if a in valued.keys():
+            if valued[a]:
+                result[valued[a]] = args[i + 1]
+            i += 2
+        else:
+            if not a.startswith('-'):
+                result['files'].append(a)
+            i += 1
+    result['inner_padding'] = int(result['inner_padding'])
+    return result
+
+
+def frame_name(
+        filename_format: str,
+        title: str,
+        tag: str,
+        tagframe: int,
+        frame: int) -> str:
+    """
+    Fills in an aseprite filename format.
+
+    Args:
+        filename_format: An aseprite filename format string.
+        title: The name of the sprite's file, without its extension.
+        tag: The name of the frame's tag.
+        tagframe: The frame's number within its tag.
+        frame: The frame's number within its sprite.
+
+    Returns: The frame's name.
+
+    """
+    return (
+        filename_format
+        .replace('{title}', title)
+        .replace('{tag}', tag)
+        .replace('{tagframe}', str(tagframe))
+        .replace('{frame}', str(frame))
+    )
+
+
+def export(args: dict) -> dict:
+    """
+    Lays out every frame of the synthetic sprites in args['files'] in a
+    square-ish grid and writes the spritesheet.
+
+    Args:
+        args: A dictionary, as returned by parse_args.
+
+    Returns: The aseprite json dictionary describing the spritesheet.
+
+    """
+    pad = args['inner_padding']
+    frames = []
+    tags = []
+    for f in args['files']:
+        with open(f, 'r') as r:
+            sprite = json.load(r)
+        title = os.path.splitext(os.path.basename(f))[0]
+        n = 0
+        for tag, count in sprite['tags'].items():
+            tags.append(dict(
+                name=tag, **{'from': n, 'to': n + count - 1},
+                direction='forward'
+            ))
+            for i in range(count):
+                frames.append((
+                    frame_name(args['filename_format'], title, tag, i, n),
+                    sprite['w'],
+                    sprite['h']
+                ))
+                n += 1
+    cell_w = max([w for _, w, _ in frames] or [0]) + pad * 2
+    cell_h = max([h for _, _, h in frames] or [0]) + pad * 2
+    cols = max(1, math.ceil(math.sqrt(len(frames))))
+    rows = max(1, math.ceil(len(frames) / cols))
+    j_frames = dict()
+    for i, (name, w, h) in enumerate(frames):
+        j_frames[name] = dict(
+            frame=dict(
+                x=(i % cols) * cell_w,
+                y=(i // cols) * cell_h,
+                w=w + pad * 2,
+                h=h + pad * 2
+            ),
+            rotated=False,
+            trimmed=False,
+            spriteSourceSize=dict(x=0, y=0, w=w, h=h),
+            sourceSize=dict(w=w, h=h),
+            duration=100
+        )
+    size = (max(1, cols * cell_w), max(1, rows * cell_h))
+    Image.new('RGBA', size, (0, 0, 0, 0)).save(args['sheet'])
+    return dict(
+        frames=j_frames,
+        meta=dict(
+            app='kivyhelper stand-in',
+            version='1.0',
+            image=os.path.basename(args['sheet']),
+            format='RGBA8888',
+            size=dict(w=size[0], h=size[1]),
+            scale='1',
+            frameTags=tags,
+        )
+    )
+
+
+def main(argv: list) -> int:
+    if argv == ['--version']:
+        print('Aseprite stand-in 1.0')
+        return 0
+    args = parse_args(argv)
+    try:
+        j = export(args)
+    except (OSError, ValueError, KeyError) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    text = json.dumps(j, indent=1)
+    if args['data']:
+        with open(args['data'], 'w') as w:
+            w.write(text)
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
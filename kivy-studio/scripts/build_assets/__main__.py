@@ -1,7 +1,9 @@
 import argparse
 
 from kivyhelper import constants
-from kivyhelper.scripts.build_assets.lib import build_assets_folder
+from kivyhelper.scripts.build_assets.lib import (
+    build_assets_folder, watch_assets_folder
+)
 
 
 def assemble_args():
@@ -33,6 +35,14 @@ def assemble_args():
              'ignored.'
     )
 
+    parser.add_argument(
+        '--ignore_dirs',
+        nargs='*',
+        help='A list of regex expressions indicating directories to '
+             'skip. Directories whose names match any of the expressions '
+             'will not be searched for aseprite files.'
+    )
+
     parser.add_argument(
         '--filename_format',
         '-ff',
@@ -41,13 +51,187 @@ def assemble_args():
              f'{constants.DEFAULT_FF}'
     )
 
+    parser.add_argument(
+        '--jobs',
+        '-j',
+        type=int,
+        help='The maximum number of aseprite exports to run at once. '
+             f'Default is the number of cores ({constants.DEFAULT_JOBS}).'
+    )
+
+    parser.add_argument(
+        '--force',
+        '-f',
+        action='store_true',
+        help='Export every sprite group again, even the ones whose files '
+             'have not changed since the last build.'
+    )
+
+    parser.add_argument(
+        '--scan_cache',
+        action='store_true',
+        help='Cache the contents of each directory in the input directory '
+             'in the assets folder, so that directories that have not '
+             'changed are not listed again on the next build.'
+    )
+
+    parser.add_argument(
+        '--backend',
+        '-b',
+        choices=constants.BACKENDS,
+        default='aseprite',
+        help="How to export the aseprite files. 'aseprite' uses the "
+             "aseprite CLI, 'python' decodes the files in-process and "
+             "doesn't need aseprite to be installed. Default is aseprite."
+    )
+
+    parser.add_argument(
+        '--dedupe',
+        action='store_true',
+        help='Store frames with identical pixels only once in each '
+             'spritesheet, pointing every copy at the same rectangle.'
+    )
+
+    parser.add_argument(
+        '--trim',
+        action='store_true',
+        help='Crop every frame to its opaque pixels before packing it, '
+             'and record each frame\'s offset in a .trim file next to '
+             'its atlas.'
+    )
+
+    parser.add_argument(
+        '--scales',
+        nargs='*',
+        type=float,
+        help='A list of fractions, such as 0.5 0.25. A downscaled variant '
+             'of every spritesheet and atlas will be written for each, '
+             'for Sprites to load on devices with little texture memory.'
+    )
+
+    parser.add_argument(
+        '--share',
+        type=int,
+        help='A number of pixels. Sprite groups whose spritesheets are no '
+             'wider or taller than this are packed together onto shared '
+             'pages, so that they don\'t each need their own texture.'
+    )
+
+    parser.add_argument(
+        '--optimize',
+        action='store_true',
+        help='Recompress every png the build writes losslessly, as an '
+             'indexed palette png when it has 256 colors or fewer.'
+    )
+
+    parser.add_argument(
+        '--raw_textures',
+        action='store_true',
+        help='Write the decoded pixels of every png next to it, so that '
+             'Sprites can load them without decoding the png.'
+    )
+
+    parser.add_argument(
+        '--keep_json',
+        action='store_true',
+        help='Also write the aseprite json of every exported page to the '
+             'assets folder. Atlases are converted from the json in '
+             'memory either way, so it is only needed for inspection.'
+    )
+
+    parser.add_argument(
+        '--store',
+        help='A path to an artifact store, such as a folder on a shared '
+             'drive. Sprite groups exported with identical files and '
+             'parameters by any checkout are fetched from it instead of '
+             'being exported again.'
+    )
+
+    parser.add_argument(
+        '--store_budget',
+        type=int,
+        help='A number of bytes. The least recently used entries in the '
+             '--store are evicted to keep it under this size. Default is '
+             '2 GiB.'
+    )
+
+    parser.add_argument(
+        '--report',
+        help='A path to write a json report to, with the time each '
+             'sprite group took in each stage of the build and how much '
+             'texture memory its spritesheets need.'
+    )
+
+    parser.add_argument(
+        '--budget',
+        type=int,
+        help='A number of bytes. Sprite groups needing more texture '
+             'memory than this are flagged in the report.'
+    )
+
+    parser.add_argument(
+        '--watch',
+        '-w',
+        action='store_true',
+        help='After building, keep watching the input directory and '
+             'rebuild any sprite groups whose files change.'
+    )
+
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=1.0,
+        help='The number of seconds between checks for changes when '
+             'using --watch. Default is 1.'
+    )
+
     return parser.parse_args()
 
 
 args = assemble_args()
-build_assets_folder(
-    args.input_dir,
-    args.output_dir,
-    args.ignore,
-    args.filename_format
-)
+if args.watch:
+    watch_assets_folder(
+        args.input_dir,
+        args.output_dir,
+        args.ignore,
+        args.filename_format,
+        jobs=args.jobs,
+        interval=args.interval,
+        ignore_dirs=args.ignore_dirs,
+        scan_cache=args.scan_cache,
+        scales=args.scales,
+        optimize=args.optimize,
+        raw_textures=args.raw_textures,
+        share=args.share,
+        keep_json=args.keep_json,
+        store=args.store,
+        store_budget=args.store_budget,
+        backend=args.backend,
+        dedupe=args.dedupe,
+        trim=args.trim,
+        report=args.report,
+        budget=args.budget
+    )
+else:
+    build_assets_folder(
+        args.input_dir,
+        args.output_dir,
+        args.ignore,
+        args.filename_format,
+        jobs=args.jobs,
+        force=args.force,
+        ignore_dirs=args.ignore_dirs,
+        scan_cache=args.scan_cache,
+        scales=args.scales,
+        optimize=args.optimize,
+        raw_textures=args.raw_textures,
+        share=args.share,
+        keep_json=args.keep_json,
+        store=args.store,
+        store_budget=args.store_budget,
+        backend=args.backend,
+        dedupe=args.dedupe,
+        trim=args.trim,
+        report=args.report,
+        budget=args.budget
+    )
@@ -0,0 +1,466 @@
+import math
+import re
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+from PIL import Image
+
+from kivyhelper import constants
+
+HEADER_MAGIC = 0xA5E0
+FRAME_MAGIC = 0xF1FA
+
+CHUNK_OLD_PALETTE = 0x0004
+CHUNK_LAYER = 0x2004
+CHUNK_CEL = 0x2005
+CHUNK_TAGS = 0x2018
+CHUNK_PALETTE = 0x2019
+
+LAYER_VISIBLE = 1
+LAYER_BACKGROUND = 8
+LAYER_REFERENCE = 64
+
+CEL_RAW = 0
+CEL_LINKED = 1
+CEL_COMPRESSED = 2
+
+DIRECTIONS = ('forward', 'reverse', 'pingpong', 'pingpong_reverse')
+
+
+# The {frame} and {tagframe} placeholders, optionally followed by digits
+# that set both the first number and the zero-padded width:
+FRAME_NUMBER_RE = re.compile(r'\{(frame|tagframe)(\d*)\}')
+PLACEHOLDER_RE = re.compile(r'\{[a-z]+\d*\}')
+
+
+class AsepriteFormatError(Exception):
+    pass
+
+
+class Layer:
+    def __init__(
+            self,
+            name: str,
+            flags: int,
+            layer_type: int,
+            child_level: int,
+            opacity: int):
+        """
+        A layer from an aseprite file.
+
+        Args:
+            name: The name of the layer.
+            flags: The layer's flags, see LAYER_VISIBLE, LAYER_BACKGROUND
+                and LAYER_REFERENCE.
+            layer_type: 0 for a normal layer, 1 for a group, 2 for a
+                tilemap.
+            child_level: How deeply nested in groups the layer is.
+            opacity: The layer's opacity, from 0 to 255.
+        """
+        self.name = name
+        self.flags = flags
+        self.layer_type = layer_type
+        self.child_level = child_level
+        self.opacity = opacity
+        self.parent: (Layer, None) = None
+
+    @property
+    def visible(self) -> bool:
+        """
+        Returns: True if the layer and every group it is nested in are
+            visible, and none of them are reference layers.
+
+        """
+        if not self.flags & LAYER_VISIBLE or self.flags & LAYER_REFERENCE:
+            return False
+        return self.parent.visible if self.parent else True
+
+    @property
+    def background(self) -> bool:
+        """
+        Returns: True if the layer is the file's background layer, which
+            is opaque, even where it uses the transparent color.
+
+        """
+        return bool(self.flags & LAYER_BACKGROUND)
+
+
+class AsepriteFile:
+    def __init__(self, file_path: (str, Path)):
+        """
+        A decoded .ase/.aseprite file. Supports RGBA, grayscale and
+        indexed color modes, raw, linked and zlib compressed cels, and
+        frame tags. Every layer is composited with the normal blend
+        mode.
+
+        Args:
+            file_path: The path to an .ase or .aseprite file.
+        """
+        self.path = Path(file_path)
+        self.title = self.path.stem
+        self.layers: List[Layer] = []
+        self.durations: List[int] = []
+        self.tags: List[dict] = []
+        self.palette: List[tuple] = [(0, 0, 0, 0)] * 256
+        # Each frame is a dictionary of layer index: cel tuple.
+        self._cels: List[dict] = []
+        with open(self.path, 'rb') as r:
+            self._read(r.read())
+
+    def _read(self, data: bytes) -> None:
+        """
+        Parses the header and every frame of the file's contents.
+
+        Args:
+            data: The bytes of an aseprite file.
+
+        Returns: None
+
+        """
+        if len(data) < 128:
+            raise AsepriteFormatError(f'{self.path} is too short.')
+        (_, magic, frames, self.width, self.height, self.depth, flags
+         ) = struct.unpack_from('<IHHHHHI', data, 0)
+        if magic != HEADER_MAGIC:
+            raise AsepriteFormatError(f'{self.path} is not an aseprite file.')
+        # Layer opacity is only valid if the first header flag is set:
+        self._layer_opacity = bool(flags & 1)
+        if self.depth not in (8, 16, 32):
+            raise AsepriteFormatError(
+                f'{self.path} has unsupported color depth {self.depth}.')
+        self.transparent_idx = data[28]
+        pos = 128
+        for i in range(frames):
+            size, magic, old_chunks, duration, _, new_chunks = (
+                struct.unpack_from('<IHHH2sI', data, pos))
+            if magic != FRAME_MAGIC:
+                raise AsepriteFormatError(
+                    f'{self.path} has a corrupt header on frame {i}.')
+            self.durations.append(duration)
+            self._cels.append(dict())
+            chunk_pos = pos + 16
+            for _ in range(new_chunks or old_chunks):
+                chunk_size, chunk_type = struct.unpack_from(
+                    '<IH', data, chunk_pos)
+                chunk = data[chunk_pos + 6:chunk_pos + chunk_size]
+                self._read_chunk(chunk_type, chunk, i)
+                chunk_pos += chunk_size
+            pos += size
+
+    @staticmethod
+    def _read_string(data: bytes, pos: int) -> (str, int):
+        n, = struct.unpack_from('<H', data, pos)
+        return data[pos + 2:pos + 2 + n].decode('utf-8'), pos + 2 + n
+
+    def _read_chunk(self, chunk_type: int, data: bytes, frame: int) -> None:
+        """
+        Parses a single chunk. Chunk types that don't affect the
+        exported frames are skipped.
+
+        Args:
+            chunk_type: The chunk's type.
+            data: The chunk's data, not including its size and type.
+            frame: The index of the frame the chunk belongs to.
+
+        Returns: None
+
+        """
+        if chunk_type == CHUNK_LAYER:
+            flags, layer_type, child_level, _, _, _, opacity = (
+                struct.unpack_from('<HHHHHHB', data, 0))
+            name, _ = self._read_string(data, 16)
+            layer = Layer(
+                name, flags, layer_type, child_level,
+                opacity if self._layer_opacity else 255)
+            for prev in reversed(self.layers):
+                if prev.child_level < child_level:
+                    layer.parent = prev
+                    break
+            self.layers.append(layer)
+        elif chunk_type == CHUNK_CEL:
+            layer, x, y, opacity, cel_type = struct.unpack_from(
+                '<HhhBH', data, 0)
+            if cel_type == CEL_LINKED:
+                link, = struct.unpack_from('<H', data, 16)
+                cel = self._cels[link].get(layer)
+            elif cel_type in (CEL_RAW, CEL_COMPRESSED):
+                w, h = struct.unpack_from('<HH', data, 16)
+                pixels = data[20:]
+                if cel_type == CEL_COMPRESSED:
+                    pixels = zlib.decompress(pixels)
+                cel = (x, y, opacity, w, h, pixels)
+            else:
+                # Tilemap cels aren't supported.
+                cel = None
+            if cel:
+                self._cels[frame][layer] = cel
+        elif chunk_type == CHUNK_TAGS:
+            n, = struct.unpack_from('<H', data, 0)
+            pos = 10
+            for _ in range(n):
+                start, end, direction = struct.unpack_from('<HHB', data, pos)
+                name, pos = self._read_string(data, pos + 17)
+                self.tags.append({
+                    'name': name,
+                    'from': start,
+                    'to': end,
+                    'direction': DIRECTIONS[direction]
+                    if direction < len(DIRECTIONS) else 'forward',
+                })
+        elif chunk_type == CHUNK_PALETTE:
+            _, first, last = struct.unpack_from('<III', data, 0)
+            pos = 20
+            for i in range(first, last + 1):
+                flags, r, g, b, a = struct.unpack_from('<HBBBB', data, pos)
+                pos += 6
+                if flags & 1:
+                    _, pos = self._read_string(data, pos)
+                if i < len(self.palette):
+                    self.palette[i] = (r, g, b, a)
+        elif chunk_type == CHUNK_OLD_PALETTE:
+            packets, = struct.unpack_from('<H', data, 0)
+            pos = 2
+            i = 0
+            for _ in range(packets):
+                i += data[pos]
+                n = data[pos + 1] or 256
+                pos += 2
+                for _ in range(n):
+                    if i < len(self.palette):
+                        self.palette[i] = (*data[pos:pos + 3], 255)
+                    i += 1
+                    pos += 3
+
+    def _cel_image(self, cel: tuple, background: bool = False) -> Image.Image:
+        """
+        Converts a cel's pixel data into an RGBA image.
+
+        Args:
+            cel: A cel tuple of x, y, opacity, width, height, pixels.
+            background: True if the cel is on the background layer,
+                where indexed pixels of the transparent color are
+                opaque, as they are in aseprite.
+
+        Returns: An RGBA PIL Image.
+
+        """
+        _, _, _, w, h, pixels = cel
+        if self.depth == 32:
+            return Image.frombytes('RGBA', (w, h), pixels)
+        elif self.depth == 16:
+            return Image.frombytes('LA', (w, h), pixels).convert('RGBA')
+        else:
+            palette = list(self.palette)
+            if not background:
+                palette[self.transparent_idx] = (0, 0, 0, 0)
+            img = Image.frombytes('P', (w, h), pixels)
+            img.putpalette(b''.join(bytes(c) for c in palette), 'RGBA')
+            return img.convert('RGBA')
+
+    def render(
+            self,
+            frame: int,
+            ignore_layers: tuple = ('Reference Layer 1',)) -> Image.Image:
+        """
+        Composites every visible layer of a frame.
+
+        Args:
+            frame: The index of the frame to render.
+            ignore_layers: The names of any layers to leave out.
+
+        Returns: An RGBA PIL Image the size of the file's canvas.
+
+        """
+        canvas = Image.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
+        for i, layer in enumerate(self.layers):
+            cel = self._cels[frame].get(i)
+            if (not cel or layer.layer_type != 0 or not layer.visible
+                    or layer.name in ignore_layers):
+                continue
+            img = self._cel_image(cel, layer.background)
+            opacity = cel[2] * layer.opacity // 255
+            if opacity < 255:
+                alpha = img.getchannel('A').point(
+                    lambda a: a * opacity // 255)
+                img.putalpha(alpha)
+            layer_img = Image.new('RGBA', canvas.size, (0, 0, 0, 0))
+            layer_img.paste(img, (cel[0], cel[1]))
+            canvas = Image.alpha_composite(canvas, layer_img)
+        return canvas
+
+    def frame_names(self, filename_format: str = None) -> List[str]:
+        """
+        Names each frame the way the aseprite CLI would with the passed
+        filename_format. Supports the {title}, {extension}, {tag},
+        {innertag}, {outertag}, {tagframe} and {frame} placeholders, the
+        last two optionally zero-padded and offset, as in {frame001}.
+
+        Args:
+            filename_format: A string in the aseprite CLI
+                filename-format format.
+
+        Raises: AsepriteFormatError if filename_format contains any other
+            placeholder, such as {layer}, since layers are always
+            flattened.
+
+        Returns: A list of names, one for each frame.
+
+        """
+        filename_format = filename_format or constants.DEFAULT_FF
+        names = []
+        for i in range(len(self.durations)):
+            # Nested tags are told apart by how many frames they span:
+            matches = sorted(
+                [t for t in self.tags if t['from'] <= i <= t['to']],
+                key=lambda t: t['to'] - t['from'])
+            inner = matches[0] if matches else None
+            values = dict(
+                title=self.title,
+                extension=self.path.suffix.lstrip('.'),
+                tag=inner['name'] if inner else '',
+                innertag=inner['name'] if inner else '',
+                outertag=matches[-1]['name'] if matches else '',
+            )
+            numbers = dict(
+                tagframe=i - inner['from'] if inner else i, frame=i)
+
+            def _number(m):
+                n = numbers[m.group(1)]
+                if not m.group(2):
+                    return str(n)
+                return str(n + int(m.group(2))).zfill(len(m.group(2)))
+
+            name = FRAME_NUMBER_RE.sub(_number, filename_format)
+            for k, v in values.items():
+                name = name.replace(f'{{{k}}}', v)
+            unknown = PLACEHOLDER_RE.search(name)
+            if unknown:
+                raise AsepriteFormatError(
+                    f'{self.path}: {unknown.group(0)} is not supported in '
+                    f'the filename format by the python backend.')
+            names.append(name)
+        return names
+
+
+def pack_rects(sizes: List[tuple]) -> (List[tuple], int, int):
+    """
+    Packs rectangles into a roughly square sheet using shelves, tallest
+    rectangles first.
+
+    Args:
+        sizes: A list of width, height tuples.
+
+    Returns: A list of the x, y position of each rectangle, in the same
+        order as sizes, and the width and height of the resulting
+        sheet.
+
+    """
+    if len(sizes) == 0:
+        return [], 0, 0
+    area = sum(w * h for w, h in sizes)
+    max_w = max(max(w for w, _ in sizes), math.ceil(math.sqrt(area)))
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    positions = [(0, 0)] * len(sizes)
+    x = y = shelf_h = sheet_w = 0
+    for i in order:
+        w, h = sizes[i]
+        if x + w > max_w:
+            y += shelf_h
+            x = shelf_h = 0
+        positions[i] = (x, y)
+        x += w
+        shelf_h = max(shelf_h, h)
+        sheet_w = max(sheet_w, x)
+    return positions, sheet_w, y + shelf_h
+
+
+def render_sheet(
+        files: list,
+        sheet_path: (str, Path),
+        filename_format: str = None,
+        jobs: int = None) -> (int, dict):
+    """
+    Stand-in for the aseprite CLI call built by assemble_aseprite_cli
+    that decodes the aseprite files in-process. Packs every non-empty
+    frame of the files, with constants.INNER_PADDING around each one,
+    into a single png, and describes it in an aseprite-style json
+    dictionary that is returned rather than written.
+
+    Args:
+        files: A list of the aseprite files to integrate into the png.
+        sheet_path: The path to save the png to.
+        filename_format: A string in the aseprite CLI filename-format
+            format. Controls how frames are named.
+        jobs: The maximum number of frames to render at once. If None,
+            constants.DEFAULT_JOBS will be used.
+
+    Returns: 0 if the export succeeded, 1 if it did not, mirroring the
+        exit code of the aseprite CLI, and the aseprite json dictionary,
+        or None if the export failed.
+
+    """
+    pad = constants.INNER_PADDING
+    frames = []
+    tags = []
+    jobs = max(1, jobs or constants.DEFAULT_JOBS)
+    try:
+        ases = [AsepriteFile(f) for f in files]
+        names = [ase.frame_names(filename_format) for ase in ases]
+        # Frames are composited in parallel, since PIL releases the GIL
+        # while it blends, and are kept in order:
+        work = [(ase, i) for ase in ases for i in range(len(ase.durations))]
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            rendered = list(executor.map(lambda x: x[0].render(x[1]), work))
+        pos = 0
+        for ase, ase_names in zip(ases, names):
+            # The index of each of the file's frames on the sheet, which
+            # differs from its index in the file once earlier files' and
+            # empty frames are accounted for:
+            indices = dict()
+            for i, name in enumerate(ase_names):
+                img = rendered[pos + i]
+                if img.getbbox() is None:
+                    continue
+                indices[i] = len(frames)
+                frames.append((name, img, ase.durations[i]))
+            pos += len(ase_names)
+            for t in ase.tags:
+                kept = [
+                    indices[i] for i in range(t['from'], t['to'] + 1)
+                    if i in indices.keys()
+                ]
+                if kept:
+                    tags.append({**t, 'from': kept[0], 'to': kept[-1]})
+    except (OSError, AsepriteFormatError, struct.error, zlib.error) as e:
+        print(f'       ~ Error: Could not decode aseprite files: {e}')
+        return 1, None
+    sizes = [(img.width + pad * 2, img.height + pad * 2)
+             for _, img, _ in frames]
+    positions, w, h = pack_rects(sizes)
+    sheet = Image.new('RGBA', (w, h), (0, 0, 0, 0))
+    result = dict(frames=dict(), meta=dict())
+    for (name, img, duration), (x, y), (fw, fh) in zip(
+            frames, positions, sizes):
+        sheet.paste(img, (x + pad, y + pad))
+        result['frames'][name] = {
+            'frame': dict(x=x, y=y, w=fw, h=fh),
+            'rotated': False,
+            'trimmed': False,
+            'spriteSourceSize': dict(x=0, y=0, w=fw, h=fh),
+            'sourceSize': dict(w=fw, h=fh),
+            'duration': duration,
+        }
+    result['meta'] = {
+        'app': 'kivyhelper',
+        'version': '1',
+        'image': Path(sheet_path).name,
+        'format': 'RGBA8888',
+        'size': dict(w=w, h=h),
+        'scale': '1',
+        'frameTags': tags,
+    }
+    sheet.save(sheet_path)
+    return 0, result
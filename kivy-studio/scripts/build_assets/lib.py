@@ -1,16 +1,26 @@
+import hashlib
 import json
 import os
 import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from pathlib import Path
+from typing import Iterable, Iterator, Tuple
 
-from kivyhelper import constants, lib
+from kivyhelper import atlas_index, constants, lib, raw_texture
+from kivyhelper.scripts.build_assets import aseprite, sheets
+from kivyhelper.scripts.build_assets.report import BuildReport
+from kivyhelper.scripts.build_assets.store import ArtifactStore
 
 
 def assemble_aseprite_cli(
         output_name: str,
         files: list,
         target_dir: str,
-        filename_format: str = None) -> str:
+        filename_format: str = None,
+        data: bool = True) -> str:
     """
     Builds a cli line to execute aseprite's CLI API.
 
@@ -20,6 +30,8 @@ def assemble_aseprite_cli(
         target_dir: The directory to save the resulting png and json to.
         filename_format: A string to be passed to aseprite as the format
             for each frame in the resulting json.
+        data: If False, the json will not be saved to target_dir, and
+            aseprite will print it to stdout instead.
 
     Returns: A string that is ready to be executed by os.system.
 
@@ -27,19 +39,22 @@ def assemble_aseprite_cli(
     if not filename_format:
         filename_format = constants.DEFAULT_FF
     td_path = Path(target_dir)
-    return (
-        f'aseprite -b --ignore-empty --list-tags '
+    cli_str = (
+        f'{constants.ASEPRITE} -b --ignore-empty --list-tags '
         f'--ignore-layer "Reference Layer 1" '
-        f'--inner-padding 2 '
+        f'--inner-padding {constants.INNER_PADDING} '
         f'--sheet-pack '
         f'{" ".join([lib.enquote(f) for f in files])} '
         f'--filename-format {filename_format} '
-        f'--sheet {lib.enquote(td_path.joinpath(output_name + ".png"))} '
-        f'--data {lib.enquote(td_path.joinpath(output_name + ".json"))}'
+        f'--sheet {lib.enquote(td_path.joinpath(output_name + ".png"))}'
     )
+    if data:
+        cli_str += (
+            f' --data {lib.enquote(td_path.joinpath(output_name + ".json"))}')
+    return cli_str
 
 
-def execute_cli_str(cli_str: str):
+def execute_cli_str(cli_str: str) -> int:
     """
     Simple function to execute a cli_str. Kept separate primarily to
     ease testing.
@@ -47,17 +62,318 @@ def execute_cli_str(cli_str: str):
     Args:
         cli_str: A string that can be parsed by a cli/bash.
 
-    Returns: None
+    Returns: The exit code of the executed command.
+
+    """
+    return subprocess.run(cli_str, shell=True).returncode
+
+
+def capture_cli_str(cli_str: str) -> (int, str):
+    """
+    Executes a cli_str like execute_cli_str, but captures what it prints
+    to stdout instead of letting it through.
+
+    Args:
+        cli_str: A string that can be parsed by a cli/bash.
+
+    Returns: The exit code of the executed command, and its stdout.
+
+    """
+    process = subprocess.run(
+        cli_str, shell=True, stdout=subprocess.PIPE, text=True)
+    return process.returncode, process.stdout
+
+
+def stream_cli_json(cli_str: str) -> (int, dict):
+    """
+    Executes a cli_str that prints an aseprite json, like
+    capture_cli_str, but decodes the json with lib.iter_aseprite_json as
+    it is printed instead of buffering all of it. Only what the atlas
+    conversion needs is kept: each frame's rectangle, and the meta
+    section.
+
+    Args:
+        cli_str: A string that can be parsed by a cli/bash.
+
+    Raises: ValueError if the command succeeded but didn't print a
+        complete aseprite json.
+
+    Returns: The exit code of the executed command, and the json
+        dictionary, or None if the command failed.
+
+    """
+    process = subprocess.Popen(
+        cli_str, shell=True, stdout=subprocess.PIPE, text=True)
+    frames = dict()
+    meta = None
+    error = None
+    try:
+        for section, name, value in lib.iter_aseprite_json(process.stdout):
+            if section == 'frames':
+                frames[name] = dict(frame=value['frame'])
+            elif section == 'meta':
+                meta = value
+    except (ValueError, KeyError, TypeError) as e:
+        error = e
+    finally:
+        # Closing the pipe stops a process whose output was abandoned
+        # from blocking on a full pipe:
+        process.stdout.close()
+        code = process.wait()
+    if code != 0:
+        return code, None
+    if error is not None or meta is None:
+        raise ValueError(
+            f'{cli_str} did not print an aseprite json.') from error
+    return code, dict(frames=frames, meta=meta)
+
+
+def export_group(
+        group: str,
+        files: list,
+        target_dir: (str, Path),
+        filename_format: str = None,
+        backend: str = 'aseprite',
+        stages: list = None,
+        keep_json: bool = False,
+        report: BuildReport = None) -> (int, dict):
+    """
+    Exports a sprite group to a png via the aseprite CLI, or via the
+    in-process decoder in the aseprite module. The json aseprite
+    produces alongside the png is captured in memory rather than read
+    back from disk. Unless there are stages to run or the json is kept,
+    it is decoded as aseprite prints it, via stream_cli_json, and only
+    each frame's rectangle is kept. If the resulting spritesheet is larger than
+    constants.OPEN_GL_LIMIT, the group's files are split in half,
+    recursively, and exported as a series of pages named {group}-0,
+    {group}-1, etc until every page fits. A file is never split across
+    pages, so all the frames of a tag stay on the same texture.
+
+    Args:
+        group: The name of the group, used to name the output files.
+        files: A list of the aseprite files in the group.
+        target_dir: The directory to save the resulting pngs to.
+        filename_format: A string to be passed to aseprite as the format
+            for each frame in the resulting json.
+        backend: 'aseprite' to export with the aseprite CLI, or 'python'
+            to decode the files in-process, which doesn't need aseprite
+            to be installed.
+        stages: A list of functions that will each be passed the path
+            to the png of every page and its json dictionary once it has
+            been exported, to post-process them in place.
+        keep_json: If True, the json of every page will also be written
+            next to its png, once every stage has run. Otherwise any
+            json left from a previous export of the page is removed.
+        report: A BuildReport to record the time spent parsing the json
+            aseprite prints in, under the group's parse stage. Json that
+            is decoded as it is printed is parsed while aseprite runs, so
+            its parse time is part of the export time.
+
+    Returns: The exit code of the export, and a dictionary of the names
+        of the pages it produced and their aseprite json dictionaries.
+
+    """
+    td = Path(target_dir)
+    pages = dict()
+
+    def _export(name: str, subset: list) -> int:
+        sheet_p = td.joinpath(f'{name}.png')
+        if backend == 'python':
+            code, j = aseprite.render_sheet(subset, sheet_p, filename_format)
+        else:
+            cli_str = assemble_aseprite_cli(
+                name, subset, td, filename_format, data=False)
+            timer = report.timer(group, 'parse') if report else nullcontext()
+            try:
+                if stages or keep_json:
+                    # Stages and kept jsons need every field of every
+                    # frame, so the json is parsed whole:
+                    code, out = capture_cli_str(cli_str)
+                    with timer:
+                        j = json.loads(out) if code == 0 else None
+                else:
+                    code, j = stream_cli_json(cli_str)
+            except ValueError:
+                print(f'       ~ Error: Could not parse the json printed by '
+                      f'{constants.ASEPRITE} for {name}.')
+                code = 1
+        if code != 0:
+            return code
+        size = j['meta']['size']
+        if (len(subset) == 1
+                or max(size['w'], size['h']) <= constants.OPEN_GL_LIMIT):
+            for stage in stages or []:
+                stage(sheet_p, j)
+            json_p = td.joinpath(f'{name}.json')
+            if keep_json:
+                with open(json_p, 'w') as w:
+                    w.write(json.dumps(j, indent=1))
+            elif json_p.exists():
+                json_p.unlink()
+            pages[name] = j
+            return 0
+        sheet_p.unlink()
+        half = len(subset) // 2
+        return (_export(f'{group}-{len(pages)}', subset[:half])
+                or _export(f'{group}-{len(pages)}', subset[half:]))
+
+    return _export(group, files), pages
+
+
+def export_groups(
+        file_groups: dict,
+        target_dir: (str, Path),
+        filename_format: str = None,
+        jobs: int = None,
+        backend: str = 'aseprite',
+        stages: list = None,
+        report: BuildReport = None,
+        keep_json: bool = False,
+        on_export=None) -> dict:
+    """
+    Exports each sprite group via export_group, running up to jobs
+    exports at once.
+
+    Args:
+        file_groups: A dictionary of groups and their aseprite files, as
+            produced by collect_files.
+        target_dir: The directory to save the resulting pngs to.
+        filename_format: A string to be passed to aseprite as the format
+            for each frame in the resulting json.
+        jobs: The maximum number of concurrent exports. If None,
+            constants.DEFAULT_JOBS will be used.
+        backend: 'aseprite' or 'python', see export_group.
+        stages: A list of post-processing functions, see export_group.
+        report: A BuildReport to record each group's export and parse
+            times in. Time spent parsing is left out of the export time.
+        keep_json: If True, each page's json will be written next to its
+            png, see export_group.
+        on_export: A function that will be passed the name of each group
+            that exported successfully and the dictionary of its pages
+            and their json dictionaries, as soon as its export
+            finishes. Called from the calling thread, one group at a
+            time, so that each group's jsons can be converted and
+            dropped while the other exports are still running.
+
+    Returns: A dictionary containing each group and a tuple of the exit
+        code of its export and a list of the names of the pages it
+        produced, in the same order as file_groups.
+
+    """
+    def _export(group: str, *args):
+        if not report:
+            return export_group(group, *args)
+        with report.timer(group, 'export', exclude='parse'):
+            return export_group(group, *args, report)
+
+    jobs = max(1, jobs or constants.DEFAULT_JOBS)
+    results = dict()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(
+                _export, group, files, target_dir, filename_format,
+                backend, stages, keep_json
+            ): group
+            for group, files in file_groups.items()
+        }
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                code, pages = future.result()
+            except Exception as e:
+                # An unexpected error in one group (a corrupt file, a
+                # failing stage, etc) shouldn't abort the others:
+                print(f'   > Warning: Export of {group} failed: {e}')
+                results[group] = 1, []
+                continue
+            results[group] = code, list(pages)
+            if code == 0:
+                print(
+                    f'   > Assembled {len(file_groups[group])} aseprite '
+                    f'files into {", ".join(p + ".png" for p in pages)}')
+                if on_export:
+                    on_export(group, pages)
+            else:
+                print(
+                    f'   > Warning: Export of {group} failed with exit code '
+                    f'{code}.')
+    return {group: results[group] for group in file_groups.keys()}
+
+
+def scan_files(
+        input_dir: str,
+        ignore: list = None,
+        ext: (str, tuple) = None,
+        ignore_dirs: list = None,
+        cache: dict = None) -> Iterator[Tuple[tuple, list]]:
+    """
+    Walks the target directory with os.scandir, in the same top-down
+    order as os.walk but with each directory's entries sorted by name,
+    and yields the target files in each directory.
+
+    Args:
+        input_dir: A directory path.
+        ignore: A list of regex expressions. Any files with names
+            matching any of the expressions will be ignored.
+        ext: A string or a tuple of strings, the file extensions to
+            collect. If None, will collect all files.
+        ignore_dirs: A list of regex expressions. Any directories with
+            names matching any of the expressions will not be descended
+            into.
+        cache: A dictionary of directory paths and their mtime, sub
+            directories and target files, as filled in by a previous
+            scan with the same arguments. Directories whose mtime hasn't
+            changed will not be listed again. Will be updated in place.
+
+    Yields: A tuple of each directory's path parts relative to
+        input_dir, and a list of the target files in it.
 
     """
-    os.system(cli_str)
+    ignore_re = re.compile('|'.join(ignore)) if ignore else None
+    ignore_dirs_re = (
+        re.compile('|'.join(ignore_dirs)) if ignore_dirs else None)
+    ext = (ext,) if isinstance(ext, str) else ext
+    # Directories modified this recently might still change within the
+    # same mtime tick, so they are always listed again:
+    settled_ns = time.time_ns() - 2 * 10 ** 9
+    stack = [(str(Path(input_dir)), ())]
+    while stack:
+        root, parts = stack.pop()
+        try:
+            mtime = os.stat(root).st_mtime_ns
+        except OSError:
+            continue
+        cached = cache.get(root) if cache is not None else None
+        if cached and cached[0] == mtime:
+            _, subdirs, files = cached
+        else:
+            subdirs, files = [], []
+            try:
+                with os.scandir(root) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+            for e in entries:
+                if e.is_dir(follow_symlinks=False):
+                    if not (ignore_dirs_re and ignore_dirs_re.match(e.name)):
+                        subdirs.append(e.name)
+                elif ext is None or e.name.endswith(ext):
+                    if not (ignore_re and ignore_re.match(e.name)):
+                        files.append(e.name)
+            if cache is not None and mtime < settled_ns:
+                cache[root] = [mtime, subdirs, files]
+        yield parts, [os.path.join(root, f) for f in files]
+        for sub in reversed(subdirs):
+            stack.append((os.path.join(root, sub), (*parts, sub)))
 
 
 def collect_files(
         input_dir: str,
         ignore: list = None,
         ext: (str, tuple) = None,
-        sep: str = '_') -> (dict, tuple):
+        sep: str = '_',
+        ignore_dirs: list = None,
+        cache: dict = None) -> (dict, tuple):
     """
     Collects file names from the target directory. Will walk all
     subdirectories in the directory.
@@ -70,36 +386,75 @@ def collect_files(
             collect. If None, will collect all files.
         sep: When creating group keys, names of folders will be
             separated with this string.
+        ignore_dirs: A list of regex expressions. Any directories with
+            names matching any of the expressions will be skipped,
+            along with everything in them.
+        cache: A dictionary, as read by read_scan_cache. If passed,
+            directories that haven't changed since the cache was filled
+            won't be listed again, and the cache will be updated in
+            place. If it was filled with different arguments, it will
+            be cleared first.
 
     Returns: A dictionary containing parent directories as groups and
         the corresponding list of target files associated with that
         group.
 
     """
-    if ignore:
-        ignore_re = re.compile('|'.join(ignore))
-    else:
-        ignore_re = None
-    ext = (ext,) if isinstance(ext, str) else ext
+    dirs = None
+    if cache is not None:
+        key = dict(
+            input_dir=os.path.abspath(input_dir),
+            ignore=ignore or [],
+            ext=[ext] if isinstance(ext, str) else ext and list(ext),
+            ignore_dirs=ignore_dirs or [],
+        )
+        if cache.get('key') != key:
+            cache.clear()
+            cache['key'] = key
+        dirs = cache.setdefault('dirs', dict())
     file_grps = dict()
-    input_dir = Path(input_dir)
-    subroot_idx = len(input_dir.parts)
-    for root, _, files in os.walk(input_dir):
-        input_files = []
-        root_p = Path(root)
-        group = sep.join(root_p.parts[subroot_idx:])
-        group = root_p.name if len(group) == 0 else group
-        for f in files:
-            _, e = os.path.splitext(f)
-            if e in ext or ext is None:
-                m = ignore_re.match(f) if ignore_re else None
-                if not m:
-                    input_files.append(str(root_p.joinpath(f)))
-        if len(input_files) > 0:
-            file_grps[group] = input_files
+    root_name = Path(input_dir).name
+    for parts, files in scan_files(input_dir, ignore, ext, ignore_dirs, dirs):
+        if len(files) > 0:
+            file_grps[sep.join(parts) if parts else root_name] = files
     return file_grps
 
 
+def read_scan_cache(assets_dir: (str, Path)) -> dict:
+    """
+    Reads the directory scan cache from an assets folder.
+
+    Args:
+        assets_dir: The path to an assets folder.
+
+    Returns: The cache dictionary, for collect_files, or an empty
+        dictionary if there is no readable cache.
+
+    """
+    p = Path(assets_dir).joinpath(constants.SCAN_CACHE)
+    try:
+        with open(p, 'r') as r:
+            return json.load(r)
+    except (OSError, ValueError):
+        return dict()
+
+
+def write_scan_cache(assets_dir: (str, Path), cache: dict) -> None:
+    """
+    Writes the directory scan cache to an assets folder.
+
+    Args:
+        assets_dir: The path to an assets folder.
+        cache: The cache dictionary, as filled in by collect_files.
+
+    Returns: None
+
+    """
+    p = Path(assets_dir).joinpath(constants.SCAN_CACHE)
+    with open(p, 'w') as w:
+        w.write(json.dumps(cache))
+
+
 def convert_ase_json_to_atlas(j: dict) -> dict:
     """
     Extracts the necessary information from an aseprite json dictionary
@@ -113,9 +468,14 @@ def convert_ase_json_to_atlas(j: dict) -> dict:
         that png file.
 
     """
-    k = j['meta']['image']
-    total_h = j['meta']['size']['h']
-    total_w = j['meta']['size']['w']
+    meta = j['meta']
+    frames = dict()
+    for f, features in j['frames'].items():
+        fr = features['frame']
+        frames[f] = [fr['x'], fr['y'], fr['w'], fr['h']]
+    k = meta['image']
+    total_h = meta['size']['h']
+    total_w = meta['size']['w']
     if total_h > constants.OPEN_GL_LIMIT or total_w > constants.OPEN_GL_LIMIT:
         print(
             f'Warning: Image {k} dimensions ({total_w} x {total_h}) are '
@@ -123,14 +483,329 @@ def convert_ase_json_to_atlas(j: dict) -> dict:
             f'{constants.OPEN_GL_LIMIT}. This image will not be rendered '
             f'properly in Kivy.'
         )
-    result = {k: dict()}
-    for f, features in j['frames'].items():
-        result[k][f] = []
-        for d, v in features['frame'].items():
-            h = features['frame']['h']
-            n = max(0, total_h - h - v) if d == 'y' else v
-            result[k][f].append(n)
-    return result
+    for rect in frames.values():
+        rect[1] = max(0, total_h - rect[3] - rect[1])
+    return {k: frames}
+
+
+def hash_group(files: list, input_dir: (str, Path), params: dict) -> str:
+    """
+    Hashes the contents of a sprite group's aseprite files along with
+    the parameters they will be exported with, so that a group only
+    needs to be exported again when one of the two changes.
+
+    Args:
+        files: A list of the aseprite files in the group.
+        input_dir: The directory the files were collected from. File
+            paths are hashed relative to it so that the same art in a
+            different checkout produces the same hash.
+        params: A dictionary of any build parameters that affect the
+            export.
+
+    Returns: A string, the hex digest of the group's hash.
+
+    """
+    h = hashlib.sha1(json.dumps(params, sort_keys=True).encode())
+    for f in files:
+        h.update(os.path.relpath(f, input_dir).replace(os.sep, '/').encode())
+        with open(f, 'rb') as r:
+            for chunk in iter(lambda: r.read(1 << 16), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def read_build_manifest(assets_dir: (str, Path)) -> dict:
+    """
+    Reads the build manifest from an assets folder.
+
+    Args:
+        assets_dir: The path to an assets folder.
+
+    Returns: A dictionary containing each previously built group and its
+        hash, or an empty dictionary if there is no readable manifest.
+
+    """
+    return _read_manifest(assets_dir).get('groups', dict())
+
+
+def read_build_artifacts(assets_dir: (str, Path)) -> dict:
+    """
+    Reads the files each group's last build produced from the build
+    manifest of an assets folder.
+
+    Args:
+        assets_dir: The path to an assets folder.
+
+    Returns: A dictionary containing each previously built group and a
+        list of the names of the files its build produced, or an empty
+        dictionary if there is no readable manifest.
+
+    """
+    return _read_manifest(assets_dir).get('artifacts', dict())
+
+
+def _read_manifest(assets_dir: (str, Path)) -> dict:
+    p = Path(assets_dir).joinpath(constants.BUILD_MANIFEST)
+    try:
+        with open(p, 'r') as r:
+            return json.load(r)
+    except (OSError, ValueError):
+        return dict()
+
+
+def write_build_manifest(
+        assets_dir: (str, Path),
+        groups: dict,
+        artifacts: dict = None) -> None:
+    """
+    Writes the build manifest to an assets folder.
+
+    Args:
+        assets_dir: The path to an assets folder.
+        groups: A dictionary containing each built group and its hash.
+        artifacts: A dictionary containing each built group and a list
+            of the names of the files its build produced. Shared pages
+            are not included, as they belong to every group on them.
+
+    Returns: None
+
+    """
+    p = Path(assets_dir).joinpath(constants.BUILD_MANIFEST)
+    with open(p, 'w') as w:
+        w.write(json.dumps(
+            dict(groups=groups, artifacts=artifacts or dict()),
+            indent=1, sort_keys=True))
+
+
+def optimize_pngs(
+        assets_dir: Path,
+        pngs: dict,
+        jobs: int = None,
+        report: BuildReport = None) -> int:
+    """
+    Runs sheets.optimize_png on a set of pngs in parallel.
+
+    Args:
+        assets_dir: The path to the assets folder the pngs are in.
+        pngs: A dictionary of sprite groups and a list of their png
+            names.
+        jobs: The maximum number of pngs to optimize at once. If None,
+            constants.DEFAULT_JOBS will be used.
+        report: A BuildReport to record each group's png sizes and
+            decode times in.
+
+    Returns: The total number of bytes saved.
+
+    """
+    def _timed_optimize(png):
+        start = time.perf_counter()
+        stats = sheets.optimize_png(assets_dir.joinpath(png))
+        return stats, time.perf_counter() - start
+
+    # Shared pages appear under several groups, but are only optimized
+    # once, for the first of them:
+    owners = dict()
+    for group, group_pngs in pngs.items():
+        for png in group_pngs:
+            owners.setdefault(png, group)
+    jobs = max(1, jobs or constants.DEFAULT_JOBS)
+    saved = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(_timed_optimize, png): group
+            for png, group in owners.items()
+        }
+        for future in as_completed(futures):
+            stats, seconds = future.result()
+            saved += stats['bytes_before'] - stats['bytes_after']
+            if report:
+                report.add_png(futures[future], stats)
+                report.add_time(futures[future], 'optimize', seconds)
+    return saved
+
+
+def read_trim_file(assets_dir: Path, name: str) -> dict:
+    """
+    Reads the .trim file written by write_atlas.
+
+    Args:
+        assets_dir: The path to an assets folder.
+        name: The name of the atlas, without the .atlas extension.
+
+    Returns: A dictionary of trimmed frames and their offsets, empty if
+        the atlas has no .trim file.
+
+    """
+    trim_p = assets_dir.joinpath(f'{name}.trim')
+    if not trim_p.exists():
+        return dict()
+    return lib.read_aseprite_json(trim_p)
+
+
+def read_shared_layout(assets_dir: (str, Path)) -> dict:
+    """
+    Reads the layout of the shared pages in an assets folder.
+
+    Args:
+        assets_dir: The path to an assets folder.
+
+    Returns: A dictionary of each sprite group on a shared page and where
+        it was placed, as returned by sheets.share_pages, or an empty
+        dictionary if no groups are shared.
+
+    """
+    p = Path(assets_dir).joinpath(constants.SHARED_PAGES)
+    try:
+        with open(p, 'r') as r:
+            return json.load(r)
+    except (OSError, ValueError):
+        return dict()
+
+
+def update_shared_pages(
+        assets_dir: Path,
+        atlas: dict,
+        exported: dict,
+        share: int = None,
+        partial: bool = False) -> dict:
+    """
+    Moves the sprite groups whose spritesheets are no wider or taller
+    than share onto shared pages, and moves any groups that no longer
+    qualify back onto their own spritesheets. Each group keeps its own
+    spritesheet in the assets folder, so the shared pages can be packed
+    again whenever a group changes.
+
+    Args:
+        assets_dir: The path to an assets folder.
+        atlas: A dictionary of each sprite group in the build and its
+            atlas dictionary. Groups that move are updated in place.
+        exported: A dictionary of each sprite group exported in this
+            build and its atlas dictionary.
+        share: A number of pixels. If None, no groups will be shared.
+        partial: True if the build only covers some of the groups in the
+            assets folder, in which case groups that are already shared
+            but aren't in the build keep their place on the shared
+            pages, rather than being dropped from them.
+
+    Returns: A dictionary of each group whose atlas changed, including
+        any outside the build, and its new atlas dictionary.
+
+    """
+    d = assets_dir
+    old = read_shared_layout(d)
+    if not old and not share:
+        return dict()
+    unshared = dict()
+    for g, placement in old.items():
+        if g in exported.keys():
+            unshared[g] = exported[g]
+        elif g in atlas.keys():
+            unshared[g] = sheets.unshare_atlas(atlas[g], placement)
+        elif partial and d.joinpath(f'{g}.atlas').exists():
+            unshared[g] = sheets.unshare_atlas(
+                lib.read_aseprite_json(d.joinpath(f'{g}.atlas')), placement)
+    candidates = {**atlas, **unshared}
+    small = dict()
+    if share:
+        for g, contents in candidates.items():
+            if len(contents) == 1:
+                w, h = sheets.png_size(d.joinpath(next(iter(contents))))
+                if max(w, h) <= share:
+                    small[g] = contents
+    old_pages = {p['page'] for p in old.values()}
+    if (small.keys() == old.keys()
+            and not any(g in exported.keys() for g in small.keys())
+            and all(d.joinpath(p).exists() for p in old_pages)):
+        return dict()
+    print(f'-- Packing {len(small)} sprite groups onto shared pages...')
+    shared, layout = sheets.share_pages(d, small) if small else ({}, {})
+    new_pages = {p['page'] for p in layout.values()}
+    for page in old_pages - new_pages:
+        stem = re.escape(Path(page).stem)
+        stale_re = re.compile(stem + r'(@[\d.]+x)?\.png')
+        for f in d.iterdir():
+            if stale_re.match(f.name):
+                f.unlink()
+    layout_p = d.joinpath(constants.SHARED_PAGES)
+    if layout:
+        with open(layout_p, 'w') as w:
+            w.write(json.dumps(layout, indent=1, sort_keys=True))
+    elif layout_p.exists():
+        layout_p.unlink()
+    changed = {**{g: unshared[g] for g in old.keys() if g in unshared},
+               **shared}
+    for g, contents in changed.items():
+        if g in atlas.keys():
+            atlas[g] = contents
+    return changed
+
+
+def write_atlas(
+        assets_dir: Path,
+        name: str,
+        atlas: dict,
+        offsets: dict) -> list:
+    """
+    Writes an atlas to an assets folder, along with its binary index
+    and, if any of its frames were trimmed, its .trim file.
+
+    Args:
+        assets_dir: The path to an assets folder.
+        name: The name of the atlas, without the .atlas extension.
+        atlas: A kivy atlas dictionary.
+        offsets: A dictionary of trimmed frames and their offsets, as
+            returned by sheets.read_trim_offsets.
+
+    Returns: A list of the names of the files written.
+
+    """
+    written = [f'{name}.atlas', name + constants.ATLAS_INDEX_EXT]
+    with open(assets_dir.joinpath(f'{name}.atlas'), 'w') as w:
+        w.write(json.dumps(atlas))
+    atlas_index.write_atlas_index(
+        assets_dir.joinpath(name + constants.ATLAS_INDEX_EXT), atlas, offsets)
+    trim_p = assets_dir.joinpath(f'{name}.trim')
+    if len(offsets) > 0:
+        with open(trim_p, 'w') as w:
+            w.write(json.dumps(offsets))
+        written.append(trim_p.name)
+    elif trim_p.exists():
+        trim_p.unlink()
+    return written
+
+
+def remove_stale_variants(
+        assets_dir: Path,
+        names: Iterable[str],
+        scales: Iterable[float]) -> list:
+    """
+    Deletes the downscaled variants of a set of atlases and pngs whose
+    scale is no longer requested, along with their indexes, .trim files
+    and raw textures.
+
+    Args:
+        assets_dir: The path to an assets folder.
+        names: The names of atlases without their .atlas extension, or
+            of pngs, such as 'sprites_ball' or 'shared-0.png'.
+        scales: The scales of the variants to keep.
+
+    Returns: A list of the names of the files removed.
+
+    """
+    keep = {float(s) for s in scales}
+    stems = {Path(n).stem if n.endswith('.png') else n for n in names}
+    removed = []
+    if not stems:
+        return removed
+    variant_re = re.compile(
+        '(' + '|'.join(re.escape(s) for s in sorted(stems)) + r')@([\d.]+)x\.')
+    for f in sorted(assets_dir.iterdir()):
+        m = variant_re.match(f.name)
+        if m and float(m.group(2)) not in keep:
+            print(f'   > Removing stale {f.name}...')
+            f.unlink()
+            removed.append(f.name)
+    return removed
 
 
 def build_assets_folder(
@@ -138,7 +813,24 @@ def build_assets_folder(
         output_dir: str,
         ignore: list = None,
         filename_format: str = None,
-        sep: str = '_') -> dict:
+        sep: str = '_',
+        jobs: int = None,
+        force: bool = False,
+        groups: list = None,
+        backend: str = 'aseprite',
+        dedupe: bool = False,
+        trim: bool = False,
+        report: str = None,
+        budget: int = None,
+        ignore_dirs: list = None,
+        scan_cache: bool = False,
+        scales: list = None,
+        optimize: bool = False,
+        raw_textures: bool = False,
+        share: int = None,
+        keep_json: bool = False,
+        store: str = None,
+        store_budget: int = None) -> dict:
     """
     Creates an assets folder and populates it with exported aseprite
     file information.
@@ -154,6 +846,64 @@ def build_assets_folder(
             format. Controls how frames are named.
         sep: Will be used as the separator whenever combining file paths
             into strings.
+        jobs: The maximum number of aseprite exports to run at once. If
+            None, constants.DEFAULT_JOBS will be used.
+        force: If True, every group will be exported again, even if its
+            hash in the assets folder's build manifest shows it hasn't
+            changed since the last build.
+        groups: A list of group names. If passed, only these groups
+            will be built, and the rest of the assets folder will be
+            left as is. If None, the outputs of groups from earlier
+            builds whose files are gone will be removed.
+        backend: 'aseprite' to export with the aseprite CLI, or 'python'
+            to decode the aseprite files in-process.
+        dedupe: If True, frames with identical pixels will only be
+            stored once in each png, with every copy's name pointing at
+            the same rectangle in the atlas.
+        trim: If True, every frame will be cropped to its opaque pixels
+            before being packed, and a {group}.trim file holding each
+            frame's offset within its full size will be written next to
+            the group's atlas for Sprite to use.
+        report: A path. If passed, a json report of how long each group
+            took in each stage of the build, and how much texture memory
+            its spritesheets will need, will be written to it.
+        budget: A number of bytes. Groups whose spritesheets would need
+            more than this much uncompressed RGBA texture memory will be
+            flagged in the report and warned about.
+        ignore_dirs: A list of regex expressions, directories whose
+            names match any of the passed expressions will be skipped.
+        scan_cache: If True, the mtimes and contents of the directories
+            in input_dir will be cached in the assets folder, so that
+            directories that haven't changed aren't listed again on the
+            next build.
+        scales: A list of fractions, such as [0.5, 0.25]. For each, a
+            downscaled variant of every group's spritesheets and atlas
+            will be written, named by lib.variant_name, for Sprite to
+            load on devices with little texture memory.
+        optimize: If True, every png written by the build will be
+            recompressed losslessly, and converted to an indexed palette
+            png if it has few enough colors.
+        raw_textures: If True, a raw texture file of decoded pixels will
+            be written next to every png that doesn't have a current one,
+            for Sprite to upload without decoding the png.
+        share: A number of pixels. Sprite groups whose spritesheets are
+            no wider or taller than this will be packed together onto
+            shared pages, up to constants.OPEN_GL_LIMIT, so that small
+            groups don't each need their own texture. Each group keeps
+            its own .atlas, pointing at its shared page.
+        keep_json: If True, the aseprite json of every exported page
+            will be written to the assets folder. They are only kept for
+            inspection, the atlases are converted from the jsons in
+            memory either way.
+        store: A path to an artifact store, which may be shared with
+            other checkouts, see store.ArtifactStore. Groups that need
+            to be exported are fetched from it when it holds an export
+            of identical files with identical parameters, and every
+            group that is exported is published to it.
+        store_budget: A number of bytes. Once the exports are done, the
+            least recently used entries in the store are evicted until
+            it is no larger than this. If None,
+            constants.STORE_BUDGET will be used.
 
     Returns: A dictionary, the resulting atlas dictionary of the
         aseprite file export.
@@ -165,39 +915,423 @@ def build_assets_folder(
         f'[KIVYHELPER:build_assets] Creating and populating assets folder in '
         f'{d}...')
     d.mkdir(parents=True, exist_ok=True)
+    build_report = BuildReport(budget)
+    start = time.perf_counter()
+    cache = read_scan_cache(d) if scan_cache else None
     file_groups = collect_files(
-        input_dir, ignore, constants.ASE_EXTS, sep=sep)
+        input_dir, ignore, constants.ASE_EXTS, sep, ignore_dirs, cache)
+    if scan_cache:
+        write_scan_cache(d, cache)
+    if groups is not None:
+        file_groups = {
+            g: f for g, f in file_groups.items() if g in groups}
+    build_report.seconds['scan'] = time.perf_counter() - start
     print(f'-- Collected {len(file_groups)} sprite groups.')
-    for parent_dir, files in file_groups.items():
-        print(f'   > Assembling spritesheet and json for {parent_dir}...')
-        cli_str = assemble_aseprite_cli(
-            parent_dir,
-            files,
-            d,
-            filename_format
-        )
-        execute_cli_str(cli_str)
-        print(
-            f'       ~ Assembled {len(files)} aseprite files into '
-            f'{parent_dir}.png')
-    print('-- Aseprite exports completed.')
-    jsons = collect_files(d, ext='.json')[d.name]
-
-    print(f'-- Collected {len(jsons)} json files resulting from export.')
+    params = dict(
+        filename_format=filename_format or constants.DEFAULT_FF,
+        ignore=ignore or [],
+        inner_padding=constants.INNER_PADDING,
+        backend=backend,
+        dedupe=dedupe,
+        trim=trim,
+        optimize=optimize,
+        scales=sorted(set(scales or []) - {1}),
+    )
+    if groups is None:
+        # A full build covers every group, so any group from an earlier
+        # build that wasn't collected has had its files removed:
+        for g in sorted(read_build_manifest(d).keys() - file_groups.keys()):
+            print(f'-- Sprite group {g} was removed.')
+            remove_group_outputs(d, g)
+    manifest = read_build_manifest(d)
+    layout = read_shared_layout(d)
+    hashes = dict()
     atlas = dict()
-    print(f'-- Converting json files to atlas files...')
-    for file in jsons:
-        f = Path(file).stem
-        atlas[f] = convert_ase_json_to_atlas(
-            lib.read_aseprite_json(file)
-        )
-        # TODO: Remove aseprite jsons once converted to atlas?
-    print(f'-- Json conversions to atlas complete.')
+    for g, files in file_groups.items():
+        build_report.group(g)['files'] = len(files)
+        with build_report.timer(g, 'collect'):
+            hashes[g] = hash_group(files, input_dir, params)
+            atlas_p = d.joinpath(f'{g}.atlas')
+            if (not force and manifest.get(g) == hashes[g]
+                    and atlas_p.exists()):
+                with open(atlas_p, 'r') as r:
+                    existing = json.load(r)
+                images = list(existing.keys())
+                if g in layout.keys():
+                    images.append(layout[g]['image'])
+                if all(d.joinpath(img).exists() for img in images):
+                    atlas[g] = existing
+                    build_report.group(g)['cached'] = True
+    stale = {g: f for g, f in file_groups.items() if g not in atlas.keys()}
+    print(f'-- {len(atlas)} sprite groups are unchanged since the last '
+          f'build, {len(stale)} need to be exported.')
+    exported = dict()
+    offsets = dict()
+    # The files this build produced for each group, so that whatever a
+    # group's previous build produced and this one didn't can be removed:
+    produced = dict()
+    artifact_store = ArtifactStore(store, store_budget) if store else None
+    if artifact_store:
+        print(f'-- Fetching sprite groups from the artifact store in '
+              f'{store}...')
+        for g in list(stale.keys()):
+            with build_report.timer(g, 'export'):
+                entry = artifact_store.fetch(
+                    ArtifactStore.key(g, hashes[g]), d)
+            if entry:
+                exported[g] = entry['atlas']
+                offsets[g] = entry['offsets']
+                produced[g] = list(entry['pages'])
+                build_report.group(g)['fetched'] = True
+                del stale[g]
+        print(f'-- Fetched {len(exported)} sprite groups, '
+              f'{len(stale)} still need to be exported.')
+
+    # The pages of each exported group, to be published to the store
+    # once every post-processing stage has run on them:
+    to_publish = dict()
+
+    def _convert(g: str, group_pages: dict):
+        exported[g] = dict()
+        offsets[g] = dict()
+        produced[g] = []
+        for page, j in group_pages.items():
+            with build_report.timer(g, 'convert'):
+                exported[g].update(convert_ase_json_to_atlas(j))
+                if trim:
+                    offsets[g].update(sheets.read_trim_offsets(j))
+            produced[g].append(f'{page}.png')
+        if artifact_store:
+            to_publish[g] = list(produced[g])
+        if keep_json:
+            produced[g] += [f'{page}.json' for page in group_pages.keys()]
+
+    print(f'-- Assembling spritesheets...')
+    stages = []
+    if trim:
+        stages.append(sheets.trim_sheet)
+    if dedupe:
+        stages.append(sheets.dedupe_sheet)
+    results = export_groups(
+        stale, d, filename_format, jobs, backend, stages, build_report,
+        keep_json, _convert)
+    failed = [g for g, (code, _) in results.items() if code != 0]
+    for g in failed:
+        build_report.group(g)['exit_code'] = results[g][0]
+    if len(failed) > 0:
+        print(f'-- Warning: {len(failed)} aseprite exports failed: '
+              f'{", ".join(failed)}')
+    print(f'-- Aseprite exports completed and converted to '
+          f'{len(exported)} atlases.')
+    atlas.update(exported)
+    changed = update_shared_pages(
+        d, atlas, exported, share, groups is not None)
+    rewritten = {**exported, **changed}
     print(f'-- Writing atlases to {d}...')
-    for filename, contents in atlas.items():
+    written = dict()
+    for filename, contents in rewritten.items():
         print(f'   > Writing {filename}.atlas...')
-        with open(d.joinpath(f'{filename}.atlas'), 'w') as w:
-            w.write(json.dumps(contents))
+        with build_report.timer(filename, 'write'):
+            produced.setdefault(filename, []).extend(
+                write_atlas(d, filename, contents, (
+                    offsets[filename] if filename in offsets.keys()
+                    else read_trim_file(d, filename)
+                )))
+        written[filename] = list(contents.keys())
+    # Every frame on each page, including those of groups outside the
+    # build on shared pages, so that scaling a page keeps all of them:
+    page_rects = dict()
+    if scales:
+        others = {
+            g: lib.read_aseprite_json(d.joinpath(f'{g}.atlas'))
+            for g in read_shared_layout(d).keys()
+            if g not in atlas.keys() and g not in rewritten.keys()
+            and d.joinpath(f'{g}.atlas').exists()
+        }
+        for contents in {**others, **atlas, **rewritten}.values():
+            for image, frames in contents.items():
+                page_rects.setdefault(image, set()).update(
+                    tuple(r) for r in frames.values())
+    for scale in sorted(set(scales or []) - {1}, reverse=True):
+        print(f'-- Writing @{scale:g}x variants...')
+        scaled = dict()
+        for g, contents in {**atlas, **rewritten}.items():
+            name = lib.variant_name(g, scale)
+            if g not in rewritten.keys() and d.joinpath(
+                    f'{name}.atlas').exists():
+                continue
+            print(f'   > Writing {name}.atlas...')
+            with build_report.timer(g, 'write'):
+                group_offsets = (
+                    offsets[g] if g in offsets.keys()
+                    else read_trim_file(d, g)
+                )
+                variant, variant_offsets = sheets.scale_sheets(
+                    d, contents, group_offsets, scale, scaled, page_rects)
+                produced.setdefault(g, []).extend(
+                    write_atlas(d, name, variant, variant_offsets))
+            written.setdefault(g, []).extend(variant.keys())
+            produced[g].extend(variant.keys())
+    # Variants of scales that are no longer requested, including those of
+    # shared pages:
+    built = {**atlas, **rewritten}
+    removed = remove_stale_variants(
+        d, [*built.keys(), *(p for c in built.values() for p in c.keys())],
+        set(scales or []) - {1})
+    if optimize:
+        # Groups on shared pages keep their own spritesheets, which are
+        # published as well:
+        for g, pages in to_publish.items():
+            written.setdefault(g, []).extend(pages)
+        print(f'-- Optimizing {sum(len(p) for p in written.values())} '
+              f'pngs...')
+        saved = optimize_pngs(d, written, jobs, build_report)
+        print(f'-- Png optimization saved {saved} bytes.')
+    if raw_textures:
+        pages = dict()
+        for g, contents in atlas.items():
+            for page in contents.keys():
+                pages.setdefault(page, g)
+            for scale in set(scales or []) - {1}:
+                variant_p = d.joinpath(f'{lib.variant_name(g, scale)}.atlas')
+                if variant_p.exists():
+                    for page in lib.read_aseprite_json(variant_p).keys():
+                        pages.setdefault(page, g)
+        missing = [
+            page for page in pages.keys()
+            if not raw_texture.raw_texture_is_current(d.joinpath(page))
+        ]
+        print(f'-- Writing {len(missing)} raw textures...')
+        for page in missing:
+            raw_texture.write_raw_texture(d.joinpath(page))
+            produced.setdefault(pages[page], []).append(
+                page + constants.RAW_TEXTURE_EXT)
+    if artifact_store:
+        print(f'-- Publishing {len(to_publish)} sprite groups to the '
+              f'artifact store...')
+        for g, pages in to_publish.items():
+            artifact_store.publish(
+                ArtifactStore.key(g, hashes[g]), d, pages, exported[g],
+                offsets[g])
+        evicted = artifact_store.evict()
+        if evicted > 0:
+            print(f'-- Evicted {evicted} bytes from the artifact store.')
+    artifacts = read_build_artifacts(d)
+    for g, files in produced.items():
+        files = [
+            f for f in dict.fromkeys(files)
+            if not f.startswith(f'{constants.SHARED_PAGE}-')
+        ]
+        if g in exported.keys():
+            for f in set(artifacts.get(g, [])) - set(files):
+                if d.joinpath(f).exists():
+                    print(f'   > Removing stale {f}...')
+                    d.joinpath(f).unlink()
+            artifacts[g] = files
+        else:
+            artifacts[g] = list(dict.fromkeys(artifacts.get(g, []) + files))
+    artifacts = {
+        g: [f for f in files if f not in removed]
+        for g, files in artifacts.items()
+    }
+    write_build_manifest(d, {
+        **{g: h for g, h in manifest.items() if g not in file_groups.keys()},
+        **{g: hashes[g] for g in atlas.keys()},
+    }, artifacts)
+    atlas = {g: atlas[g] for g in file_groups.keys() if g in atlas.keys()}
+    for g, contents in atlas.items():
+        build_report.add_atlas(g, contents, d)
+        if build_report.group(g)['over_budget']:
+            print(f'-- Warning: {g} needs '
+                  f'{build_report.group(g)["texture_bytes"]} bytes of '
+                  f'texture memory, over the budget of {budget}.')
+    if report:
+        print(f'-- Writing build report to {report}...')
+        build_report.write(report)
     print(f'-- Write out complete. Build of assets folder complete.')
     lib.print_pycharm_bar()
     return atlas
+
+
+def snapshot_files(file_groups: dict) -> dict:
+    """
+    Records the modification time and size of every file in a set of
+    sprite groups.
+
+    Args:
+        file_groups: A dictionary of groups and their aseprite files, as
+            produced by collect_files.
+
+    Returns: A dictionary containing each file path and a tuple of its
+        group, modification time and size.
+
+    """
+    result = dict()
+    for group, files in file_groups.items():
+        for f in files:
+            try:
+                stat = os.stat(f)
+            except OSError:
+                continue
+            result[f] = (group, stat.st_mtime_ns, stat.st_size)
+    return result
+
+
+def diff_snapshots(old: dict, new: dict) -> (set, set):
+    """
+    Compares two results of snapshot_files.
+
+    Args:
+        old: The earlier snapshot.
+        new: The later snapshot.
+
+    Returns: A set of the groups that need to be rebuilt because one of
+        their files was changed, added or removed, and a set of the
+        groups that no longer have any files at all.
+
+    """
+    changed = set()
+    for f in old.keys() | new.keys():
+        if old.get(f) != new.get(f):
+            changed.update(s[0] for s in (old.get(f), new.get(f)) if s)
+    remaining = {s[0] for s in new.values()}
+    removed = {g for g in changed if g not in remaining}
+    return changed - removed, removed
+
+
+def remove_group_outputs(assets_dir: (str, Path), group: str) -> None:
+    """
+    Deletes the files exported for a group, including any downscaled
+    variants, from an assets folder and drops the group from the build
+    manifest.
+
+    Args:
+        assets_dir: The path to an assets folder.
+        group: The name of the group to remove.
+
+    Returns: None
+
+    """
+    d = Path(assets_dir)
+    variant_re = re.compile(re.escape(group) + r'@[\d.]+x\.atlas$')
+    names = [group] + [
+        f.name[:-len('.atlas')] for f in d.iterdir()
+        if variant_re.match(f.name)
+    ]
+    targets = []
+    for name in names:
+        targets += [
+            name + ext for ext in (
+                '.png', '.json', '.atlas', '.trim', constants.ATLAS_INDEX_EXT)
+        ]
+        atlas_p = d.joinpath(f'{name}.atlas')
+        if atlas_p.exists():
+            with open(atlas_p, 'r') as r:
+                for img in json.load(r).keys():
+                    if img.startswith(f'{constants.SHARED_PAGE}-'):
+                        continue
+                    targets += [
+                        img,
+                        str(Path(img).with_suffix('.json')),
+                        img + constants.RAW_TEXTURE_EXT
+                    ]
+    artifacts = read_build_artifacts(d)
+    targets += artifacts.pop(group, [])
+    for t in dict.fromkeys(targets):
+        p = d.joinpath(t)
+        if p.exists():
+            print(f'   > Removing {p.name}...')
+            p.unlink()
+    manifest = read_build_manifest(d)
+    if group in manifest.keys():
+        del manifest[group]
+    write_build_manifest(d, manifest, artifacts)
+    # The group's shared page is left for the next build to repack:
+    layout = read_shared_layout(d)
+    if group in layout.keys():
+        del layout[group]
+        with open(d.joinpath(constants.SHARED_PAGES), 'w') as w:
+            w.write(json.dumps(layout, indent=1, sort_keys=True))
+
+
+def watch_assets_folder(
+        input_dir: str,
+        output_dir: str,
+        ignore: list = None,
+        filename_format: str = None,
+        sep: str = '_',
+        jobs: int = None,
+        interval: float = 1.0,
+        debounce: float = 0.5,
+        ignore_dirs: list = None,
+        **kwargs) -> None:
+    """
+    Builds an assets folder and then keeps watching the input directory,
+    rebuilding only the sprite groups whose aseprite files are changed,
+    added or removed. Runs until interrupted with Ctrl+C.
+
+    Args:
+        input_dir: A string, the path to the directory to look for
+            aseprite files in.
+        output_dir: A string, the path to the directory to output png
+            and json files into once exported from aseprite.
+        ignore: A list of regex expressions, files whose names match
+            any of the passed expressions will be ignored.
+        filename_format: A string in the aseprite CLI filename-format
+            format. Controls how frames are named.
+        sep: Will be used as the separator whenever combining file paths
+            into strings.
+        jobs: The maximum number of aseprite exports to run at once. If
+            None, constants.DEFAULT_JOBS will be used.
+        interval: The number of seconds to wait between each check of
+            the input directory.
+        debounce: Once a change is seen, the input directory must go
+            this many seconds without further changes before the
+            rebuild starts, so that bursts of saves trigger only one
+            rebuild.
+        ignore_dirs: A list of regex expressions, directories whose
+            names match any of the passed expressions will be skipped.
+        **kwargs: Any other keyword arguments accepted by
+            build_assets_folder, such as backend or dedupe.
+
+    Returns: None
+
+    """
+    d = Path(output_dir).joinpath('assets')
+    build_assets_folder(
+        input_dir, output_dir, ignore, filename_format, sep, jobs,
+        ignore_dirs=ignore_dirs, **kwargs)
+    # Only directories that change between polls need to be listed
+    # again:
+    cache = dict()
+
+    def _snapshot():
+        return snapshot_files(collect_files(
+            input_dir, ignore, constants.ASE_EXTS, sep, ignore_dirs, cache))
+
+    snapshot = _snapshot()
+    print(f'[KIVYHELPER:build_assets] Watching {input_dir} for changes...')
+    try:
+        while True:
+            time.sleep(interval)
+            new = _snapshot()
+            if new == snapshot:
+                continue
+            while True:
+                time.sleep(debounce)
+                settled = _snapshot()
+                if settled == new:
+                    break
+                new = settled
+            changed, removed = diff_snapshots(snapshot, new)
+            snapshot = new
+            for g in sorted(removed):
+                print(f'-- Sprite group {g} was removed.')
+                remove_group_outputs(d, g)
+            if len(changed) > 0:
+                build_assets_folder(
+                    input_dir, output_dir, ignore, filename_format, sep,
+                    jobs, groups=sorted(changed), ignore_dirs=ignore_dirs,
+                    **kwargs)
+    except KeyboardInterrupt:
+        print(f'[KIVYHELPER:build_assets] Stopped watching {input_dir}.')
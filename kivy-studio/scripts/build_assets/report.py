@@ -0,0 +1,170 @@
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict
+
+from PIL import Image
+
+STAGES = ('collect', 'export', 'parse', 'convert', 'write', 'optimize')
+
+
+class BuildReport:
+    def __init__(self, budget: int = None):
+        """
+        Collects timings and texture sizes for each sprite group during
+        a build_assets_folder run, so that slow groups and groups that
+        take up too much of a device's texture memory can be found.
+
+        Args:
+            budget: A number of bytes. Any group whose uncompressed RGBA
+                textures would take up more than this will be flagged as
+                over budget. If None, no group is flagged.
+        """
+        self.budget = budget
+        self.groups: Dict[str, dict] = dict()
+        self.seconds: Dict[str, float] = dict()
+        self._start = time.perf_counter()
+
+    def group(self, name: str) -> dict:
+        """
+        Args:
+            name: The name of a sprite group.
+
+        Returns: The group's entry in the report, which will be created
+            if it doesn't exist yet.
+
+        """
+        if name not in self.groups.keys():
+            self.groups[name] = dict(
+                cached=False,
+                fetched=False,
+                exit_code=0,
+                files=0,
+                frames=0,
+                pages=[],
+                texture_bytes=0,
+                over_budget=False,
+                png=dict(
+                    bytes_before=0,
+                    bytes_after=0,
+                    decode_before=0.0,
+                    decode_after=0.0,
+                ),
+                seconds={s: 0.0 for s in STAGES},
+            )
+        return self.groups[name]
+
+    def add_time(self, group: str, stage: str, seconds: float) -> None:
+        """
+        Adds a number of seconds to one of a group's stages.
+
+        Args:
+            group: The name of a sprite group.
+            stage: One of STAGES.
+            seconds: The number of seconds to add.
+
+        Returns: None
+
+        """
+        self.group(group)['seconds'][stage] += seconds
+
+    @contextmanager
+    def timer(self, group: str, stage: str, exclude: str = None):
+        """
+        Times the block of code it wraps and adds the time to one of a
+        group's stages.
+
+        Args:
+            group: The name of a sprite group.
+            stage: One of STAGES.
+            exclude: Another of STAGES. Any time added to it while the
+                block runs will be left out of stage's time, so that
+                nested timings aren't counted twice.
+
+        Yields: None
+
+        """
+        seconds = self.group(group)['seconds']
+        before = seconds[exclude] if exclude else 0.0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if exclude:
+                elapsed -= seconds[exclude] - before
+            seconds[stage] += elapsed
+
+    def add_atlas(self, group: str, atlas: dict, assets_dir: Path) -> None:
+        """
+        Records the frames and texture pages of a group's atlas.
+
+        Args:
+            group: The name of a sprite group.
+            atlas: The group's kivy atlas dictionary.
+            assets_dir: The folder the atlas' images are in.
+
+        Returns: None
+
+        """
+        g = self.group(group)
+        for image, frames in atlas.items():
+            with Image.open(Path(assets_dir).joinpath(image)) as img:
+                w, h = img.size
+            g['frames'] += len(frames)
+            g['pages'].append(dict(image=image, w=w, h=h))
+            g['texture_bytes'] += w * h * 4
+        if self.budget is not None:
+            g['over_budget'] = g['texture_bytes'] > self.budget
+
+    def add_png(self, group: str, stats: dict) -> None:
+        """
+        Records the size and decode time of one of a group's pngs before
+        and after it was optimized.
+
+        Args:
+            group: The name of a sprite group.
+            stats: A dictionary, as returned by sheets.optimize_png.
+
+        Returns: None
+
+        """
+        png = self.group(group)['png']
+        for k, v in stats.items():
+            png[k] += v
+
+    def to_dict(self) -> dict:
+        """
+        Returns: The report as a dictionary, with build-wide totals.
+
+        """
+        return dict(
+            seconds=dict(
+                total=time.perf_counter() - self._start, **self.seconds),
+            budget=self.budget,
+            # Pages shared by several groups are only counted once:
+            texture_bytes=sum({
+                p['image']: p['w'] * p['h'] * 4
+                for g in self.groups.values() for p in g['pages']
+            }.values()),
+            over_budget=[
+                k for k, g in self.groups.items() if g['over_budget']],
+            png_bytes_saved=sum(
+                g['png']['bytes_before'] - g['png']['bytes_after']
+                for g in self.groups.values()),
+            groups=self.groups,
+        )
+
+    def write(self, file_path: (str, Path)) -> None:
+        """
+        Writes the report to a json file.
+
+        Args:
+            file_path: The path to write the report to.
+
+        Returns: None
+
+        """
+        with open(file_path, 'w') as w:
+            w.write(json.dumps(self.to_dict(), indent=1))
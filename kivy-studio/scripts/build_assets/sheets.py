@@ -0,0 +1,435 @@
+import hashlib
+import io
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Iterable
+
+from PIL import Image
+
+from kivyhelper import constants, lib
+from kivyhelper.scripts.build_assets.aseprite import pack_rects
+
+
+def frame_box(frame: dict) -> tuple:
+    """
+    Args:
+        frame: The frame dictionary of a frame in an aseprite json.
+
+    Returns: The frame's rectangle as a left, top, right, bottom tuple.
+
+    """
+    return (
+        frame['x'],
+        frame['y'],
+        frame['x'] + frame['w'],
+        frame['y'] + frame['h']
+    )
+
+
+def png_size(png_path: (str, Path)) -> (int, int):
+    """
+    Args:
+        png_path: The path to a png file.
+
+    Returns: The width and height of the png, read from its header.
+
+    """
+    with Image.open(png_path) as img:
+        return img.size
+
+
+def repack_sheet(sheet_path: (str, Path), j: dict, images: list) -> None:
+    """
+    Packs a set of frame images into a new spritesheet, overwriting the
+    png at sheet_path and updating the json dictionary in place.
+
+    Args:
+        sheet_path: The path to the spritesheet png.
+        j: The aseprite json dictionary. The frame dictionaries of each
+            frame must contain an 'idx' key pointing at the image in
+            images they should use. The key is removed once the frame
+            is placed.
+        images: A list of PIL Images, the unique frame images.
+
+    Returns: None
+
+    """
+    positions, w, h = pack_rects([img.size for img in images])
+    sheet = Image.new('RGBA', (w, h), (0, 0, 0, 0))
+    for img, pos in zip(images, positions):
+        sheet.paste(img, pos)
+    for f in j['frames'].values():
+        idx = f['frame'].pop('idx')
+        f['frame']['x'], f['frame']['y'] = positions[idx]
+    j['meta']['size'] = dict(w=w, h=h)
+    sheet.save(sheet_path)
+
+
+def dedupe_sheet(sheet_path: (str, Path), j: dict) -> int:
+    """
+    Finds frames in a spritesheet whose pixels are identical, and
+    repacks the spritesheet so that each unique frame is only stored
+    once. Every duplicate frame keeps its name in the json, but points
+    at the same rectangle as the frame it duplicates.
+
+    Args:
+        sheet_path: The path to the spritesheet png. Will be overwritten
+            if any duplicates are found.
+        j: The aseprite json dictionary describing the spritesheet. Will
+            be updated in place.
+
+    Returns: The number of frames that were removed from the png.
+
+    """
+    sheet = Image.open(sheet_path).convert('RGBA')
+    images = []
+    seen = dict()
+    boxes = set()
+    for f in j['frames'].values():
+        boxes.add(frame_box(f['frame']))
+        img = sheet.crop(frame_box(f['frame']))
+        key = (img.size, hashlib.sha1(img.tobytes()).digest())
+        if key not in seen.keys():
+            seen[key] = len(images)
+            images.append(img)
+        f['frame']['idx'] = seen[key]
+    removed = len(boxes) - len(images)
+    if removed > 0:
+        repack_sheet(sheet_path, j, images)
+    return removed
+
+
+def trim_sheet(sheet_path: (str, Path), j: dict) -> int:
+    """
+    Crops every frame in a spritesheet down to its opaque pixels, plus
+    constants.INNER_PADDING, and repacks the spritesheet. Each trimmed
+    frame is marked as trimmed in the json, with spriteSourceSize
+    holding the cropped rectangle's position within the frame and
+    sourceSize holding the frame's full size, as aseprite does.
+
+    Args:
+        sheet_path: The path to the spritesheet png. Will be overwritten.
+        j: The aseprite json dictionary describing the spritesheet. Will
+            be updated in place.
+
+    Returns: The number of pixels the trim saved in the png.
+
+    """
+    sheet = Image.open(sheet_path).convert('RGBA')
+    pad = constants.INNER_PADDING
+    images = []
+    seen = dict()
+    for f in j['frames'].values():
+        fr = f['frame']
+        box = frame_box(fr)
+        img = sheet.crop(box)
+        bbox = img.getchannel('A').getbbox() or (0, 0, 1, 1)
+        crop = (
+            max(0, bbox[0] - pad),
+            max(0, bbox[1] - pad),
+            min(img.width, bbox[2] + pad),
+            min(img.height, bbox[3] + pad)
+        )
+        if box not in seen.keys():
+            seen[box] = len(images)
+            images.append(img.crop(crop))
+        # Frames that were already trimmed keep their original offset
+        # and full size:
+        x, y = 0, 0
+        if f.get('trimmed'):
+            x, y = f['spriteSourceSize']['x'], f['spriteSourceSize']['y']
+        else:
+            f['sourceSize'] = dict(w=fr['w'], h=fr['h'])
+        f['trimmed'] = True
+        fr['w'], fr['h'] = crop[2] - crop[0], crop[3] - crop[1]
+        fr['idx'] = seen[box]
+        f['spriteSourceSize'] = dict(
+            x=x + crop[0], y=y + crop[1], w=fr['w'], h=fr['h'])
+    before = sheet.width * sheet.height
+    repack_sheet(sheet_path, j, images)
+    return before - j['meta']['size']['w'] * j['meta']['size']['h']
+
+
+def read_trim_offsets(j: dict) -> dict:
+    """
+    Collects the offsets of every trimmed frame in an aseprite json, in
+    kivy's coordinates (origin at the bottom left).
+
+    Args:
+        j: An aseprite json dictionary.
+
+    Returns: A dictionary containing each trimmed frame's name and a list
+        of its x and y offset within its full frame, and the full
+        frame's width and height.
+
+    """
+    result = dict()
+    for name, f in j['frames'].items():
+        if f.get('trimmed'):
+            src = f['spriteSourceSize']
+            full = f['sourceSize']
+            result[name] = [
+                src['x'],
+                full['h'] - src['y'] - src['h'],
+                full['w'],
+                full['h']
+            ]
+    return result
+
+
+def scale_frames(
+        img: Image.Image,
+        rects: Iterable,
+        scale: float) -> (Image.Image, dict):
+    """
+    Scales each frame of a spritesheet down on its own and packs them
+    onto a new sheet, with constants.INNER_PADDING around each one, so
+    that neighbouring frames never bleed into each other however small
+    the scale. Integer factors, such as 0.5 and 0.25, use nearest
+    neighbour resampling, which keeps pixel art crisp.
+
+    Args:
+        img: An RGBA PIL Image, the full resolution spritesheet.
+        rects: An iterable of the x, y, width and height of the frames
+            on the sheet, in kivy's coordinates. Any pixels outside of
+            them are dropped.
+        scale: The fraction of full resolution to scale down to.
+
+    Returns: A tuple of the scaled sheet, and a dictionary of each rect,
+        as a tuple, and its rect on the scaled sheet.
+
+    """
+    pad = constants.INNER_PADDING
+    factor = 1 / scale
+    resample = (
+        Image.NEAREST if abs(factor - round(factor)) < 1e-9 else Image.BOX)
+    # Sorted, so that the same frames always produce the same sheet:
+    rects = sorted({tuple(r) for r in rects})
+    sizes = [
+        (max(1, round(w * scale)), max(1, round(h * scale)))
+        for _, _, w, h in rects
+    ]
+    positions, w, h = pack_rects(
+        [(fw + pad * 2, fh + pad * 2) for fw, fh in sizes])
+    sheet = Image.new('RGBA', (max(1, w), max(1, h)), (0, 0, 0, 0))
+    layout = dict()
+    for (x, y, fw, fh), (sw, sh), (px, py) in zip(rects, sizes, positions):
+        top = img.height - y - fh
+        frame = img.crop((x, top, x + fw, top + fh)).resize(
+            (sw, sh), resample)
+        sheet.paste(frame, (px + pad, py + pad))
+        layout[(x, y, fw, fh)] = [
+            px + pad, sheet.height - py - pad - sh, sw, sh]
+    return sheet, layout
+
+
+def scale_sheets(
+        assets_dir: (str, Path),
+        atlas: dict,
+        offsets: dict,
+        scale: float,
+        scaled: dict = None,
+        page_rects: dict = None) -> (dict, dict):
+    """
+    Writes a downscaled copy of each spritesheet in an atlas, for
+    devices with little texture memory, via scale_frames.
+
+    Args:
+        assets_dir: The folder the atlas' images are in. The downscaled
+            images will be saved next to them, named by
+            lib.variant_name.
+        atlas: A kivy atlas dictionary of image names and their frames.
+        offsets: A dictionary of trimmed frames and their offsets, as
+            returned by read_trim_offsets.
+        scale: The fraction of full resolution to scale down to.
+        scaled: A dictionary of the images that have already been
+            scaled down, such as shared pages, and their layouts as
+            returned by scale_frames. They won't be scaled again. Images
+            scaled by this call are added to it.
+        page_rects: A dictionary of images and the rects of every frame
+            on them, for images shared by several atlases. Images that
+            aren't in it are scaled with only atlas' frames.
+
+    Returns: A tuple of the scaled atlas dictionary and the scaled
+        offsets dictionary.
+
+    """
+    d = Path(assets_dir)
+    scaled = dict() if scaled is None else scaled
+    page_rects = page_rects or dict()
+    result = dict()
+    for image, frames in atlas.items():
+        name = lib.variant_name(image, scale)
+        if image not in scaled.keys():
+            rects = page_rects.get(image) or frames.values()
+            with Image.open(d.joinpath(image)) as img:
+                sheet, scaled[image] = scale_frames(
+                    img.convert('RGBA'), rects, scale)
+            sheet.save(d.joinpath(name))
+        result[name] = {
+            f: scaled[image][tuple(r)] for f, r in frames.items()}
+    return result, {
+        f: [round(v * scale) for v in o] for f, o in offsets.items()
+    }
+
+
+def _decode(path: (str, Path)) -> (Image.Image, float):
+    start = time.perf_counter()
+    img = Image.open(path)
+    img.load()
+    return img, time.perf_counter() - start
+
+
+def to_palette(img: Image.Image) -> (Image.Image, None):
+    """
+    Converts an RGBA image to an indexed palette image without losing
+    any colors, if it has few enough colors to fit in a palette.
+
+    Args:
+        img: An RGBA PIL Image.
+
+    Returns: A P mode PIL Image with an RGBA palette, or None if img has
+        more than 256 colors.
+
+    """
+    colors = img.getcolors(256)
+    if colors is None:
+        return None
+    # Opaque colors go last, so the png's transparency chunk is short:
+    colors = sorted((c for _, c in colors), key=lambda c: c[3])
+    pixels = memoryview(img.tobytes()).cast('I')
+    if pixels.itemsize != 4:
+        return None
+    lut = {
+        int.from_bytes(bytes(c), sys.byteorder): i
+        for i, c in enumerate(colors)
+    }
+    pal = Image.frombytes('P', img.size, bytes(map(lut.__getitem__, pixels)))
+    pal.putpalette(b''.join(bytes(c) for c in colors), rawmode='RGBA')
+    return pal
+
+
+def optimize_png(png_path: (str, Path)) -> dict:
+    """
+    Recompresses a png losslessly, as an indexed palette image if it has
+    256 colors or fewer. The png is only overwritten if the result is
+    smaller and decodes to exactly the same pixels.
+
+    Args:
+        png_path: The path to a png file.
+
+    Returns: A dictionary containing the png's size in bytes and the
+        seconds it took to decode, before and after.
+
+    """
+    before = os.path.getsize(png_path)
+    img, decode_before = _decode(png_path)
+    img = img.convert('RGBA')
+    best = None
+    for candidate in (to_palette(img), img):
+        if candidate is None:
+            continue
+        buf = io.BytesIO()
+        candidate.save(buf, 'PNG', optimize=True)
+        if best is None or buf.tell() < best.tell():
+            best = buf
+    result = dict(
+        bytes_before=before,
+        bytes_after=before,
+        decode_before=decode_before,
+        decode_after=decode_before,
+    )
+    if best.tell() < before:
+        tmp_p = Path(str(png_path) + '.tmp')
+        with open(tmp_p, 'wb') as w:
+            w.write(best.getvalue())
+        new, decode_after = _decode(tmp_p)
+        if new.convert('RGBA').tobytes() == img.tobytes():
+            os.replace(tmp_p, png_path)
+            result.update(bytes_after=best.tell(), decode_after=decode_after)
+        else:
+            tmp_p.unlink()
+    return result
+
+
+def share_pages(
+        assets_dir: (str, Path),
+        atlases: dict,
+        limit: int = None) -> (dict, dict):
+    """
+    Packs the spritesheets of several sprite groups onto shared pages,
+    so that groups with small spritesheets don't each need their own
+    texture. Each group's spritesheet is placed whole, and groups are
+    placed in order of name, so the same groups always produce the same
+    pages.
+
+    Args:
+        assets_dir: The folder the groups' spritesheets are in. The
+            shared pages will be saved in it as well, named
+            constants.SHARED_PAGE-0.png, constants.SHARED_PAGE-1.png,
+            etc.
+        atlases: A dictionary of sprite groups and their kivy atlas
+            dictionaries. Each atlas must have a single page.
+        limit: The maximum width and height of a shared page. If None,
+            constants.OPEN_GL_LIMIT will be used.
+
+    Returns: A tuple of a dictionary of each group and its atlas on the
+        shared pages, and a dictionary of each group and where its
+        spritesheet was placed, for unshare_atlas.
+
+    """
+    d = Path(assets_dir)
+    limit = limit or constants.OPEN_GL_LIMIT
+    sizes = {
+        g: png_size(d.joinpath(next(iter(atlases[g]))))
+        for g in sorted(atlases.keys())
+    }
+    bins = [[]]
+    for g in sizes.keys():
+        _, w, h = pack_rects([sizes[x] for x in bins[-1] + [g]])
+        if len(bins[-1]) > 0 and max(w, h) > limit:
+            bins.append([])
+        bins[-1].append(g)
+    shared = dict()
+    layout = dict()
+    for i, groups in enumerate(b for b in bins if len(b) > 0):
+        page = f'{constants.SHARED_PAGE}-{i}.png'
+        positions, w, h = pack_rects([sizes[g] for g in groups])
+        sheet = Image.new('RGBA', (w, h), (0, 0, 0, 0))
+        for g, (x, y) in zip(groups, positions):
+            image, frames = next(iter(atlases[g].items()))
+            gw, gh = sizes[g]
+            with Image.open(d.joinpath(image)) as img:
+                sheet.paste(img.convert('RGBA'), (x, y))
+            layout[g] = dict(image=image, page=page, x=x, y=y, w=gw, h=gh,
+                             page_h=h)
+            # Atlas rectangles are measured from the bottom left:
+            dy = h - y - gh
+            shared[g] = {page: {
+                f: [r[0] + x, r[1] + dy, r[2], r[3]]
+                for f, r in frames.items()
+            }}
+        sheet.save(d.joinpath(page))
+    return shared, layout
+
+
+def unshare_atlas(atlas: dict, placement: dict) -> dict:
+    """
+    Undoes share_pages for a single group.
+
+    Args:
+        atlas: The group's kivy atlas dictionary on its shared page.
+        placement: The group's entry in the layout returned by
+            share_pages.
+
+    Returns: The group's kivy atlas dictionary on its own spritesheet.
+
+    """
+    p = placement
+    dy = p['page_h'] - p['y'] - p['h']
+    return {p['image']: {
+        f: [r[0] - p['x'], r[1] - dy, r[2], r[3]]
+        for f, r in atlas[p['page']].items()
+    }}
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from kivyhelper import constants
+
+# Bumped whenever the layout of an entry changes, so that entries
+# published by older versions are never fetched:
+VERSION = 1
+
+
+class ArtifactStore:
+    def __init__(self, root: (str, Path), budget: int = None):
+        """
+        A content-addressed store of exported sprite groups, which can
+        be shared between checkouts, branches and developers, for
+        example on a network drive. Each entry holds a group's
+        spritesheets along with its converted atlas, keyed by the
+        group's name and the hash of its aseprite files and build
+        parameters, so that identical inputs are only ever exported
+        once.
+
+        Entries are laid out as {root}/{key[:2]}/{key}/, and are
+        published by renaming a finished temporary directory into place,
+        so that concurrent builds never see half-written entries. An
+        entry's mtime is updated each time it is fetched, and evict
+        removes the least recently used entries first.
+
+        Args:
+            root: The directory the store lives in. Will be created if
+                it doesn't exist.
+            budget: The number of bytes evict will shrink the store to.
+                If None, constants.STORE_BUDGET will be used.
+
+        A store that can't be reached or written to, such as a full or
+        stale network mount, never fails a build: fetches miss, and
+        publishing and evicting do nothing.
+        """
+        self.root = Path(root)
+        self.budget = constants.STORE_BUDGET if budget is None else budget
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            pass
+
+    @staticmethod
+    def key(group: str, group_hash: str) -> str:
+        """
+        Args:
+            group: The name of a sprite group.
+            group_hash: The group's hash, as returned by
+                build_assets.lib.hash_group.
+
+        Returns: A string, the group's key in the store. The name is
+            part of the key, since it is part of every file name and
+            atlas the group's export produces.
+
+        """
+        return hashlib.sha1(
+            f'{VERSION}\n{group}\n{group_hash}'.encode()).hexdigest()
+
+    def entry_dir(self, key: str) -> Path:
+        """
+        Args:
+            key: A key, as returned by ArtifactStore.key.
+
+        Returns: The directory the key's entry is (or would be) in.
+
+        """
+        return self.root.joinpath(key[:2], key)
+
+    def fetch(self, key: str, assets_dir: (str, Path)) -> (dict, None):
+        """
+        Copies an entry's spritesheets into an assets folder.
+
+        Args:
+            key: A key, as returned by ArtifactStore.key.
+            assets_dir: The path to an assets folder.
+
+        Returns: The entry's dictionary, containing the group's pages,
+            its atlas and the offsets of its trimmed frames, or None if
+            the store has no (complete) entry for the key.
+
+        """
+        e_dir = self.entry_dir(key)
+        try:
+            with open(e_dir.joinpath(constants.STORE_ENTRY), 'r') as r:
+                entry = json.load(r)
+            for page in entry['pages']:
+                shutil.copyfile(
+                    e_dir.joinpath(page), Path(assets_dir).joinpath(page))
+            os.utime(e_dir)
+        except (OSError, ValueError, KeyError):
+            # Missing, or evicted by another build while being copied:
+            return None
+        return entry
+
+    def publish(
+            self,
+            key: str,
+            assets_dir: (str, Path),
+            pages: list,
+            atlas: dict,
+            offsets: dict) -> bool:
+        """
+        Adds a group's exported spritesheets and atlas to the store.
+        Does nothing if the store already has an entry for the key.
+
+        Args:
+            key: A key, as returned by ArtifactStore.key.
+            assets_dir: The path to the assets folder the spritesheets
+                were exported to.
+            pages: A list of the names of the group's spritesheets.
+            atlas: The group's kivy atlas dictionary.
+            offsets: A dictionary of the group's trimmed frames and
+                their offsets, as returned by sheets.read_trim_offsets.
+
+        Returns: True if a new entry was published.
+
+        """
+        e_dir = self.entry_dir(key)
+        tmp_dir = None
+        try:
+            if e_dir.exists():
+                return False
+            e_dir.parent.mkdir(parents=True, exist_ok=True)
+            tmp_dir = Path(
+                tempfile.mkdtemp(prefix='.tmp-', dir=e_dir.parent))
+            for page in pages:
+                shutil.copyfile(
+                    Path(assets_dir).joinpath(page), tmp_dir.joinpath(page))
+            with open(tmp_dir.joinpath(constants.STORE_ENTRY), 'w') as w:
+                w.write(json.dumps(
+                    dict(pages=pages, atlas=atlas, offsets=offsets)))
+            os.rename(tmp_dir, e_dir)
+        except OSError:
+            # Another build published the same entry first, or the store
+            # can't be written to:
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+        return True
+
+    def entries(self) -> list:
+        """
+        Returns: A list of tuples of each entry's directory, its size in
+            bytes, and the time it was last published or fetched, least
+            recently used first.
+
+        """
+        result = []
+        try:
+            prefixes = [p for p in os.scandir(self.root) if p.is_dir()]
+        except OSError:
+            return result
+        for prefix in prefixes:
+            try:
+                e_dirs = list(os.scandir(prefix.path))
+            except OSError:
+                continue
+            for e in e_dirs:
+                if not e.is_dir() or e.name.startswith('.tmp-'):
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(e.path))
+                    result.append(
+                        (Path(e.path), size, e.stat().st_mtime_ns))
+                except OSError:
+                    continue
+        return sorted(result, key=lambda x: x[2])
+
+    def evict(self) -> int:
+        """
+        Removes the least recently used entries until the store is no
+        larger than its budget.
+
+        Returns: The number of bytes removed.
+
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for e_dir, size, _ in entries:
+            if total - removed <= self.budget:
+                break
+            shutil.rmtree(e_dir, ignore_errors=True)
+            removed += size
+        return removed
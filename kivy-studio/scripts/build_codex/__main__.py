@@ -0,0 +1,42 @@
+import argparse
+
+from kivyhelper.scripts.build_codex.lib import build_codex_bundle
+
+
+def assemble_args():
+    """
+    Collects the necessary args for the build_codex script.
+
+    Returns: The collected args Namespace.
+
+    """
+    parser = argparse.ArgumentParser(
+        "Pack a directory of jsonl files into a single Codex bundle, for "
+        "Codex.from_bundle to load."
+    )
+
+    parser.add_argument(
+        '--input_dir',
+        '-i',
+        required=True,
+        help='The path to the directory containing the jsonl files.'
+    )
+
+    parser.add_argument(
+        '--output_dir',
+        '-o',
+        required=True,
+        help='The path to the directory to write the bundle to.'
+    )
+
+    parser.add_argument(
+        '--name',
+        '-n',
+        help='The name of the bundle file. Default is codex.bundle.'
+    )
+
+    return parser.parse_args()
+
+
+args = assemble_args()
+build_codex_bundle(args.input_dir, args.output_dir, args.name)
@@ -0,0 +1,45 @@
+from pathlib import Path
+
+from kivyhelper import codex_bundle, constants, lib
+from kivyhelper.codex import Codex
+
+
+def build_codex_bundle(
+        input_dir: (str, Path),
+        output_dir: (str, Path),
+        bundle_name: str = None) -> Path:
+    """
+    Packs every jsonl file in a directory, as read by Codex.from_dir,
+    into a single bundle for Codex.from_bundle to memory-map in release
+    builds. Each file becomes a node named after it, and files are
+    decoded one line at a time, so that they never have to fit in
+    memory whole.
+
+    Args:
+        input_dir: The path to the directory containing the jsonl files.
+        output_dir: The path to the directory to write the bundle to.
+            Will be created if it doesn't exist.
+        bundle_name: The name of the bundle file. If None,
+            constants.CODEX_BUNDLE will be used.
+
+    Returns: The path to the bundle.
+
+    """
+    lib.print_pycharm_bar()
+    input_dir = Path(input_dir)
+    files = sorted(p for p in input_dir.iterdir() if p.suffix == '.jsonl')
+    print(f'[KIVYHELPER:build_codex] Packing {len(files)} jsonl files from '
+          f'{input_dir}...')
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    bundle_p = output_dir.joinpath(bundle_name or constants.CODEX_BUNDLE)
+
+    def _records(p: Path):
+        print(f'   > Packing {p.name}...')
+        yield from Codex._iter_jsonlines(p)
+
+    total = codex_bundle.write_bundle(
+        {p.stem: _records(p) for p in files}, bundle_p)
+    print(f'-- Wrote {total} records to {bundle_p}.')
+    lib.print_pycharm_bar()
+    return bundle_p
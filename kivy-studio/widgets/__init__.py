@@ -1,9 +1,9 @@
-from .sprite import Sprite, AnimRule
+from .sprite import Sprite, AnimRule, RawAtlas
 from .dialogue import DialogueBox, DialogueLine, DialogueLines
 from .behavior import MouseoverBehavior, TooltipBehavior
 from ._misc import WrapLabel
 
 __all__ = [
-    'Sprite', 'AnimRule', 'DialogueBox', 'DialogueLine', 'DialogueLines',
-    'MouseoverBehavior', 'WrapLabel', 'TooltipBehavior'
+    'Sprite', 'AnimRule', 'RawAtlas', 'DialogueBox', 'DialogueLine',
+    'DialogueLines', 'MouseoverBehavior', 'WrapLabel', 'TooltipBehavior'
 ]
@@ -1,16 +1,27 @@
 from __future__ import annotations
 
+import json
+import os
 import re
+import struct
+from functools import partial
 from pathlib import Path
 from random import sample
 from typing import Dict, Tuple, List
 
 from kivy.atlas import Atlas
+from kivy.cache import Cache
 from kivy.clock import Clock
+from kivy.core.image import Image as CoreImage
+from kivy.graphics.texture import Texture
+from kivy.lang import Builder
 from kivy.uix.image import Image
-from kivy.properties import (ObjectProperty, StringProperty, NumericProperty)
+from kivy.properties import (
+    ListProperty, ObjectProperty, StringProperty, NumericProperty
+)
+from PIL import Image as PILImage
 
-from kivyhelper import constants
+from kivyhelper import atlas_index, constants, lib, raw_texture
 
 
 class AnimRule:
@@ -223,6 +234,113 @@ class AnimRule:
         return self
 
 
+class RawAtlas(Atlas):
+    """
+    An Atlas that uploads each of its pages straight from the raw
+    texture file build_assets wrote for it, skipping png decoding. Pages
+    without a current raw texture file are loaded from their png, as
+    Atlas would.
+    """
+    def _load(self) -> None:
+        filename = self._filename.replace('/', os.sep)
+        d = os.path.dirname(filename)
+        textures = dict()
+        for page, frames in self.read_regions(filename).items():
+            texture = self.load_page(os.path.join(d, page))
+            self.original_textures.append(texture)
+            for name, rect in frames.items():
+                textures[name] = texture.get_region(*rect)
+        self.textures = textures
+
+    @staticmethod
+    def read_regions(atlas_path: str) -> Dict[str, Dict[str, list]]:
+        """
+        Reads every region of an atlas from its binary index if it is up
+        to date, which needs no json parsing, or otherwise from the
+        .atlas file itself. Either way the regions are the same.
+
+        Args:
+            atlas_path: The path to a .atlas file.
+
+        Returns: A dictionary of each of the atlas' pages and its frames
+            and their rectangles, like the .atlas file's contents.
+
+        """
+        stem = os.path.splitext(atlas_path)[0]
+        if atlas_index.index_is_current(stem):
+            try:
+                idx = atlas_index.read_atlas_index(
+                    stem + constants.ATLAS_INDEX_EXT)
+            except (OSError, ValueError, struct.error):
+                idx = None
+            if idx is not None:
+                regions = {p: dict() for p in idx['pages']}
+                for name, (page, *rect) in idx['rects'].items():
+                    regions[idx['pages'][page]][name] = rect
+                return regions
+        with open(atlas_path, 'r') as r:
+            return json.load(r)
+
+    @staticmethod
+    def load_page(png_path: str) -> Texture:
+        """
+        Args:
+            png_path: The path to an atlas page's png.
+
+        Returns: The page's texture, uploaded from its raw texture file
+            if it has a current one, otherwise decoded from the png, or
+            the already loaded texture if another atlas shares the page. If
+            constants.WRITE_RAW_TEXTURES is True, the raw texture file
+            is written first, so later loads can use it.
+
+        """
+        # Pages shared by several atlases are only uploaded once:
+        uid = f'{png_path}|0|0'
+        texture = Cache.get('kv.texture', uid)
+        if texture:
+            return texture
+        raw = raw_texture.read_raw_texture(png_path)
+        if raw is None and constants.WRITE_RAW_TEXTURES:
+            raw_texture.write_raw_texture(png_path)
+            raw = raw_texture.read_raw_texture(png_path)
+        if raw is None:
+            return CoreImage(png_path).texture
+        w, h, pixels = raw
+        texture = Texture.create(size=(w, h), colorfmt='rgba')
+        texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+        # The pixels are stored top row first, like a decoded png:
+        texture.flip_vertical()
+        # Textures created from buffers come back blank after the GL
+        # context is lost (on Android, when the app is resumed for
+        # example), unless they are blitted again:
+        texture.add_reload_observer(partial(RawAtlas.reload_page, png_path))
+        Cache.append('kv.texture', uid, texture)
+        return texture
+
+    @staticmethod
+    def reload_page(png_path: str, texture: Texture) -> None:
+        """
+        Blits a page's pixels into its texture again from its raw
+        texture file, or from its png if the file is gone, after the GL
+        context has been lost.
+
+        Args:
+            png_path: The path to the atlas page's png.
+            texture: The page's texture, as returned by load_page.
+
+        Returns: None
+
+        """
+        raw = raw_texture.read_raw_texture(png_path)
+        if raw is not None:
+            pixels = raw[2]
+        else:
+            # Decoded the same way write_raw_texture does, top row first:
+            with PILImage.open(png_path) as img:
+                pixels = img.convert('RGBA').tobytes()
+        texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+
+
 class Sprite(Image):
     _atlas = ObjectProperty()
     mode = StringProperty('continue')
@@ -231,6 +349,7 @@ class Sprite(Image):
     rate = NumericProperty(0.15)
     frame = NumericProperty(0)
     fps = NumericProperty(1.0 / 6.0)
+    trim_rect = ListProperty([0, 0, 0, 0])
 
     @property
     def frames(self) -> Dict[str, List[str]]:
@@ -293,7 +412,17 @@ class Sprite(Image):
             self.persist_rule = persist_rule
         self._anim_tag: str = ''
         self._frames: Dict[str, List[str]] = dict()
+        self._offsets: Dict[str, List[int]] = dict()
+        self._frame_key: str = ''
         self._atlas: str = ''
+        self._scale: float = 1.0
+        self.bind(
+            texture=self._update_trim_rect,
+            pos=self._update_trim_rect,
+            size=self._update_trim_rect,
+            allow_stretch=self._update_trim_rect,
+            keep_ratio=self._update_trim_rect,
+        )
         self.link_atlas(atlas)
 
     def link_atlas(
@@ -301,10 +430,12 @@ class Sprite(Image):
             atlas: (str, Path),
             anim_rule: AnimRule = None) -> Sprite:
         """
-        Links an atlas to this Sprite.
+        Links an atlas to this Sprite. If build_assets wrote downscaled
+        variants of the atlas, the one matching constants.ASSET_SCALE is
+        linked instead, and drawn at the full resolution atlas' size.
 
         Args:
-            atlas: The path to a .atlas file.
+            atlas: The path to a .atlas file, without the extension.
             anim_rule: A new AnimRule object, if None, the existing
                 AnimRule will be maintained.
 
@@ -312,10 +443,17 @@ class Sprite(Image):
             immediately into a start() method call.
 
         """
-        self._atlas = str(atlas)
+        self._atlas, self._scale = lib.find_variant(
+            str(atlas), constants.ASSET_SCALE)
         if anim_rule:
             self.anim_rule = anim_rule
+        # Kivy looks atlases up in this cache when resolving atlas://
+        # sources, so preloading it makes them use RawAtlas:
+        if not Cache.get('kv.atlas', self._atlas):
+            Cache.append(
+                'kv.atlas', self._atlas, RawAtlas(self._atlas + '.atlas'))
         self._frames = self.collect_frames()
+        self._offsets = self.collect_offsets()
         return self
 
     def link_rule(self, anim_rule: AnimRule) -> AnimRule:
@@ -347,19 +485,79 @@ class Sprite(Image):
         {"white_Start_": ["white_Start_0", "white_Start_1"],
          "white_Idle_": ["white_Idle_0", "white_Idle_1"]}
 
+        If build_assets wrote an up to date binary index next to the
+        atlas, the frames are read from it instead, which needs no
+        json parsing.
+
         Returns: A dictionary.
 
         """
-        results = dict()
-        for f in Atlas(self._atlas + '.atlas').textures.keys():
-            m = re.match(r'(\D+)\d+', f)
-            if m:
-                frame = m.groups()[0]
-                if frame not in results.keys():
-                    results[frame] = [f]
-                else:
-                    results[frame].append(f)
-        return results
+        if atlas_index.index_is_current(self._atlas):
+            return atlas_index.read_atlas_index(
+                self._atlas + constants.ATLAS_INDEX_EXT)['tags']
+        return atlas_index.group_frames(
+            Cache.get('kv.atlas', self._atlas).textures.keys())
+
+    def collect_offsets(self) -> Dict[str, List[int]]:
+        """
+        Reads the .trim file build_assets writes next to the atlas when
+        frames are trimmed to their opaque pixels, or the offsets in its
+        binary index if it is up to date.
+
+        Returns: A dictionary containing each trimmed frame and a list of
+            its x and y offset within its full frame, and the full
+            frame's width and height. Empty if the atlas has no .trim
+            file.
+
+        """
+        if atlas_index.index_is_current(self._atlas):
+            return atlas_index.read_atlas_index(
+                self._atlas + constants.ATLAS_INDEX_EXT)['offsets']
+        p = Path(self._atlas + '.trim')
+        if not p.exists():
+            return dict()
+        with open(p, 'r') as r:
+            return json.load(r)
+
+    def _update_trim_rect(self, *args) -> None:
+        """
+        Works out where to draw the current frame's texture. Fits the
+        full size of the frame into the Sprite the same way Image fits
+        its texture, then places the texture at the frame's trim offset
+        within it, so trimmed frames are drawn where they would have
+        been before they were trimmed.
+
+        Args:
+            *args: Args passed by kivy, not used.
+
+        Returns: None
+
+        """
+        if not self.texture:
+            self.trim_rect = [*self.pos, *self.size]
+            return
+        # Downscaled variants are measured at full resolution, so that
+        # the Sprite is the same size whichever variant it loaded:
+        tw, th = (v / self._scale for v in self.texture.size)
+        ox, oy, cw, ch = (
+            v / self._scale for v in self._offsets.get(
+                self._frame_key, (0, 0, *self.texture.size)))
+        w, h = self.size
+        if self.allow_stretch and not self.keep_ratio:
+            sx, sy = w / cw, h / ch
+        else:
+            iw = w if self.allow_stretch else min(w, cw)
+            ih = iw * ch / cw
+            if ih > h:
+                ih = h if self.allow_stretch else min(h, ch)
+                iw = ih * cw / ch
+            sx = sy = iw / cw
+        self.trim_rect = [
+            self.center_x - cw * sx / 2 + ox * sx,
+            self.center_y - ch * sy / 2 + oy * sy,
+            tw * sx,
+            th * sy
+        ]
 
     def update(self, dt) -> None:
         """
@@ -376,6 +574,7 @@ class Sprite(Image):
         if self.time > self.rate:
             self.time -= self.rate
             f = f'{self._anim_tag}{self.frame}'
+            self._frame_key = f
             self.source = f'atlas://{self._atlas}/{f}'
             self.frame += 1
             if self.frame >= len(self._frames[self._anim_tag]):
@@ -491,3 +690,15 @@ class Sprite(Image):
     def release_dependents(self, tag: str) -> None:
         for anim_rule in self.anim_rule.dependents.get(tag, []):
             anim_rule.release()
+
+
+Builder.load_string('''
+<-Sprite>:
+    canvas:
+        Color:
+            rgba: self.color
+        Rectangle:
+            texture: self.texture
+            pos: self.trim_rect[:2]
+            size: self.trim_rect[2:]
+''')
@@ -9,7 +9,9 @@ setuptools.setup(
         'kivyhelper',
         'kivyhelper.scripts',
         'kivyhelper.widgets',
+        'kivyhelper.scripts.bench_assets',
         'kivyhelper.scripts.build_assets',
+        'kivyhelper.scripts.build_codex',
         'kivyhelper.scripts.new_app',
     ],
     install_requires=[
@@ -21,6 +23,7 @@ setuptools.setup(
         'kivy_deps.gstreamer==0.1.*',
         'kivy==1.11.1',
         'jsonlines',
+        'Pillow',
         'amanuensis @ git+https://github.com/Larquebus/'
         'Amanuensis#egg=amanuensis'
     ],
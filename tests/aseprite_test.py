@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from PIL import Image, ImageChops
+
+from kivyhelper.scripts.build_assets import aseprite
+
+
+class TestAsepriteFile:
+    def test_basics(self, sample_dirs):
+        a = aseprite.AsepriteFile(
+            sample_dirs.input_sprites.joinpath('ball\\black.aseprite'))
+        assert (a.width, a.height, a.depth) == (32, 32, 32)
+        assert len(a.durations) == 17
+        assert [layer.name for layer in a.layers] == ['Layer 1']
+        assert a.tags == [
+            {'name': 'Start', 'from': 0, 'to': 2, 'direction': 'forward'},
+            {'name': 'Idle', 'from': 3, 'to': 15, 'direction': 'forward'},
+        ]
+
+    def test_frame_names(self, sample_dirs):
+        a = aseprite.AsepriteFile(
+            sample_dirs.input_sprites.joinpath('snowflake\\white.aseprite'))
+        assert a.frame_names() == [
+            'white_Start_0', 'white_Start_1', 'white_Start_2',
+            'white_Start_3', 'white_Start_4', 'white_Idle_0', 'white_Idle_1',
+            'white_Idle_2', 'white_Idle_3', 'white__9',
+        ]
+        assert a.frame_names('{title}.{extension}_{outertag}{frame001}')[
+            :2] == ['white.aseprite_Start001', 'white.aseprite_Start002']
+        assert a.frame_names('{tag}-{tagframe00}')[5] == 'Idle-00'
+        with pytest.raises(aseprite.AsepriteFormatError):
+            a.frame_names('{title}_{layer}')
+
+    def test_render(self, sample_dirs):
+        a = aseprite.AsepriteFile(
+            sample_dirs.input_sprites.joinpath('snowflake\\white.aseprite'))
+        with open(sample_dirs.assets.joinpath('sprites_snowflake.json')) as r:
+            j = json.load(r)
+        sheet = Image.open(
+            sample_dirs.assets.joinpath('sprites_snowflake.png')
+        ).convert('RGBA')
+        for i, name in enumerate(a.frame_names()[:-1]):
+            f = j['frames'][name]['frame']
+            expected = sheet.crop(
+                (f['x'] + 2, f['y'] + 2, f['x'] + f['w'] - 2,
+                 f['y'] + f['h'] - 2))
+            diff = ImageChops.difference(expected, a.render(i))
+            assert diff.getbbox() is None
+        # The last frame is empty:
+        assert a.render(9).getbbox() is None
+
+    def test_indexed_cel(self, sample_dirs):
+        a = aseprite.AsepriteFile(
+            sample_dirs.input_sprites.joinpath('ball\\black.aseprite'))
+        a.depth = 8
+        a.transparent_idx = 0
+        a.palette = [(0, 0, 0, 255), (255, 0, 0, 255)] + a.palette[2:]
+        cel = (0, 0, 255, 2, 1, bytes([0, 1]))
+        assert list(a._cel_image(cel).getdata()) == [
+            (0, 0, 0, 0), (255, 0, 0, 255)]
+        # The transparent color is opaque on the background layer:
+        assert list(a._cel_image(cel, background=True).getdata()) == [
+            (0, 0, 0, 255), (255, 0, 0, 255)]
+
+
+def test_pack_rects():
+    positions, w, h = aseprite.pack_rects([(10, 10), (10, 20), (10, 10)])
+    assert positions == [(10, 0), (0, 0), (0, 20)]
+    assert (w, h) == (20, 30)
+    assert aseprite.pack_rects([]) == ([], 0, 0)
+
+
+def test_render_sheet(sample_dirs, sprite_files):
+    sheet = sample_dirs.output.joinpath('py_ball.png')
+    code, j = aseprite.render_sheet(sprite_files['sprites_ball'], sheet)
+    assert code == 0
+    # Rendering frames in parallel doesn't change the sheet:
+    png = sheet.read_bytes()
+    assert aseprite.render_sheet(
+        sprite_files['sprites_ball'], sheet, jobs=1) == (0, j)
+    assert sheet.read_bytes() == png
+    # Empty frames are left out, like aseprite's --ignore-empty:
+    assert len(j['frames']) == 32
+    assert j['frames']['black_Start_0']['frame']['w'] == 36
+    assert j['meta']['image'] == 'py_ball.png'
+    # Tag ranges point at the frames' indices on the sheet:
+    names = list(j['frames'].keys())
+    assert len(j['meta']['frameTags']) == 4
+    for t in j['meta']['frameTags']:
+        assert names[t['from']].endswith(f'_{t["name"]}_0')
+        assert names[t['to']].split('_')[1] == t['name']
+    assert Image.open(sheet).size == (
+        j['meta']['size']['w'], j['meta']['size']['h'])
+    assert aseprite.render_sheet(
+        [sample_dirs.input_jsons.joinpath('std_json.json')], sheet)[0] == 1
@@ -0,0 +1,43 @@
+import json
+
+import kivyhelper.atlas_index as ai
+
+
+def test_group_frames():
+    assert ai.group_frames(
+        ['a_Start_0', 'a_Start_1', 'a_Idle_0', 'no_number', 'a_Start_2']
+    ) == dict(
+        a_Start_=['a_Start_0', 'a_Start_1', 'a_Start_2'],
+        a_Idle_=['a_Idle_0'],
+    )
+
+
+def test_atlas_index(sample_dirs):
+    with open(sample_dirs.assets.joinpath('sprites_ball.atlas')) as r:
+        atlas = json.load(r)
+    atlas['sprites_ball-1.png'] = dict(
+        extra_Idle_0=[1, 2, 3, 4], logo=[5, 6, 7, 8])
+    p = sample_dirs.output.joinpath('sprites_ball.atlasidx')
+    ai.write_atlas_index(p, atlas, dict(extra_Idle_0=[1, 0, 8, 8]))
+    idx = ai.read_atlas_index(p)
+    assert idx['pages'] == ['sprites_ball.png', 'sprites_ball-1.png']
+    frames = {k: v for page in atlas.values() for k, v in page.items()}
+    # Every frame is indexed, including ones that aren't in any tag:
+    assert list(idx['rects'].keys()) == list(frames.keys())
+    assert idx['tags'] == ai.group_frames(frames.keys())
+    assert idx['rects']['black_Start_1'] == (
+        0, *atlas['sprites_ball.png']['black_Start_1'])
+    assert idx['rects']['extra_Idle_0'] == (1, 1, 2, 3, 4)
+    assert idx['rects']['logo'] == (1, 5, 6, 7, 8)
+    assert idx['offsets'] == dict(extra_Idle_0=[1, 0, 8, 8])
+
+
+def test_index_is_current(sample_dirs):
+    assert not ai.index_is_current(sample_dirs.assets.joinpath('sprites_ball'))
+    p = sample_dirs.output.joinpath('old')
+    ai.write_atlas_index(str(p) + '.atlasidx', dict())
+    assert ai.index_is_current(p)
+    # Indexes written by an older version are never used:
+    with open(str(p) + '.atlasidx', 'r+b') as w:
+        w.write(ai.HEADER.pack(ai.MAGIC, ai.VERSION - 1, 0, 0, 0))
+    assert not ai.index_is_current(p)
@@ -0,0 +1,35 @@
+import kivyhelper.scripts.bench_assets.lib as bench
+from kivyhelper import constants
+
+
+def test_run_benchmarks(tmp_path):
+    results = bench.run_benchmarks(
+        tmp_path, groups=3, files=2, tags=2, frames=3, size=8)
+    assert [r['stage'] for r in results] == [
+        'collect_files',
+        'read_aseprite_json',
+        'convert_ase_json_to_atlas',
+        'build_assets_folder',
+        'build_assets_folder (no changes)',
+    ]
+    assert all(r['peak_bytes'] > 0 for r in results)
+    assert results[0]['items'] == 6
+    assert results[-1]['items'] == 36
+    assert len(list(tmp_path.joinpath('assets').glob('*.atlas'))) == 3
+    assert constants.ASEPRITE == 'aseprite'
+
+
+def test_compare_results():
+    baseline = [
+        dict(stage='a', seconds=1.0, peak_bytes=100),
+        dict(stage='b', seconds=1.0, peak_bytes=None),
+    ]
+    results = [
+        dict(stage='a', seconds=1.1, peak_bytes=200),
+        dict(stage='b', seconds=2.0, peak_bytes=None),
+        dict(stage='c', seconds=5.0, peak_bytes=None),
+    ]
+    assert bench.compare_results(results, baseline) == [
+        'a: 200.000 bytes, up from 100.000 (+100%)',
+        'b: 2.000 seconds, up from 1.000 (+100%)',
+    ]
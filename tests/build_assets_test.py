@@ -1,8 +1,18 @@
+import json
+import os
+import re
+import sys
 from pathlib import Path
 
+import pytest
+from PIL import Image
+
 import kivyhelper.scripts.build_assets.lib as ba
 import kivyhelper.lib as lib
-from kivyhelper import constants
+from kivyhelper import constants, raw_texture
+from kivyhelper.scripts.build_assets import sheets
+from kivyhelper.scripts.build_assets.report import BuildReport
+from kivyhelper.scripts.build_assets.store import ArtifactStore
 from tests import testing_tools
 
 
@@ -19,6 +29,248 @@ def test_build_assets_folder(sample_dirs, sprite_files):
         assert Path(sample_dirs.output, 'assets', k + '.atlas').exists()
 
 
+def test_build_assets_folder_python_backend(sample_dirs):
+    atlas = ba.build_assets_folder(
+        sample_dirs.input_,
+        sample_dirs.output.joinpath('python_backend'),
+        ['ignore_', 'test_sprite'],
+        backend='python',
+        force=True
+    )
+    assert list(atlas.keys()) == ['sprites_ball', 'sprites_snowflake']
+    assert len(atlas['sprites_snowflake']['sprites_snowflake.png']) == 9
+
+
+def test_build_assets_folder_artifacts(sample_dirs):
+    out = sample_dirs.output.joinpath('artifacts')
+    d = out.joinpath('assets')
+    kwargs = dict(ignore=['ignore_', 'test_sprite'], backend='python')
+    ba.build_assets_folder(
+        sample_dirs.input_, out, force=True, keep_json=True, **kwargs)
+    assert ba.read_build_artifacts(d)['sprites_ball'] == [
+        'sprites_ball.png', 'sprites_ball.json', 'sprites_ball.atlas',
+        'sprites_ball.atlasidx',
+    ]
+    # The jsons are only written when asked for, and the ones left by
+    # the previous build are removed:
+    atlas = ba.build_assets_folder(
+        sample_dirs.input_, out, force=True, **kwargs)
+    assert not d.joinpath('sprites_ball.json').exists()
+    assert 'sprites_ball.json' not in ba.read_build_artifacts(d)[
+        'sprites_ball']
+    assert list(d.glob('*.json')) == [d.joinpath(constants.BUILD_MANIFEST)]
+    assert len(atlas['sprites_snowflake']['sprites_snowflake.png']) == 9
+
+
+def test_build_assets_folder_removed_group(sample_dirs):
+    out = sample_dirs.output.joinpath('removed_group')
+    d = out.joinpath('assets')
+    kwargs = dict(ignore=['ignore_', 'test_sprite'], backend='python')
+    ba.build_assets_folder(sample_dirs.input_, out, force=True, **kwargs)
+    assert d.joinpath('sprites_snowflake.atlas').exists()
+    # Skipping the group's directory looks the same to the build as its
+    # files having been deleted:
+    atlas = ba.build_assets_folder(
+        sample_dirs.input_, out, ignore_dirs=['snowflake'], **kwargs)
+    assert list(atlas.keys()) == ['sprites_ball']
+    assert list(d.glob('sprites_snowflake*')) == []
+    assert 'sprites_snowflake' not in ba.read_build_manifest(d)
+    assert 'sprites_snowflake' not in ba.read_build_artifacts(d)
+    # Only full builds remove groups:
+    ba.build_assets_folder(sample_dirs.input_, out, force=True, **kwargs)
+    ba.build_assets_folder(
+        sample_dirs.input_, out, groups=['sprites_ball'], **kwargs)
+    assert d.joinpath('sprites_snowflake.atlas').exists()
+
+
+def test_build_assets_folder_store(monkeypatch, sample_dirs):
+    store = sample_dirs.output.joinpath('store', 'artifacts')
+    kwargs = dict(
+        ignore=['ignore_', 'test_sprite'], backend='python', force=True,
+        trim=True, optimize=True, store=store)
+    atlas = ba.build_assets_folder(
+        sample_dirs.input_, sample_dirs.output.joinpath('store', 'a'),
+        **kwargs)
+    # Entries are published once the pngs have been optimized:
+    ball = [e for e, _, _ in ArtifactStore(store).entries()
+            if e.joinpath('sprites_ball.png').exists()]
+    assert len(ball) == 1
+    assert ball[0].joinpath('sprites_ball.png').read_bytes() == (
+        sample_dirs.output.joinpath(
+            'store', 'a', 'assets', 'sprites_ball.png').read_bytes())
+    exported = []
+
+    def _export_groups(file_groups, *args):
+        exported.extend(file_groups.keys())
+        return dict()
+
+    # A second checkout fetches every group instead of exporting it:
+    monkeypatch.setattr(ba, 'export_groups', _export_groups)
+    out = sample_dirs.output.joinpath('store', 'b')
+    assert ba.build_assets_folder(
+        sample_dirs.input_, out, **kwargs) == atlas
+    assert exported == []
+    d = out.joinpath('assets')
+    assert d.joinpath('sprites_ball.png').exists()
+    assert ba.read_trim_file(d, 'sprites_ball') == ba.read_trim_file(
+        sample_dirs.output.joinpath('store', 'a', 'assets'), 'sprites_ball')
+
+
+def test_build_assets_folder_scales(sample_dirs):
+    out = sample_dirs.output.joinpath('scales')
+    d = out.joinpath('assets')
+    atlas = ba.build_assets_folder(
+        sample_dirs.input_,
+        out,
+        ['ignore_', 'test_sprite'],
+        backend='python',
+        force=True,
+        scales=[0.5],
+        raw_textures=True
+    )
+    variant = lib.read_aseprite_json(d.joinpath('sprites_ball@0.5x.atlas'))
+    assert list(variant.keys()) == ['sprites_ball@0.5x.png']
+    full = atlas['sprites_ball']['sprites_ball.png']
+    half = variant['sprites_ball@0.5x.png']
+    assert half.keys() == full.keys()
+    assert all(h[2] == f[2] // 2 for h, f in zip(
+        half.values(), full.values()))
+    assert d.joinpath('sprites_ball@0.5x.atlasidx').exists()
+    assert raw_texture.raw_texture_is_current(
+        d.joinpath('sprites_ball@0.5x.png'))
+
+    ba.remove_group_outputs(d, 'sprites_ball')
+    assert not d.joinpath('sprites_ball@0.5x.atlas').exists()
+    assert not d.joinpath('sprites_ball@0.5x.png').exists()
+    assert not d.joinpath('sprites_ball.png.rgba').exists()
+    assert d.joinpath('sprites_snowflake@0.5x.png').exists()
+
+    # Changing the scales rebuilds every group, and removes the variants
+    # that are no longer requested:
+    ba.build_assets_folder(
+        sample_dirs.input_, out, ['ignore_', 'test_sprite'],
+        backend='python', scales=[0.25], raw_textures=True)
+    assert d.joinpath('sprites_snowflake@0.25x.atlas').exists()
+    assert d.joinpath('sprites_ball@0.25x.png').exists()
+    assert list(d.glob('*@0.5x*')) == []
+    assert not any(
+        '@0.5x' in f
+        for files in ba.read_build_artifacts(d).values() for f in files)
+
+
+def test_build_assets_folder_share(sample_dirs):
+    out = sample_dirs.output.joinpath('share')
+    d = out.joinpath('assets')
+    kwargs = dict(ignore=['ignore_', 'test_sprite'], backend='python')
+    full = ba.build_assets_folder(
+        sample_dirs.input_, out, force=True, **kwargs)
+    atlas = ba.build_assets_folder(
+        sample_dirs.input_, out, share=1024, **kwargs)
+    page = f'{constants.SHARED_PAGE}-0.png'
+    assert [list(a.keys()) for a in atlas.values()] == [[page], [page]]
+    assert lib.read_aseprite_json(d.joinpath('sprites_ball.atlas')) == (
+        atlas['sprites_ball'])
+    layout = ba.read_shared_layout(d)
+    sheet = Image.open(d.joinpath(page))
+    for g in atlas.keys():
+        # Every frame has the same pixels on the shared page:
+        own = Image.open(d.joinpath(f'{g}.png'))
+        for f, (x, y, w, h) in full[g][f'{g}.png'].items():
+            sx, sy, _, _ = atlas[g][page][f]
+            assert own.crop(
+                (x, own.height - y - h, x + w, own.height - y)
+            ).tobytes() == sheet.crop(
+                (sx, sheet.height - sy - h, sx + w, sheet.height - sy)
+            ).tobytes()
+        assert sheets.unshare_atlas(atlas[g], layout[g]) == full[g]
+
+    # Groups move back onto their own spritesheets once sharing is off:
+    assert ba.build_assets_folder(
+        sample_dirs.input_, out, **kwargs) == full
+    assert not d.joinpath(page).exists()
+    assert ba.read_shared_layout(d) == dict()
+
+
+def test_build_assets_folder_report(sample_dirs):
+    d = sample_dirs.output.joinpath('report')
+    ba.build_assets_folder(
+        sample_dirs.input_,
+        d,
+        ['ignore_', 'test_sprite'],
+        backend='python',
+        force=True,
+        report=d.joinpath('report.json'),
+        budget=1,
+        optimize=True
+    )
+    r = lib.read_aseprite_json(d.joinpath('report.json'))
+    assert list(r['groups'].keys()) == ['sprites_ball', 'sprites_snowflake']
+    assert r['over_budget'] == ['sprites_ball', 'sprites_snowflake']
+    g = r['groups']['sprites_snowflake']
+    assert g['frames'] == 9
+    assert not g['cached']
+    assert g['texture_bytes'] == g['pages'][0]['w'] * g['pages'][0]['h'] * 4
+    assert r['texture_bytes'] == sum(
+        g['texture_bytes'] for g in r['groups'].values())
+    assert 0 < g['png']['bytes_after'] < g['png']['bytes_before']
+    assert r['png_bytes_saved'] > 0
+
+
+def test_build_assets_folder_incremental(monkeypatch, sample_dirs):
+    testing_tools.check_aseprite_skip()
+    atlas = ba.build_assets_folder(
+        sample_dirs.input_,
+        sample_dirs.output,
+        ['ignore_', 'test_sprite']
+    )
+    exported = []
+
+    def _export_groups(file_groups, *args):
+        exported.extend(file_groups.keys())
+        return {g: (0, [g]) for g in file_groups.keys()}
+
+    monkeypatch.setattr(ba, 'export_groups', _export_groups)
+    assert ba.build_assets_folder(
+        sample_dirs.input_,
+        sample_dirs.output,
+        ['ignore_', 'test_sprite']
+    ) == atlas
+    assert exported == []
+    # Changing the build parameters should invalidate every group:
+    ba.build_assets_folder(
+        sample_dirs.input_,
+        sample_dirs.output,
+        ['ignore_', 'test_sprite'],
+        '{title}_{tag}{tagframe}'
+    )
+    assert exported == list(atlas.keys())
+
+
+def test_hash_group(sprite_files, sample_dirs):
+    files = sprite_files['sprites_ball']
+    h = ba.hash_group(files, sample_dirs.input_, dict(a=1))
+    assert h == ba.hash_group(files, sample_dirs.input_, dict(a=1))
+    assert h != ba.hash_group(files, sample_dirs.input_, dict(a=2))
+    assert h != ba.hash_group(files[:1], sample_dirs.input_, dict(a=1))
+
+
+def test_diff_snapshots():
+    old = {
+        'a/1.ase': ('a', 10, 100),
+        'a/2.ase': ('a', 10, 100),
+        'b/1.ase': ('b', 10, 100),
+        'c/1.ase': ('c', 10, 100),
+    }
+    new = {
+        'a/1.ase': ('a', 10, 100),
+        'a/2.ase': ('a', 10, 100),
+        'b/1.ase': ('b', 20, 120),
+        'd/1.ase': ('d', 20, 100),
+    }
+    assert ba.diff_snapshots(old, old) == (set(), set())
+    assert ba.diff_snapshots(old, new) == ({'b', 'd'}, {'c'})
+
+
 def test_execute_aseprite_cli(aseprite_cli, sample_dirs):
     testing_tools.check_aseprite_skip()
     print(aseprite_cli)
@@ -29,6 +281,72 @@ def test_execute_aseprite_cli(aseprite_cli, sample_dirs):
     assert j['meta']['size'] == dict(w=216, h=216)
 
 
+def test_export_groups(monkeypatch, sprite_files, sample_dirs):
+    def _fake_export(group, *args):
+        if group == 'sprites_snowflake':
+            raise ValueError('Corrupt file')
+        return (1, []) if group == 'sprites_ball' else (0, [group])
+
+    monkeypatch.setattr(ba, 'export_group', _fake_export)
+    results = ba.export_groups(sprite_files, sample_dirs.output, jobs=3)
+    assert results == dict(
+        sprites=(0, ['sprites']),
+        sprites_ball=(1, []),
+        sprites_snowflake=(1, []),
+    )
+    assert list(results.keys()) == list(sprite_files.keys())
+
+
+def test_export_group_pages(monkeypatch, tmp_path):
+    def _fake_cli(cli_str):
+        assert '--data' not in cli_str
+        sheet = Path(re.search(r'--sheet "(.+)"', cli_str).group(1))
+        sheet.touch()
+        h = cli_str.count('.ase"') * 6000
+        return 0, json.dumps(dict(
+            frames=dict(), meta=dict(size=dict(w=100, h=h))))
+
+    def _fake_stream(cli_str):
+        code, out = _fake_cli(cli_str)
+        return code, json.loads(out)
+
+    monkeypatch.setattr(ba, 'capture_cli_str', _fake_cli)
+    monkeypatch.setattr(ba, 'stream_cli_json', _fake_stream)
+    files = [f'{x}.ase' for x in 'abcde']
+    code, pages = ba.export_group('big', files, tmp_path)
+    assert code == 0
+    assert list(pages.keys()) == ['big-0', 'big-1', 'big-2']
+    assert pages['big-0']['meta']['size'] == dict(w=100, h=12000)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'big-0.png', 'big-1.png', 'big-2.png',
+    ]
+    report = BuildReport()
+    code, pages = ba.export_group(
+        'small', files[:2], tmp_path, keep_json=True, report=report)
+    assert (code, list(pages.keys())) == (0, ['small'])
+    assert report.group('small')['seconds']['parse'] > 0
+    assert lib.read_aseprite_json(tmp_path.joinpath('small.json')) == (
+        pages['small'])
+
+
+def test_stream_cli_json(sample_dirs):
+    p = sample_dirs.input_jsons.joinpath('aseprite_json.json')
+    j = lib.read_aseprite_json(p)
+    python = lib.enquote(sys.executable)
+    code, streamed = ba.stream_cli_json(
+        f'{python} -m json.tool {lib.enquote(p)}')
+    assert code == 0
+    # Only each frame's rectangle is kept:
+    assert streamed == dict(
+        frames={f: dict(frame=v['frame']) for f, v in j['frames'].items()},
+        meta=j['meta'])
+    assert ba.convert_ase_json_to_atlas(streamed) == (
+        ba.convert_ase_json_to_atlas(j))
+    assert ba.stream_cli_json(f'{python} -c "exit(3)"') == (3, None)
+    with pytest.raises(ValueError):
+        ba.stream_cli_json(f'{python} -c "print(1)"')
+
+
 def test_assemble_aseprite_cli(sprite_files, aseprite_cli, sample_dirs):
     assert ba.assemble_aseprite_cli(
         'sprites',
@@ -65,6 +383,44 @@ def test_collect_aseprite_files(sprite_files, sample_dirs):
     }
 
 
+def test_collect_files_cache(monkeypatch, tmp_path):
+    for d in ('a', 'a/b', 'skip'):
+        tmp_path.joinpath(d).mkdir()
+        tmp_path.joinpath(d, 'x.aseprite').write_text('')
+        tmp_path.joinpath(d, 'x.txt').write_text('')
+    for d in ('', 'a', 'a/b', 'skip'):
+        os.utime(tmp_path.joinpath(d), (1, 1))
+    expected = {
+        'a': [os.path.join(str(tmp_path), 'a', 'x.aseprite')],
+        'a_b': [os.path.join(str(tmp_path), 'a', 'b', 'x.aseprite')],
+    }
+    cache = dict()
+    assert ba.collect_files(
+        tmp_path, ext=constants.ASE_EXTS, ignore_dirs=['skip'],
+        cache=cache) == expected
+    assert len(cache['dirs']) == 3
+
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(
+        os, 'scandir', lambda p: listed.append(p) or scandir(p))
+    assert ba.collect_files(
+        tmp_path, ext=constants.ASE_EXTS, ignore_dirs=['skip'],
+        cache=cache) == expected
+    assert listed == []
+
+    tmp_path.joinpath('a', 'y.aseprite').write_text('')
+    expected['a'].append(os.path.join(str(tmp_path), 'a', 'y.aseprite'))
+    assert ba.collect_files(
+        tmp_path, ext=constants.ASE_EXTS, ignore_dirs=['skip'],
+        cache=cache) == expected
+    assert listed == [os.path.join(str(tmp_path), 'a')]
+
+    # Different arguments invalidate the cache:
+    assert 'skip' in ba.collect_files(
+        tmp_path, ext=constants.ASE_EXTS, cache=cache)
+
+
 def test_collect_json_files(json_files, sample_dirs):
     assert ba.collect_files(
         sample_dirs.input_jsons,
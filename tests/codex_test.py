@@ -1,4 +1,11 @@
+import os
+import pickle
+
+import pytest
+
 import kivyhelper.codex as cx
+from kivyhelper import codex_bundle
+from kivyhelper.scripts.build_codex.lib import build_codex_bundle
 
 
 class SampleNode(cx.Node):
@@ -8,6 +15,40 @@ class SampleNode(cx.Node):
         return data
 
 
+class IndexedNode(cx.Node):
+    assoc_file = 'jl_indexed'
+    unique_indexes = ('id',)
+    indexes = ('speaker',)
+    sorted_indexes = ('level',)
+
+    def process(self, data: list):
+        self.data = data
+        self.build_indexes(data)
+        return data
+
+
+class ColumnarNode(cx.DefaultNode):
+    assoc_file = 'jl_columnar'
+    columnar = True
+    stream = True
+    unique_indexes = ('id',)
+
+
+class SummaryNode(cx.Node):
+    assoc_file = 'jl_summary'
+    stream = True
+
+    def process(self, data):
+        assert not isinstance(data, list)
+        self.batches = []
+        self.total = 0
+        for batch in data:
+            self.batches.append(len(batch) if self.batch_size else 1)
+            for line in (batch if self.batch_size else [batch]):
+                self.total += line['a']
+        return self.total
+
+
 class SampleCodex(cx.Codex):
     def __init__(self):
         super(SampleCodex, self).__init__()
@@ -18,6 +59,109 @@ class TestNode:
     def test_registry(self, sample_dirs):
         assert cx.Node.__subclasscheck__(SampleNode)
 
+    def test_indexes(self):
+        lines = [
+            dict(id='a', speaker='Bo', level=3),
+            dict(id='b', speaker='Al', level=1),
+            dict(id='c', speaker='Bo', level=2),
+            dict(id='d', level=2),
+        ]
+        n = IndexedNode()
+        n.process(lines)
+        assert n.get('id', 'c') is lines[2]
+        assert n.get('id', 'x') is None
+        assert n.get('speaker', 'Bo') is lines[0]
+        assert n.where('speaker', 'Bo') == [lines[0], lines[2]]
+        assert n.where('id', 'b') == [lines[1]]
+        assert n.where('speaker', 'Cy') == []
+        assert n.between('level', 2, 3) == [lines[2], lines[3], lines[0]]
+        assert n.between('level', high=1) == [lines[1]]
+        with pytest.raises(KeyError):
+            n.where('level', 2)
+        with pytest.raises(ValueError):
+            n.process(lines + [dict(id='a')])
+        with pytest.raises(KeyError, match='never called build_indexes'):
+            IndexedNode().get('id', 'a')
+
+
+class TestRecordTable:
+    def test_columns(self):
+        lines = [
+            dict(id=1, name='Bo', hp=2.5, boss=False, tags=['a']),
+            dict(id=2, name='Bo', hp=3.0, boss=True),
+            dict(id=3, name='Al', hp=1.5, boss=False, tags=None),
+        ]
+        t = cx.RecordTable(lines)
+        assert len(t) == 3
+        assert t == lines
+        assert t.to_list() == lines
+        assert t[-1] == lines[2]
+        assert t[1:] == lines[1:]
+        assert t.columns['id'].typecode == 'q'
+        assert t.columns['hp'].typecode == 'd'
+        assert t[1]['boss'] is True
+        assert 'tags' not in t[1]
+        assert t[1].get('tags', 'none') == 'none'
+        # Repeated strings are only stored once:
+        assert t.columns['name'][0] is t.columns['name'][1]
+        assert pickle.loads(pickle.dumps(t)) == lines
+
+    def test_columnar_node(self):
+        assert cx.Codex._get_node_by_assoc_file('jl_columnar') == (
+            ColumnarNode)
+        n = ColumnarNode()
+        n.process([dict(id=i, name=f'n{i}') for i in range(10)])
+        assert isinstance(n.data, cx.RecordTable)
+        assert n.get('id', 4)['name'] == 'n4'
+        assert [r['id'] for r in n.data] == list(range(10))
+
+
+class TestStreaming:
+    def test_stream(self, monkeypatch, tmp_path):
+        p = tmp_path.joinpath('jl_summary.jsonl')
+        p.write_text(''.join(f'{{"a": {i}}}\n' for i in range(5)))
+        monkeypatch.setattr(
+            cx.Codex, '_load_jsonlines', lambda *args: pytest.fail())
+        n = cx.Codex.load_node(p, SummaryNode)
+        assert (n.total, n.batches) == (10, [1] * 5)
+        monkeypatch.setattr(SummaryNode, 'batch_size', 2)
+        n = cx.Codex.load_node(p, SummaryNode)
+        assert (n.total, n.batches) == (10, [2, 2, 1])
+
+    def test_stream_columnar(self, tmp_path):
+        p = tmp_path.joinpath('jl_columnar.jsonl')
+        p.write_text('{"id": 1}\n{"id": 2}\n')
+        n = cx.Codex.load_node(p, ColumnarNode)
+        assert n.data == [dict(id=1), dict(id=2)]
+        assert n.get('id', 2) == dict(id=2)
+
+    def test_stream_columnar_batches(self, monkeypatch, tmp_path):
+        p = tmp_path.joinpath('jl_columnar.jsonl')
+        p.write_text(''.join(f'{{"id": {i}}}\n' for i in range(5)))
+        monkeypatch.setattr(ColumnarNode, 'batch_size', 2)
+        n = cx.Codex.load_node(p, ColumnarNode)
+        assert n.data == [dict(id=i) for i in range(5)]
+        assert n.get('id', 4) == dict(id=4)
+        monkeypatch.setattr(ColumnarNode, 'columnar', False)
+        n = cx.Codex.load_node(p, ColumnarNode)
+        assert n.data == [dict(id=i) for i in range(5)]
+
+
+@pytest.fixture
+def loaded(monkeypatch):
+    """
+    Records the stem of every file Codex._load_jsonlines reads.
+    """
+    stems = []
+    load = cx.Codex._load_jsonlines
+
+    def _load(file_path):
+        stems.append(file_path.stem)
+        return load(file_path)
+
+    monkeypatch.setattr(cx.Codex, '_load_jsonlines', _load)
+    return stems
+
 
 class TestCodex:
     def test_inheritance(self, sample_dirs):
@@ -43,3 +187,101 @@ class TestCodex:
 
     def test_get_node_by_assoc_file(self):
         assert cx.Codex._get_node_by_assoc_file('jl_sample') == SampleNode
+
+    def test_from_dir_lazy(self, loaded, sample_dirs):
+        c = cx.Codex.from_dir(sample_dirs.input_jsons, lazy=True)
+        assert isinstance(c.jl_sample2, cx.DefaultNode)
+        assert loaded == []
+        assert c.jl_sample2
+        assert loaded == ['jl_sample2']
+        assert c.jl_sample2.data[0] == dict(d=1, e=2, f=3)
+        assert c.jl_sample2.data[2] == dict(d=7, e=8, f=9)
+        assert loaded == ['jl_sample2']
+
+    def test_from_dir_budget(self, loaded, sample_dirs):
+        # Only one of the sample files fits at a time:
+        c = cx.Codex.from_dir(sample_dirs.input_jsons, lazy=True, budget=80)
+        assert c.jl_sample2.data[0]['d'] == 1
+        assert isinstance(c.jl_sample, SampleNode)
+        c.jl_sample.process([])
+        assert not c.jl_sample2.proxy_loaded
+        # Evicted nodes are loaded again transparently:
+        assert c.jl_sample2.data[0]['d'] == 1
+        assert not c.jl_sample.proxy_loaded
+        assert loaded == ['jl_sample2', 'jl_sample', 'jl_sample2']
+
+    def test_from_dir_jobs(self, sample_dirs):
+        expected = cx.Codex.from_dir(sample_dirs.input_jsons)
+        for processes in (False, True):
+            c = cx.Codex.from_dir(
+                sample_dirs.input_jsons, jobs=2, processes=processes)
+            assert list(vars(c).keys()) == ['jl_sample', 'jl_sample2']
+            assert isinstance(c.jl_sample, SampleNode)
+            assert c.jl_sample2.data == expected.jl_sample2.data
+
+    def test_from_dir_errors(self, tmp_path):
+        tmp_path.joinpath('a.jsonl').write_text('{"a": 1}\n')
+        tmp_path.joinpath('b.jsonl').write_text('{"b": \n')
+        tmp_path.joinpath('c.jsonl').write_text('[1, \n')
+        with pytest.raises(cx.CodexLoadError) as e:
+            cx.Codex.from_dir(tmp_path, jobs=2)
+        assert sorted(p.name for p in e.value.errors.keys()) == [
+            'b.jsonl', 'c.jsonl']
+
+    def test_from_dir_snapshots(self, monkeypatch, loaded, tmp_path):
+        src = tmp_path.joinpath('src')
+        src.mkdir()
+        jl_p = src.joinpath('jl_sample.jsonl')
+        jl_p.write_text('{"a": 1}\n')
+        snapshots = tmp_path.joinpath('snapshots')
+        cx.Codex.from_dir(src, snapshot_dir=snapshots)
+        assert loaded == ['jl_sample']
+        assert snapshots.joinpath('jl_sample.snapshot').exists()
+        c = cx.Codex.from_dir(src, snapshot_dir=snapshots)
+        assert isinstance(c.jl_sample, SampleNode)
+        assert loaded == ['jl_sample']
+        # A touched but unchanged file still matches its snapshot:
+        os.utime(jl_p, ns=(0, 0))
+        cx.Codex.from_dir(src, snapshot_dir=snapshots)
+        assert loaded == ['jl_sample']
+        # Which is updated, so that the file isn't hashed again:
+        with open(snapshots.joinpath('jl_sample.snapshot'), 'rb') as r:
+            assert pickle.load(r)['mtime'] == 0
+        jl_p.write_text('{"a": 2}\n')
+        cx.Codex.from_dir(src, snapshot_dir=snapshots)
+        assert loaded == ['jl_sample', 'jl_sample']
+        # As does a new version of the Node class:
+        monkeypatch.setattr(SampleNode, 'version', 1)
+        cx.Codex.from_dir(
+            src, snapshot_dir=snapshots, lazy=True).jl_sample.proxy_load()
+        assert loaded == ['jl_sample'] * 3
+
+    def test_from_bundle(self, sample_dirs, tmp_path):
+        bundle_p = build_codex_bundle(sample_dirs.input_jsons, tmp_path)
+        expected = cx.Codex.from_dir(sample_dirs.input_jsons)
+        c = cx.Codex.from_bundle(bundle_p)
+        assert list(vars(c).keys()) == ['jl_sample', 'jl_sample2']
+        assert isinstance(c.jl_sample, SampleNode)
+        records = c.jl_sample2.data
+        assert isinstance(records, codex_bundle.BundleRecords)
+        assert list(records) == expected.jl_sample2.data
+        assert records[-1] == dict(d=7, e=8, f=9)
+        assert records[1:] == expected.jl_sample2.data[1:]
+        with pytest.raises(IndexError):
+            records[3]
+
+
+class TestCodexBundle:
+    def test_write_read(self, tmp_path):
+        p = tmp_path.joinpath('test.bundle')
+        nodes = dict(a=[dict(x=1), dict(y='\u00e9')], b=[], c=[dict()])
+        assert codex_bundle.write_bundle(
+            {k: iter(v) for k, v in nodes.items()}, p) == 3
+        result = codex_bundle.read_bundle(p)
+        assert {k: list(v) for k, v in result.items()} == nodes
+
+    def test_bad_bundle(self, tmp_path):
+        p = tmp_path.joinpath('test.bundle')
+        p.write_bytes(b'not a bundle at all')
+        with pytest.raises(ValueError):
+            codex_bundle.read_bundle(p)
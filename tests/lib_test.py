@@ -13,3 +13,38 @@ def test_read_aseprite_json(aseprite_json, sample_dirs):
     assert lib.read_aseprite_json(
         sample_dirs.input_jsons.joinpath(
             'aseprite_json.json')) == aseprite_json
+
+
+def test_iter_aseprite_json(aseprite_json, sample_dirs):
+    p = sample_dirs.input_jsons.joinpath('aseprite_json.json')
+    frames = aseprite_json['frames']
+    expected = [
+        ('frames', 'black_Start_0', frames['black_Start_0']),
+        ('frames', 'black_Start_1', frames['black_Start_1']),
+        ('meta', None, aseprite_json['meta']),
+    ]
+    # A tiny chunk size makes sure values split across reads still
+    # decode correctly:
+    for chunk_size in (3, 1 << 16):
+        assert list(lib.iter_aseprite_json(p, chunk_size)) == expected
+    with open(p, 'r') as r:
+        assert list(lib.iter_aseprite_json(r)) == expected
+        assert not r.closed
+
+
+def test_variant_name():
+    assert lib.variant_name('sprites_ball.png', 0.5) == (
+        'sprites_ball@0.5x.png')
+    assert lib.variant_name('sprites_ball', 0.25) == 'sprites_ball@0.25x'
+    assert lib.variant_name('sprites_ball.png', 1) == 'sprites_ball.png'
+
+
+def test_find_variant(tmp_path):
+    base = str(tmp_path.joinpath('ball'))
+    for s in (0.5, 0.25):
+        tmp_path.joinpath(f'ball@{s:g}x.atlas').write_text('{}')
+    tmp_path.joinpath('ball_big@0.1x.atlas').write_text('{}')
+    assert lib.find_variant(base, 1.0) == (base, 1.0)
+    assert lib.find_variant(base, 0.5) == (base + '@0.5x', 0.5)
+    assert lib.find_variant(base, 0.3) == (base + '@0.5x', 0.5)
+    assert lib.find_variant(base, 0.1) == (base + '@0.25x', 0.25)
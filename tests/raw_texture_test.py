@@ -0,0 +1,26 @@
+import os
+import shutil
+
+from PIL import Image
+
+import kivyhelper.raw_texture as rt
+
+
+def test_raw_texture(sample_dirs, tmp_path):
+    png = tmp_path.joinpath('sprites_ball.png')
+    shutil.copy(sample_dirs.assets.joinpath('sprites_ball.png'), png)
+    assert rt.read_raw_texture(png) is None
+    assert not rt.raw_texture_is_current(png)
+
+    rt.write_raw_texture(png)
+    assert rt.raw_texture_is_current(png)
+    w, h, pixels = rt.read_raw_texture(png)
+    img = Image.open(png).convert('RGBA')
+    assert (w, h) == img.size
+    assert bytes(pixels) == img.tobytes()
+    pixels.release()
+
+    # A changed png makes the raw texture stale:
+    stat = os.stat(png)
+    os.utime(png, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert rt.read_raw_texture(png) is None
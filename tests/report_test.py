@@ -0,0 +1,28 @@
+import time
+
+from kivyhelper.scripts.build_assets.report import BuildReport
+
+
+class TestBuildReport:
+    def test_timer(self):
+        r = BuildReport()
+        with r.timer('a', 'export', exclude='parse'):
+            for _ in range(3):
+                with r.timer('a', 'parse'):
+                    time.sleep(0.01)
+        s = r.group('a')['seconds']
+        assert s['parse'] >= 0.03
+        assert 0 <= s['export'] < s['parse']
+
+    def test_to_dict(self):
+        r = BuildReport(budget=100)
+        r.group('a')['pages'] = [dict(image='a.png', w=10, h=5)]
+        r.group('a')['over_budget'] = True
+        r.group('b')['pages'] = [
+            dict(image='b.png', w=5, h=2), dict(image='a.png', w=10, h=5)]
+        d = r.to_dict()
+        # Pages shared by several groups are only counted once:
+        assert d['texture_bytes'] == 240
+        assert d['over_budget'] == ['a']
+        assert d['budget'] == 100
+        assert 'total' in d['seconds']
@@ -0,0 +1,145 @@
+import json
+
+from PIL import Image
+
+import kivyhelper.lib as lib
+from kivyhelper.scripts.build_assets import aseprite, sheets
+
+
+def _write_sheet(path, frames: dict, size: tuple):
+    """
+    Writes a png of solid colored frames and an aseprite-style json for
+    it into path.
+    """
+    sheet = Image.new('RGBA', size, (0, 0, 0, 0))
+    j = dict(frames=dict(), meta=dict(image='test.png', size=dict(
+        w=size[0], h=size[1])))
+    for name, (x, y, color) in frames.items():
+        sheet.paste(color, (x, y, x + 8, y + 8))
+        j['frames'][name] = dict(frame=dict(x=x, y=y, w=8, h=8))
+    sheet.save(path.joinpath('test.png'))
+    with open(path.joinpath('test.json'), 'w') as w:
+        w.write(json.dumps(j))
+    return path.joinpath('test.json')
+
+
+def test_dedupe_sheet(tmp_path):
+    red = (255, 0, 0, 255)
+    blue = (0, 0, 255, 255)
+    json_path = _write_sheet(tmp_path, dict(
+        a_Idle_0=(0, 0, red),
+        a_Idle_1=(8, 0, blue),
+        a_Idle_2=(16, 0, red),
+        a_Idle_3=(24, 0, red),
+    ), (32, 8))
+    png_path = json_path.with_suffix('.png')
+    j = lib.read_aseprite_json(json_path)
+    assert sheets.dedupe_sheet(png_path, j) == 2
+    frames = {k: sheets.frame_box(v['frame']) for k, v in j['frames'].items()}
+    assert frames['a_Idle_0'] == frames['a_Idle_2'] == frames['a_Idle_3']
+    assert frames['a_Idle_0'] != frames['a_Idle_1']
+    sheet = Image.open(tmp_path.joinpath('test.png')).convert('RGBA')
+    assert sheet.size == (j['meta']['size']['w'], j['meta']['size']['h'])
+    assert sheet.size[0] * sheet.size[1] == 2 * 8 * 8
+    assert sheet.getpixel(frames['a_Idle_3'][:2]) == red
+    assert sheet.getpixel(frames['a_Idle_1'][:2]) == blue
+    # Nothing left to remove the second time around:
+    assert sheets.dedupe_sheet(png_path, j) == 0
+
+
+def test_dedupe_exported_sheet(sample_dirs, sprite_files):
+    png_path = sample_dirs.output.joinpath('dedupe_ball.png')
+    _, j = aseprite.render_sheet(sprite_files['sprites_ball'], png_path)
+    assert sheets.dedupe_sheet(png_path, j) > 0
+    assert len(j['frames']) == 32
+
+
+def test_trim_sheet(tmp_path):
+    sheet = Image.new('RGBA', (64, 32), (0, 0, 0, 0))
+    sheet.paste((255, 0, 0, 255), (10, 20, 14, 24))
+    sheet.paste((0, 0, 255, 255), (32, 0, 64, 32))
+    png_path = tmp_path.joinpath('test.png')
+    sheet.save(png_path)
+    j = dict(
+        frames=dict(
+            a_Idle_0=dict(frame=dict(x=0, y=0, w=32, h=32)),
+            a_Idle_1=dict(frame=dict(x=32, y=0, w=32, h=32)),
+        ),
+        meta=dict(image='test.png', size=dict(w=64, h=32))
+    )
+    assert sheets.trim_sheet(png_path, j) > 0
+    small = j['frames']['a_Idle_0']
+    assert small['trimmed']
+    assert small['spriteSourceSize'] == dict(x=8, y=18, w=8, h=8)
+    assert small['sourceSize'] == dict(w=32, h=32)
+    assert j['frames']['a_Idle_1']['spriteSourceSize'] == dict(
+        x=0, y=0, w=32, h=32)
+    trimmed = Image.open(png_path).convert('RGBA')
+    box = sheets.frame_box(small['frame'])
+    assert trimmed.crop(box).getchannel('A').getbbox() == (2, 2, 6, 6)
+    # Offsets are flipped to kivy's bottom-left origin:
+    assert sheets.read_trim_offsets(j) == dict(
+        a_Idle_0=[8, 6, 32, 32],
+        a_Idle_1=[0, 0, 32, 32],
+    )
+    # Trimming again keeps the original offsets:
+    sheets.trim_sheet(png_path, j)
+    assert j['frames']['a_Idle_0']['spriteSourceSize'] == dict(
+        x=8, y=18, w=8, h=8)
+
+
+def test_scale_sheets(tmp_path):
+    red = (255, 0, 0, 255)
+    blue = (0, 0, 255, 255)
+    # Frames without any padding between them:
+    _write_sheet(tmp_path, dict(
+        a_Idle_0=(0, 0, red),
+        a_Idle_1=(8, 0, blue),
+        a_Idle_2=(8, 0, blue),
+    ), (16, 8))
+    full = dict(
+        a_Idle_0=[0, 0, 8, 8], a_Idle_1=[8, 0, 8, 8], a_Idle_2=[8, 0, 8, 8])
+    scaled = dict()
+    atlas, offsets = sheets.scale_sheets(
+        tmp_path, {'test.png': full}, dict(a_Idle_1=[2, 4, 12, 12]), 0.25,
+        scaled)
+    frames = atlas['test@0.25x.png']
+    assert list(frames.keys()) == list(full.keys())
+    assert all(r[2:] == [2, 2] for r in frames.values())
+    # Deduplicated frames still share their rect:
+    assert frames['a_Idle_1'] == frames['a_Idle_2']
+    assert offsets == dict(a_Idle_1=[0, 1, 3, 3])
+    assert 'test.png' in scaled.keys()
+    img = Image.open(tmp_path.joinpath('test@0.25x.png'))
+    for name, color in (('a_Idle_0', red), ('a_Idle_1', blue)):
+        x, y, w, h = frames[name]
+        top = img.height - y - h
+        # Every pixel is the frame's own color, none bled in from its
+        # neighbour:
+        assert img.crop((x, top, x + w, top + h)).getcolors() == [
+            (w * h, color)]
+        # And the frame is padded from every other frame:
+        border = img.crop((x - 1, top - 1, x + w + 1, top + h + 1))
+        assert dict((c, n) for n, c in border.getcolors()) == {
+            (0, 0, 0, 0): 4 * 4 - w * h, color: w * h}
+
+
+def test_optimize_png(tmp_path):
+    p = tmp_path.joinpath('test.png')
+    img = Image.new('RGBA', (32, 32), (0, 0, 0, 0))
+    img.paste((255, 0, 0, 128), (4, 4, 12, 12))
+    img.paste((0, 0, 255, 255), (16, 16, 28, 28))
+    img.save(p, compress_level=0)
+    stats = sheets.optimize_png(p)
+    assert stats['bytes_after'] < stats['bytes_before']
+    optimized = Image.open(p)
+    assert optimized.mode == 'P'
+    assert optimized.convert('RGBA').tobytes() == img.tobytes()
+
+    # Too many colors for a palette, but still recompressed:
+    img.putdata([(i % 256, i // 256, 0, 255) for i in range(32 * 32)])
+    img.save(p, compress_level=0)
+    stats = sheets.optimize_png(p)
+    assert stats['bytes_after'] < stats['bytes_before']
+    assert Image.open(p).mode == 'RGBA'
+    assert Image.open(p).tobytes() == img.tobytes()
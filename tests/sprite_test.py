@@ -1,8 +1,12 @@
+import json
+import shutil
 from random import seed
 
 import pytest
+from kivy.atlas import Atlas
 
 import kivyhelper.widgets as wd
+from kivyhelper import atlas_index, constants, raw_texture
 
 
 class TestSprite:
@@ -38,6 +42,83 @@ class TestSprite:
     def test_get_total_anim_time(self, testing_sprite):
         assert testing_sprite.get_total_anim_time() == 1.5
 
+    def test_collect_offsets(self, testing_sprite):
+        assert testing_sprite.collect_offsets() == dict()
+
+    def test_update_trim_rect(self, testing_sprite):
+        testing_sprite.pos = (0, 0)
+        testing_sprite.size = (72, 72)
+        testing_sprite.allow_stretch = True
+        testing_sprite.start()
+        testing_sprite.update(1.0)
+        assert testing_sprite.trim_rect == [0, 0, 72, 72]
+        testing_sprite._offsets = dict(white_Start_0=[4, 6, 36, 36])
+        testing_sprite._update_trim_rect()
+        assert testing_sprite.trim_rect == [8, 12, 72, 72]
+        testing_sprite.allow_stretch = False
+        assert testing_sprite.trim_rect == [22, 24, 36, 36]
+        # A 0.5x variant is drawn at full resolution size:
+        testing_sprite._scale = 0.5
+        testing_sprite._update_trim_rect()
+        assert testing_sprite.trim_rect == [8, 12, 72, 72]
+        testing_sprite._scale = 1.0
+
+
+class TestRawAtlas:
+    def test_load(self, sample_dirs, tmp_path):
+        for f in ('sprites_snowflake.atlas', 'sprites_snowflake.png'):
+            shutil.copy(sample_dirs.assets.joinpath(f), tmp_path)
+        atlas_p = str(tmp_path.joinpath('sprites_snowflake.atlas'))
+        expected = Atlas(atlas_p)
+        # Falls back to the png without a raw texture:
+        assert wd.RawAtlas(atlas_p).textures.keys() == (
+            expected.textures.keys())
+        raw_texture.write_raw_texture(
+            tmp_path.joinpath('sprites_snowflake.png'))
+        raw = wd.RawAtlas(atlas_p)
+        assert raw.textures.keys() == expected.textures.keys()
+        assert raw.original_textures[0].pixels == (
+            expected.original_textures[0].pixels)
+        assert raw['white_Idle_1'].uvpos == expected['white_Idle_1'].uvpos
+
+    def test_load_index(self, sample_dirs, tmp_path):
+        for f in ('sprites_snowflake.atlas', 'sprites_snowflake.png'):
+            shutil.copy(sample_dirs.assets.joinpath(f), tmp_path)
+        atlas_p = str(tmp_path.joinpath('sprites_snowflake.atlas'))
+        with open(atlas_p) as r:
+            atlas = json.load(r)
+        # A frame without a trailing number isn't in any tag:
+        atlas['sprites_snowflake.png']['logo'] = [0, 0, 4, 4]
+        with open(atlas_p, 'w') as w:
+            w.write(json.dumps(atlas))
+        expected = Atlas(atlas_p)
+        atlas_index.write_atlas_index(
+            tmp_path.joinpath('sprites_snowflake' + constants.ATLAS_INDEX_EXT),
+            atlas)
+        assert wd.RawAtlas.read_regions(atlas_p) == atlas
+        raw = wd.RawAtlas(atlas_p)
+        assert raw.textures.keys() == expected.textures.keys()
+        assert raw['logo'].size == expected['logo'].size
+        assert raw['white_Idle_1'].uvpos == expected['white_Idle_1'].uvpos
+        assert raw['white_Idle_1'].size == expected['white_Idle_1'].size
+
+    def test_reload_page(self, sample_dirs, tmp_path):
+        png_p = tmp_path.joinpath('sprites_snowflake.png')
+        shutil.copy(sample_dirs.assets.joinpath(png_p.name), png_p)
+        raw_texture.write_raw_texture(png_p)
+        texture = wd.RawAtlas.load_page(str(png_p))
+        pixels = texture.pixels
+        blank = bytes(len(pixels))
+        # As if the GL context had been lost:
+        texture.blit_buffer(blank, colorfmt='rgba', bufferfmt='ubyte')
+        wd.RawAtlas.reload_page(str(png_p), texture)
+        assert texture.pixels == pixels
+        # Falls back to the png without a raw texture:
+        raw_texture.raw_path(png_p).unlink()
+        texture.blit_buffer(blank, colorfmt='rgba', bufferfmt='ubyte')
+        wd.RawAtlas.reload_page(str(png_p), texture)
+        assert texture.pixels == pixels
+
 
 class TestAnimRule:
     def test_basics(self, testing_sprite):
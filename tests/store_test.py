@@ -0,0 +1,54 @@
+import os
+
+from kivyhelper.scripts.build_assets.store import ArtifactStore
+
+
+class TestArtifactStore:
+    def test_publish_fetch(self, tmp_path):
+        src = tmp_path.joinpath('src')
+        dst = tmp_path.joinpath('dst')
+        src.mkdir()
+        dst.mkdir()
+        src.joinpath('a.png').write_bytes(b'png')
+        store = ArtifactStore(tmp_path.joinpath('store'))
+        key = ArtifactStore.key('a', 'abc')
+        assert key != ArtifactStore.key('b', 'abc')
+        assert store.fetch(key, dst) is None
+        atlas = {'a.png': {'a_Idle_0': [0, 0, 8, 8]}}
+        assert store.publish(key, src, ['a.png'], atlas, dict())
+        # Entries are never overwritten:
+        assert not store.publish(key, src, ['a.png'], dict(), dict())
+        entry = store.fetch(key, dst)
+        assert entry == dict(pages=['a.png'], atlas=atlas, offsets=dict())
+        assert dst.joinpath('a.png').read_bytes() == b'png'
+
+    def test_evict(self, tmp_path):
+        src = tmp_path.joinpath('src')
+        src.mkdir()
+        store = ArtifactStore(tmp_path.joinpath('store'), budget=2500)
+        keys = [ArtifactStore.key(g, 'abc') for g in 'abc']
+        for i, key in enumerate(keys):
+            src.joinpath('x.png').write_bytes(bytes(1000))
+            store.publish(key, src, ['x.png'], dict(), dict())
+            os.utime(store.entry_dir(key), ns=(i * 10 ** 9, i * 10 ** 9))
+        # Fetching the oldest entry makes it the most recently used:
+        store.fetch(keys[0], src)
+        assert store.evict() > 0
+        assert store.entry_dir(keys[0]).exists()
+        assert not store.entry_dir(keys[1]).exists()
+        assert store.entry_dir(keys[2]).exists()
+        assert sum(size for _, size, _ in store.entries()) <= 2500
+
+    def test_unreachable(self, tmp_path):
+        src = tmp_path.joinpath('src')
+        src.mkdir()
+        src.joinpath('a.png').write_bytes(b'png')
+        # A file where the store should be can't be written to, like a
+        # read-only or stale mount:
+        tmp_path.joinpath('store').write_bytes(b'')
+        store = ArtifactStore(tmp_path.joinpath('store', 'artifacts'))
+        key = ArtifactStore.key('a', 'abc')
+        assert not store.publish(key, src, ['a.png'], dict(), dict())
+        assert store.fetch(key, src) is None
+        assert store.entries() == []
+        assert store.evict() == 0